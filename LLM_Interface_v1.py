@@ -4,25 +4,34 @@ import os
 import tkinter as window
 from dotenv import load_dotenv
 import datetime
-from tkinter import filedialog, messagebox, scrolledtext
+import time
+from tkinter import filedialog, messagebox, scrolledtext, ttk
 import json
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import threading
+import queue
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from docx import Document
 import re
+import logging
+from Protokollierung import setup_logging, payload_summary
 
 #Anforderungen um das Skript inklusive Abhängigkeiten zu starten sind der requirements.txt Datei zu entnehmen.
 #Für den Betrieb des Vektordatenservers ist die Installation von der "Visualstudio cpp build tools app" nötig
 #Für Visualstudio Programm Installation siehe https://visualstudio.microsoft.com/visual-cpp-build-tools/
 
-#Dokumentiert die Antworten der Vektordatenbank, LLM-Server, LLM Anfragen in der Konsole und in Text Datei.
-Debug = True
+#Dokumentiert die Antworten der Vektordatenbank, LLM-Server, LLM Anfragen in der Konsole und in der Logdatei.
+#Level, Rotation und vollständige Inhalte (LOG_FULL_PAYLOADS) werden in der .env festgelegt, siehe Protokollierung.py.
+logger = logging.getLogger("LLM_Interface")
 
 System_Role = "Du bist ein hilfreicher Assistent. Antworte ausschließlich auf die letzte neuste Anfrage des 'user'. Antworte immer ohne Formatierung des Textes."
 #Old SystemRole "Du bist ein hilfreicher Assistent. Antworte ausschließlich auf user Aufgabe. Der Background-Context und Previous-User-Input stellen zusätzliche Informationen zu Verfügung."} #You are a helpful assistant.
 
 #Lädt Konfiguration inklusive Parametern und API-Schlüssel.
 load_dotenv()
+LOG_PATH = os.getenv("GUI_LOG_PATH", "LLM_Interface.log")
 
 
 #Lokale LLM Modelle
@@ -35,6 +44,22 @@ LOCAL_LLM_MODELS = LOCAL_LLM_MODELS.split(",")
 VECTORDATABASE_URL = os.getenv("VECTORDB_URL", "http://127.0.0.1:8000") #URL
 VECTORDATABASE_UPLOAD = f"{VECTORDATABASE_URL}/upload"              #URL Adresse für das Hochladen von Anhängen.
 VECTORDATABASE_REQUEST = f"{VECTORDATABASE_URL}/ask"                #URL Adresse für Anfragen
+VECTORDATABASE_BATCH_REQUEST = f"{VECTORDATABASE_URL}/ask_batch"    #URL Adresse für mehrere Anfragen in einem Aufruf
+VECTORDATABASE_JOBS = f"{VECTORDATABASE_URL}/jobs"                  #URL Adresse für den Verarbeitungsstatus hochgeladener Dateien
+VECTORDATABASE_DOCUMENTS = f"{VECTORDATABASE_URL}/documents"       #URL Adresse der Liste gespeicherter Dokumente (für Suchfilter)
+VECTORDATABASE_COLLECTIONS = f"{VECTORDATABASE_URL}/collections"    #URL Adresse der Sammlungen (Namespaces) des Vektorservers
+#Sammlung für Uploads und Anfragen beim Start der GUI (kann in der GUI geändert werden)
+VECTORDB_COLLECTION = os.getenv("VECTORDB_COLLECTION", "default")
+UPLOAD_POLL_INTERVAL = float(os.getenv("UPLOAD_POLL_INTERVAL", "1")) #Abfrageintervall des Verarbeitungsstatus in Sekunden
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", "4"))      #Gleichzeitige Uploads beim Hochladen mehrerer Dateien
+UPLOAD_RETRIES = int(os.getenv("UPLOAD_RETRIES", "5"))              #Wiederholungen bei 429, 5xx und Verbindungsfehlern
+#Bereits erfolgreich hochgeladene Dateien (Pfad, Größe, Änderungszeit). Ein abgebrochener Massenupload überspringt diese beim erneuten Start.
+UPLOAD_MANIFEST_PATH = os.path.join("Vektordatenbank", "Uploadprotokoll.jsonl")
+SUPPORTED_UPLOAD_TYPES = (".pdf", ".docx", ".txt")
+#Kontext aus der Vektordatenbank: Der Server betrachtet RAG_CANDIDATES Treffer und liefert die besten, bis RAG_CONTEXT_TOKENS erreicht sind.
+#RAG_CONTEXT_TOKENS=0 liefert wie bisher eine feste Anzahl (RAG_CANDIDATES) Treffer ohne Budget.
+RAG_CONTEXT_TOKENS = int(os.getenv("RAG_CONTEXT_TOKENS", "1500"))
+RAG_CANDIDATES = int(os.getenv("RAG_CANDIDATES", "20"))
 
 #Parameter und Default Parameter, falls nicht in der .env festgelegt.
 #Bei erstmaliger Ausführung wird eine .env Datei erstellt. Dort können die Parameter festgelegt werden.
@@ -44,20 +69,239 @@ LLM_SERVER_URL = f"http://{LOCAL_IP}:{PORT}/api/chat"
 
 #OpenAI Parameter - Modelle und API Schlüssel aus .env entnehmen.
 OPENAI_API_KEY = os.getenv('OPENAI_KEY', '').strip(" ")
+#Chat Completions Endpunkt - kann auf OpenAI kompatible Anbieter (z.B. Openrouter) oder einen lokalen Testserver zeigen.
+OPENAI_API_URL = os.getenv("OPENAI_API_URL", "https://api.openai.com/v1/chat/completions")
 #Modelle (ohne API Abfrage der aktuell verfügbaren Modelle):
 OPENAI_MODELS = os.getenv('OPENAI_MODELS', 'gpt-4o-mini,gpt-4o,gpt-4,gpt-4-turbo,o1-mini,o1,o1-pro')
 OPENAI_MODELS = OPENAI_MODELS.split(",")
 
+#Token Budget je Modell für Verlauf, Kontext und Frage. Format CONTEXT_BUDGETS: "modell=tokens,modell=tokens".
+#Ohne Eintrag gilt CONTEXT_BUDGET. RESPONSE_TOKEN_RESERVE wird für die Antwort freigehalten.
+CONTEXT_BUDGET = int(os.getenv("CONTEXT_BUDGET", "8192"))
+CONTEXT_BUDGETS = {}
+for budget_entry in os.getenv("CONTEXT_BUDGETS", "").split(","):
+    if "=" in budget_entry:
+        budget_model, _, budget_tokens = budget_entry.rpartition("=")
+        CONTEXT_BUDGETS[budget_model.strip()] = int(budget_tokens)
+RESPONSE_TOKEN_RESERVE = int(os.getenv("RESPONSE_TOKEN_RESERVE", "1024"))
+#Umgang mit älteren Gesprächsrunden, die nicht mehr in das Budget passen:
+#summary = als kurze Zusammenfassung (gekürzte Frage/Antwort je Runde) mitsenden, relevance = die zur Frage passendsten Runden mitsenden, drop = weglassen
+HISTORY_COMPACTION = os.getenv("HISTORY_COMPACTION", "summary").lower()
+
+#Messwerte jeder Modellanfrage (Vektorsuche, erstes Token, Gesamtdauer, Tokens/s) als eine JSON Zeile je Anfrage.
+REQUEST_METRICS_PATH = os.getenv("REQUEST_METRICS_PATH", "Anfragemetriken.jsonl")
+
+#Konversationsjournal: eine JSON Zeile je Anfrage (Frage, Antworten, Modelle, Messwerte). Es wird nur angehängt,
+#Word/Markdown Dateien entstehen erst beim Export. JOURNAL_FSYNC_INTERVAL: Sekunden zwischen zwei Sicherungen auf die Festplatte.
+CONVERSATION_JOURNAL_PATH = os.getenv("CONVERSATION_JOURNAL_PATH", "Konversationsverlauf_LLM.jsonl")
+JOURNAL_FSYNC_INTERVAL = float(os.getenv("JOURNAL_FSYNC_INTERVAL", "1"))
+CONVERSATION_EXPORT_PATH = "Konversationsverlauf_LLM"   #Standardname der Exportdatei ohne Endung (.docx/.md)
+
+#Intervall in Millisekunden, in dem gestreamte Textteile gesammelt in die Ausgabefelder geschrieben werden.
+#Kleinere Werte wirken flüssiger, erhöhen aber die Anzahl der Neuzeichnungen des Textfeldes.
+STREAM_REFRESH_MS = int(os.getenv("STREAM_REFRESH_MS", "50"))
+
+#HTTP Client Parameter - Zeitlimits in Sekunden. Das Lese-Zeitlimit gilt zwischen zwei empfangenen Datenpaketen,
+#bei gestreamten Antworten also nicht für die gesamte Antwortdauer.
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "300"))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "3"))            #Anzahl Wiederholungen bei Verbindungsfehlern
+HTTP_RETRY_BACKOFF = float(os.getenv("HTTP_RETRY_BACKOFF", "0.5"))  #Wartezeit 0.5s, 1s, 2s, ... zwischen den Versuchen
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "10"))       #Offene Verbindungen je Host
+
+#########
+#HTTP Client
+#Alle ausgehenden Anfragen (LLM-Server, OpenAI, Vektordatenbank) laufen über eine gemeinsame Session.
+#Dadurch bleiben Verbindungen offen (Keep-Alive) und TCP/TLS Verbindungsaufbau entfällt bei Folgeanfragen.
+
+def create_http_session():
+    #Wiederholungen: Verbindungsfehler werden immer wiederholt, da die Anfrage den Server nicht erreicht hat.
+    #Lesefehler und Statuscodes nur bei idempotenten Methoden, damit z.B. ein Upload nicht doppelt ausgeführt wird.
+    retry = Retry(
+        total=HTTP_RETRIES,
+        connect=HTTP_RETRIES,
+        read=HTTP_RETRIES,
+        status=HTTP_RETRIES,
+        backoff_factor=HTTP_RETRY_BACKOFF,
+        status_forcelist=(429, 502, 503, 504),
+        allowed_methods=frozenset(["GET", "HEAD", "OPTIONS"]),
+        respect_retry_after_header=True,
+        raise_on_status=False)
+    #Ein Verbindungspool je Host mit bis zu HTTP_POOL_SIZE parallelen Verbindungen.
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+http_session = create_http_session()
+
+#Anfrage über die gemeinsame Session. Ohne Angabe wird das konfigurierte (Verbindungs-, Lese-) Zeitlimit verwendet.
+def http_request(method, url, timeout=None, **kwargs):
+    if timeout is None:
+        timeout = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+    return http_session.request(method, url, timeout=timeout, **kwargs)
+
+def http_get(url, **kwargs):
+    return http_request("GET", url, **kwargs)
+
+def http_post(url, **kwargs):
+    return http_request("POST", url, **kwargs)
+
+#########
+
+#Messwerte einer Modellanfrage. first_token_time: Zeitpunkt des ersten empfangenen Textteils.
+#generation_seconds: Dauer der Generierung laut Server (Ollama eval_duration), sonst Zeit ab dem ersten Token.
+def build_response_metrics(request_start, first_token_time, prompt_tokens=None, completion_tokens=None, generation_seconds=None):
+    total_seconds = time.time() - request_start
+    if generation_seconds is None and first_token_time is not None:
+        generation_seconds = time.time() - first_token_time
+    tokens_per_second = None
+    if completion_tokens and generation_seconds:
+        tokens_per_second = round(completion_tokens / generation_seconds, 1)
+    return {
+        "time_to_first_token": round(first_token_time - request_start, 3) if first_token_time is not None else None,
+        "total_seconds": round(total_seconds, 3),
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "tokens_per_second": tokens_per_second,
+    }
+
+#Kurzfassung der Messwerte für die Anzeige unter dem Ausgabefeld.
+def format_response_metrics(metrics):
+    parts = []
+    if metrics.get("vector_lookup_seconds") is not None:
+        parts.append(f"Vektorsuche {metrics['vector_lookup_seconds']:.2f} s")
+    if metrics.get("time_to_first_token") is not None:
+        parts.append(f"erstes Token {metrics['time_to_first_token']:.2f} s")
+    if metrics.get("total_seconds") is not None:
+        parts.append(f"gesamt {metrics['total_seconds']:.2f} s")
+    if metrics.get("completion_tokens") is not None:
+        parts.append(f"{metrics.get('prompt_tokens')} + {metrics['completion_tokens']} Tokens")
+    if metrics.get("tokens_per_second") is not None:
+        parts.append(f"{metrics['tokens_per_second']} Tokens/s")
+    return " | ".join(parts)
+
+request_metrics_lock = threading.Lock()
+
+#Hängt die Messwerte einer Modellanfrage an die JSONL Datei an (parallel laufende Anfragen über eine Sperre).
+def log_request_metrics(record):
+    with request_metrics_lock:
+        with open(REQUEST_METRICS_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+#########
+#Konversationsjournal
+#Jede Zeile wird sofort geschrieben und an das Betriebssystem übergeben (flush). Das teure fsync erfolgt gesammelt
+#im Hintergrund höchstens alle JOURNAL_FSYNC_INTERVAL Sekunden. Bei einem Absturz geht damit höchstens dieses Intervall
+#verloren, eine unvollständige letzte Zeile wird beim Lesen übersprungen.
+
+class ConversationJournal:
+    def __init__(self, path, fsync_interval=JOURNAL_FSYNC_INTERVAL):
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self.lock = threading.Lock()
+        self.file = None
+        self.dirty = False
+        self.closed = threading.Event()
+        self.sync_thread = None
+
+    def append(self, entry):
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self.lock:
+            if self.file is None:
+                self.file = open(self.path, "a", encoding="utf-8")
+                #Falls die letzte Zeile bei einem Absturz unvollständig blieb, beginnt der neue Eintrag in einer eigenen Zeile.
+                if self.file.tell() > 0:
+                    with open(self.path, "rb") as f:
+                        f.seek(-1, os.SEEK_END)
+                        if f.read(1) != b"\n":
+                            self.file.write("\n")
+            self.file.write(line)
+            self.file.flush()
+            self.dirty = True
+            if self.fsync_interval <= 0:
+                self.sync_locked()
+            elif self.sync_thread is None:
+                self.sync_thread = threading.Thread(target=self.sync_loop, daemon=True)
+                self.sync_thread.start()
+
+    def sync_locked(self):
+        if self.file is not None and self.dirty:
+            os.fsync(self.file.fileno())
+            self.dirty = False
+
+    def sync_loop(self):
+        while not self.closed.wait(self.fsync_interval):
+            with self.lock:
+                try:
+                    self.sync_locked()
+                except OSError as e:
+                    logger.error("Konversationsjournal konnte nicht gesichert werden: %s", e)
+
+    def close(self):
+        self.closed.set()
+        with self.lock:
+            if self.file is not None:
+                self.sync_locked()
+                self.file.close()
+                self.file = None
+
+    #Einträge lesen, optional gefiltert nach Datum (datetime.date, einschließlich) und Modell.
+    #Beim Modellfilter enthalten die Einträge nur die Antworten dieses Modells.
+    def read(self, date_from=None, date_to=None, model=None):
+        entries = []
+        if not os.path.exists(self.path):
+            return entries
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue #Unvollständige Zeile nach einem Absturz
+                day = datetime.datetime.strptime(entry["time"][:10], "%Y-%m-%d").date()
+                if (date_from and day < date_from) or (date_to and day > date_to):
+                    continue
+                if model:
+                    responses = [r for r in entry["responses"] if r["model"] == model]
+                    if not responses:
+                        continue
+                    entry = dict(entry, responses=responses)
+                entries.append(entry)
+        return entries
+
+conversation_journal = ConversationJournal(CONVERSATION_JOURNAL_PATH)
+
+#Export des Journals als Word Datei - gleiche Gliederung wie die bisherige automatische Speicherung.
+def export_conversations_docx(entries, path):
+    document = Document()
+    document.add_heading('Konversationsverlauf LLM', 0)
+    for entry in entries:
+        document.add_paragraph(f"Datum und Zeit: {entry['time']}")
+        document.add_paragraph(f"Gewählte Modelle: {', '.join(r['model'] for r in entry['responses'])}")
+        document.add_paragraph(f"Eingabe:\n{entry['input']}")
+        for r in entry["responses"]:
+            document.add_paragraph(f"Antwort {r['model']}:\n{r['response'] or r.get('error') or ''}")
+        document.add_page_break()
+    document.save(path)
+
+def export_conversations_markdown(entries, path):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("# Konversationsverlauf LLM\n")
+        for entry in entries:
+            f.write(f"\n## {entry['time']}\n\n**Eingabe:**\n\n{entry['input']}\n")
+            for r in entry["responses"]:
+                metrics_text = format_response_metrics(r.get("metrics") or {})
+                f.write(f"\n### {r['model']}\n\n{r['response'] or r.get('error') or ''}\n")
+                if metrics_text:
+                    f.write(f"\n_{metrics_text}_\n")
+
 #########
 
-#Protokolliert die Vektordatenbank Ergebnisse, falls "Debug" als wahr gesetzt wurde.
+#Protokolliert die Vektordatenbank Ergebnisse bei LOG_LEVEL=DEBUG (Zusammenfassung oder mit LOG_FULL_PAYLOADS vollständig).
 def log_vector_response(vectorserver_response):
-    os.makedirs("Vektordatenbank", exist_ok=True)
-    log_path = os.path.join("Vektordatenbank", "AnfragenLog.txt")
-    formatted_current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    with open(log_path, "a", encoding="utf-8") as f:
-        f.write(f"\n\n#### {formatted_current_time} ####\n") #Fomartierung - Unterscheidung zwischen den Ergebnissen.
-        f.write(json.dumps(vectorserver_response)) #Json Antwort in txt dokumentieren.  #, ensure_ascii=False, indent=2
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Antwort der Vektordatenbank: %s", payload_summary(vectorserver_response))
 
 ########
 #Funktionen zur Kommunikation mit LLM und Vektordatenbank
@@ -65,17 +309,46 @@ def log_vector_response(vectorserver_response):
 #Anfrage Funktion.
 #Zweiter Parameter gibt die Search kwargs an - Ebenfalls für ein besseres Verständnis über den Parameter als "max_results" gesetzt.
 #Siehe Flask Server Code für mehr Kontext.
-def request_vector_context(question, max_results=5):
+#token_budget: optionale maximale Größe des Kontexts in Tokens, max_results ist dann die Anzahl der betrachteten Kandidaten.
+#sources: optionale Liste von Dateinamen - die Suche wird auf diese Dokumente beschränkt.
+#collection: Sammlung des Vektorservers, in der gesucht wird.
+def request_vector_context(question, max_results=5, token_budget=None, sources=None, collection=VECTORDB_COLLECTION):
     try:
         #Anfragenformatierung und Konfiguration über die gewünschte Menge von Ergebnissen.
-        payload = {"question": question, "max_results": max_results }
-        response = requests.post(f"{VECTORDATABASE_URL}/ask", json=payload) #URL und Inhalt anpassen: aktuelle Konfiguration is mit VektordatenbankServer.py zu nutzen.
+        payload = {"question": question, "max_results": max_results, "collection": collection}
+        if token_budget:
+            payload["token_budget"] = token_budget
+        if sources:
+            payload["filter"] = {"sources": list(sources)}
+        response = http_post(VECTORDATABASE_REQUEST, json=payload) #URL und Inhalt anpassen: aktuelle Konfiguration is mit VektordatenbankServer.py zu nutzen.
         response.raise_for_status()
         vector_response = response.json()
         return vector_response
     except requests.exceptions.RequestException as e:
         return {"error": f"Fehler bei der Kommunikation mit der Vektordatenbank: {str(e)}"}
 
+#Mehrere Anfragen in einem Aufruf, z.B. für Auswertungen oder vorausschauendes Laden von Kontext.
+#questions: Liste aus Fragen (Text) oder (Frage, max_results) Tupeln. Die Ergebnisse haben die Reihenfolge der Fragen.
+#token_budget, search_filter ({"sources", "tags", "uploaded_from", "uploaded_to"}) und collection gelten für alle Fragen.
+def request_vector_context_batch(questions, max_results=5, token_budget=None, search_filter=None, collection=VECTORDB_COLLECTION):
+    try:
+        queries = []
+        for question in questions:
+            if isinstance(question, (tuple, list)):
+                query = {"question": question[0], "max_results": question[1], "collection": collection}
+            else:
+                query = {"question": question, "max_results": max_results, "collection": collection}
+            if token_budget:
+                query["token_budget"] = token_budget
+            if search_filter:
+                query["filter"] = search_filter
+            queries.append(query)
+        response = http_post(VECTORDATABASE_BATCH_REQUEST, json={"queries": queries})
+        response.raise_for_status()
+        return response.json()
+    except requests.exceptions.RequestException as e:
+        return {"error": f"Fehler bei der Kommunikation mit der Vektordatenbank: {str(e)}"}
+
 #Vorbereitung des Antwort-Ergebnistextes - Prüfung auf doppelte Ergebnisse
 def prepare_context(documents):
     unique_contents = set()
@@ -94,10 +367,57 @@ def clean_local_llm_response(response): #Reasoning bei Modellen wie Deepseek-R1
     cleaned_response = re.sub(r"<think>.*?</think>", "", response, flags=re.DOTALL)
     return cleaned_response.strip()
 
+class ThinkFilter:
+    """Entfernt <think>...</think> Blöcke aus einer gestreamten Antwort, während diese eintrifft.
+    Die Tags können über mehrere Chunks verteilt ankommen, daher wird ein möglicher Tag-Anfang am Ende zurückgehalten."""
+    OPEN_TAG = "<think>"
+    CLOSE_TAG = "</think>"
+
+    def __init__(self):
+        self.buffer = ""
+        self.in_think = False
+        self.started = False #Führende Leerzeilen (z.B. nach </think>) werden wie bei clean_local_llm_response entfernt.
+
+    def feed(self, text):
+        self.buffer += text
+        visible = []
+        while True:
+            tag = self.CLOSE_TAG if self.in_think else self.OPEN_TAG
+            pos = self.buffer.find(tag)
+            if pos == -1:
+                #Länge eines unvollständigen Tags am Ende des Puffers bestimmen.
+                keep = 0
+                for i in range(len(tag) - 1, 0, -1):
+                    if self.buffer.endswith(tag[:i]):
+                        keep = i
+                        break
+                if not self.in_think:
+                    visible.append(self.buffer[:len(self.buffer) - keep])
+                self.buffer = self.buffer[len(self.buffer) - keep:]
+                break
+            if not self.in_think:
+                visible.append(self.buffer[:pos])
+            self.buffer = self.buffer[pos + len(tag):]
+            self.in_think = not self.in_think
+        return self._strip_leading("".join(visible))
+
+    def flush(self):
+        #Rest des Puffers ausgeben - ein nicht geschlossener <think> Block wird verworfen.
+        rest = "" if self.in_think else self.buffer
+        self.buffer = ""
+        return self._strip_leading(rest)
+
+    def _strip_leading(self, text):
+        if not self.started:
+            text = text.lstrip()
+            self.started = text != ""
+        return text
+
 #Funktion zum Adressieren einer lokalen/selbstgehosteten Ollama Instanz
 #Paramter Nutzung ergibt sich aus deren Bezeichnung:
 #Conversation_history: Gesprächsverslauf mit Modell; Question: Aufgabe/Fragestellung an LLM, model: LLM Name, Vector: Anfragenbezogener Kontext für RAG Implementation, leer falls nicht vorhanden
-def ask_llm_server(conversation_history, question, model, vector_context_result=""):
+#on_chunk: optionale Funktion, die jeden sichtbaren Textteil der gestreamten Antwort erhält (ohne <think> Blöcke).
+def ask_llm_server(conversation_history, question, model, vector_context_result="", on_chunk=None):
     #Unterschiedliche JSON payload, falls keine Kontext Information vorhanden, dann wird der Teil der Anfrage nicht inkludiert.
     if vector_context_result != "":
         background_context = {"role": "Context", "content": f"Relevanter Kontext:\n{vector_context_result}"}
@@ -107,36 +427,57 @@ def ask_llm_server(conversation_history, question, model, vector_context_result=
         payload = {"model": model,
             "messages": conversation_history + [{"role": "user", "content": question}]}
     try:
-        #Fix: Ohne Ensure ascii sind die Umlaute unlesbar
-        if Debug:
-            print("JSON Anfrage an den lokalen LLM-Server:\n\n" + json.dumps(payload, ensure_ascii=False, indent=2) + "\n\n")
-        response = requests.post(LLM_SERVER_URL, json=payload, stream=True)
-        """Streaming ist zwar nicht auf der GUI unterstützt, hilft dennoch da beim Schließen der GUI bei 
-        existierender Anfrage an den LLM Server auch die Verarbeitung der abgebrochen wird. Streaming wäre wünschenswert, 
-        um Fortschritt langsamer LLM Ausgaben beobachten zu können. Modelle wie Deepseek und o3-mini haben eine erhöhte Verarbeitungszeit."""
-
+        #Die Zusammenfassung wird nur berechnet, wenn DEBUG aktiv ist.
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("JSON Anfrage an den lokalen LLM-Server: %s", payload_summary(payload))
+        request_start = time.time()
+        first_token_time = None
+        final_chunk = {}
+        response = http_post(LLM_SERVER_URL, json=payload, stream=True)
+        """Die Antwort wird gestreamt und jeder Textteil direkt über on_chunk an die GUI weitergegeben.
+        Reasoning Blöcke werden dabei bereits während des Streamings gefiltert. Beim Schließen der GUI
+        wird außerdem die Verarbeitung einer laufenden Anfrage auf dem LLM Server abgebrochen."""
+
+        think_filter = ThinkFilter()
         complete_message = ""
         #JSON parsen
         for line in response.iter_lines():
             if line: #Leere Zeilen filtern.
                 chunk = json.loads(line)
-                complete_message += chunk.get("message", {}).get("content", "")
+                content = chunk.get("message", {}).get("content", "")
+                if content and first_token_time is None:
+                    first_token_time = time.time()
+                #Der letzte Teil ("done": true) enthält die Tokenanzahl und Dauer der Generierung in Nanosekunden.
+                if chunk.get("done"):
+                    final_chunk = chunk
+                complete_message += content
+                visible_text = think_filter.feed(content)
+                if on_chunk and visible_text:
+                    on_chunk(visible_text)
+        visible_text = think_filter.flush()
+        if on_chunk and visible_text:
+            on_chunk(visible_text)
         complete_message = clean_local_llm_response(complete_message) #clean_local_llm_resonse: Reasoning wird an dieser Stelle entfernt (z.B. wie bei deepseek-r1:1.5b Modellen)
-        return {"response": complete_message}
+        metrics = build_response_metrics(request_start, first_token_time,
+                                         prompt_tokens=final_chunk.get("prompt_eval_count"),
+                                         completion_tokens=final_chunk.get("eval_count"),
+                                         generation_seconds=final_chunk["eval_duration"] / 1e9 if final_chunk.get("eval_duration") else None)
+        return {"response": complete_message, "metrics": metrics}
     #Fehlermeldung bei Verbindungsverlust, zu großer Anfrage etc.
     except requests.exceptions.RequestException as e:
         return {"error": f"Fehler bei der Kommunikation mit dem LLM-Server: {e}"}
 
 #In zukünftiger Version Parametrisieren, um es für weitere Plattformen nutzen zu können oder duplizieren und an eine Plattform anpassen.
-def ask_openai_server(conversation_history, documents, question, model="gpt-4o-mini"):
+def ask_openai_server(conversation_history, documents, question, model="gpt-4o-mini", on_chunk=None):
     """Funktion zur Kommunikation mit OPENAI servern (ChatGPT) - Mit geänderter URL kann man damit alle OpenAI ähnlichen API Interfaces,
-    wie zum Beispiel Openrouter verwenden, welches eine Vielzahl von LLMs betreibt."""
+    wie zum Beispiel Openrouter verwenden, welches eine Vielzahl von LLMs betreibt.
+    Die Antwort wird als Server-Sent-Events gestreamt, on_chunk erhält jeden Textteil sobald er eintrifft."""
     #API Key vorhanden?
     if not OPENAI_API_KEY:
         return {"error": "Kein gültiger OpenAI API Schlüssel gefunden. Bitte OPENAI_KEY in der .env angeben."}
     #Bei Fehlermeldungen des Vektorservers wird keine Anfrage an OpenAI gestellt. Optional entfernen.
     if "error" in documents:
-        print("Error in der Antwort des Vektorservers gefunden.")
+        logger.warning("Error in der Antwort des Vektorservers gefunden.")
         return documents
 
     #Kontext des Vektorservers
@@ -159,42 +500,289 @@ def ask_openai_server(conversation_history, documents, question, model="gpt-4o-m
         "Authorization": f"Bearer {OPENAI_API_KEY}"
     }
 
-    data = {"model": model, "messages": messages } #Modellauswahl und Anfrageninhalt zusammenfassen.
+    #Modellauswahl und Anfrageninhalt zusammenfassen. include_usage: der letzte Teil des Streams enthält die Tokenanzahl.
+    data = {"model": model, "messages": messages, "stream": True, "stream_options": {"include_usage": True}}
 
-    if Debug:
-        print("JSON Anfrage an den OpenAI Server:\n\n" + json.dumps(data, ensure_ascii=False, indent=2) + "\n\n")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("JSON Anfrage an den OpenAI Server: %s", payload_summary(data))
 
     try:
-        response = requests.post(
-            "https://api.openai.com/v1/chat/completions",
+        request_start = time.time()
+        first_token_time = None
+        usage = {}
+        response = http_post(
+            OPENAI_API_URL,
             headers=headers,
             json=data,
-            timeout=200
+            stream=True
         )
         response.raise_for_status() #Fehler in der Antwort erkennen.
-        result = response.json()
-        if Debug:
-            print("JSON Antwort des OpenAI Servers:\n\n" + json.dumps(result, ensure_ascii=False, indent=2) + "\n\n")
 
-        return {"response": result["choices"][0]["message"]["content"]} #Ergebnis zurückgeben.
+        complete_message = ""
+        #Jede Zeile hat das Format "data: {json}", das Ende wird mit "data: [DONE]" markiert.
+        for line in response.iter_lines():
+            if not line:
+                continue
+            line = line.decode("utf-8")
+            if not line.startswith("data:"):
+                continue
+            event_data = line[len("data:"):].strip()
+            if event_data == "[DONE]":
+                break
+            chunk = json.loads(event_data)
+            if chunk.get("usage"):
+                usage = chunk["usage"]
+            choices = chunk.get("choices") or []
+            if choices:
+                content = choices[0].get("delta", {}).get("content") or ""
+                if content and first_token_time is None:
+                    first_token_time = time.time()
+                complete_message += content
+                if on_chunk and content:
+                    on_chunk(content)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Antwort des OpenAI Servers: %s", payload_summary(complete_message))
+
+        metrics = build_response_metrics(request_start, first_token_time,
+                                         prompt_tokens=usage.get("prompt_tokens"), completion_tokens=usage.get("completion_tokens"))
+        return {"response": complete_message, "metrics": metrics} #Ergebnis zurückgeben.
     except requests.exceptions.RequestException as e:
         return {"error": f"Fehler bei der Kommunikation mit OpenAI: {e}"}
 
 
+#Dateiobjekt für den Upload: liest die Datei blockweise während des Sendens und meldet die bisher gesendeten Bytes.
+#Durch __len__ setzt requests die Content-Length, die Datei wird trotzdem nicht vollständig in den Speicher geladen.
+class UploadReader:
+    def __init__(self, file_path, on_read=None):
+        self.file = open(file_path, "rb")
+        self.size = os.path.getsize(file_path)
+        self.sent = 0
+        self.on_read = on_read
+
+    def read(self, size=-1):
+        block = self.file.read(size)
+        self.sent += len(block)
+        if self.on_read and block:
+            self.on_read(self.sent)
+        return block
+
+    def __len__(self):
+        return self.size
+
+    def close(self):
+        self.file.close()
+
 #Uploadfunktion zur Vektordatenbank
 #Zukünftig wäre es besser über https zu posten und einen API Schlüssel zu erstellen, um Zugriff auf sensible Daten zu verhindern.
-def upload_files_to_rag_server(file_paths):
-    """Im folgenden werden die Funktion zum Hochladen von Text, Docx und PDF Dateien definiert und konfiguriert."""
-    if not file_paths:
-        return "Keine Dateien ausgewählt."
+#Lädt eine einzelne Datei als Anfrageinhalt hoch. Vorübergehende Fehler (429, 5xx, Verbindungsabbruch) werden mit wachsender
+#Wartezeit wiederholt, bei 429 entsprechend dem Retry-After Header des Servers.
+#Rückgabe: {"job_id": ...}, {"duplicate": True} falls der Inhalt bereits in der Vektordatenbank liegt, oder {"error": ...}.
+def upload_file_to_rag_server(file_path, on_bytes=None, collection=VECTORDB_COLLECTION):
+    file_name = os.path.basename(file_path)
+    error = None
+    for attempt in range(UPLOAD_RETRIES + 1):
+        if attempt:
+            time.sleep(wait)
+        wait = HTTP_RETRY_BACKOFF * (2 ** attempt)
+        try:
+            #Datei kann nach der Auswahl gelöscht oder gesperrt worden sein.
+            reader = UploadReader(file_path, on_bytes)
+        except OSError as e:
+            return {"error": f"Datei kann nicht gelesen werden: {e}"}
+        try:
+            response = http_post(VECTORDATABASE_UPLOAD, params={"filename": file_name, "collection": collection}, data=reader,
+                                 headers={"Content-Type": "application/octet-stream"})
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            error = f"Verbindungsfehler: {e}"
+            continue
+        except requests.exceptions.RequestException as e:
+            return {"error": f"Fehler beim Hochladen der Datei: {e}"}
+        except OSError as e: #Lesefehler während der Übertragung
+            return {"error": f"Datei kann nicht gelesen werden: {e}"}
+        finally:
+            reader.close()
+        #Gleicher Inhalt ist bereits vorhanden - z.B. nach einer Wiederholung, deren erste Antwort verloren ging.
+        #Andere 403/409 Antworten (z.B. eine andere Version der Datei wird gerade verarbeitet) sind Fehler, die Datei gilt nicht als hochgeladen.
+        if response.status_code == 403 and response_json(response).get("duplicate"):
+            return {"duplicate": True}
+        if response.status_code == 429 or response.status_code >= 500:
+            error = f"Server antwortet mit {response.status_code}"
+            if response.headers.get("Retry-After", "").isdigit():
+                wait = int(response.headers["Retry-After"])
+            continue
+        if not response.ok:
+            return {"error": response_json(response).get("error", f"Server antwortet mit {response.status_code} {response.reason}")}
+        return {"job_id": response_json(response).get("job_id")}
+    return {"error": f"{error} (nach {UPLOAD_RETRIES} Wiederholungen)"}
+
+#JSON Inhalt einer Antwort des Vektorservers. Leeres Dict, falls die Antwort kein JSON ist (z.B. HTML Fehlerseite eines Proxys).
+def response_json(response):
     try:
-        for file_path in file_paths:
-            with open(file_path, 'rb') as f: #Datei als Binary öffnen
-                response = requests.post(VECTORDATABASE_UPLOAD, files={"file": f})
-            response.raise_for_status()
-        return "Hochladen erfolgreich"
-    except requests.exceptions.RequestException as e:
-        return f"Fehler beim Hochladen der Datei: {e}"
+        data = response.json()
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+#Upload Protokoll: eine JSON Zeile je erfolgreich hochgeladener Datei und Sammlung.
+def file_signature(file_path):
+    stat = os.stat(file_path)
+    return [stat.st_size, int(stat.st_mtime)]
+
+def load_upload_manifest(collection=VECTORDB_COLLECTION):
+    manifest = {}
+    if os.path.exists(UPLOAD_MANIFEST_PATH):
+        with open(UPLOAD_MANIFEST_PATH, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get("collection", "default") == collection:
+                    manifest[entry["path"]] = entry["signature"]
+    return manifest
+
+def record_upload(file_path, signature, collection=VECTORDB_COLLECTION):
+    os.makedirs("Vektordatenbank", exist_ok=True)
+    with open(UPLOAD_MANIFEST_PATH, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"path": file_path, "signature": signature, "collection": collection}) + "\n")
+
+#Fragt den Status mehrerer Ingestion Jobs mit einer Anfrage ab. Jobs, die der Server nicht mehr kennt, fehlen im Ergebnis.
+def fetch_ingest_jobs():
+    response = http_get(VECTORDATABASE_JOBS)
+    response.raise_for_status()
+    return {job["id"]: job for job in response.json()["jobs"]}
+
+#Gespeicherte Dokumente einer Sammlung: [{"id" (Dateiname), "tags", "uploaded", "chunks", ...}, ...]
+def fetch_vector_sources(collection=VECTORDB_COLLECTION):
+    response = http_get(VECTORDATABASE_DOCUMENTS, params={"collection": collection})
+    response.raise_for_status()
+    return response.json()["documents"]
+
+#Namen der Sammlungen des Vektorservers.
+def fetch_collections():
+    response = http_get(VECTORDATABASE_COLLECTIONS)
+    response.raise_for_status()
+    return [collection["name"] for collection in response.json()["collections"]]
+
+#Legt die Sammlung an, falls sie noch nicht existiert.
+def ensure_collection(collection):
+    if collection in fetch_collections():
+        return
+    response = http_post(VECTORDATABASE_COLLECTIONS, json={"name": collection})
+    if response.status_code != 409: #409: zwischenzeitlich von einem anderen Client angelegt
+        if not response.ok:
+            raise ValueError(response_json(response).get("error", f"Server antwortet mit {response.status_code} {response.reason}"))
+        logger.info("Sammlung %s auf dem Vektorserver angelegt.", collection)
+
+#########
+#Gesprächsverlauf mit Token Budget
+#Der vollständige Verlauf bleibt erhalten, an das Modell wird aber nur gesendet, was in das Budget des Modells passt:
+#Systemnachricht, aktueller Kontext und Frage immer, danach die neuesten Gesprächsrunden. Ältere Runden werden je nach
+#HISTORY_COMPACTION zusammengefasst, nach Relevanz ausgewählt oder weggelassen.
+#Die Tokenanzahl wird geschätzt (ca. 4 Zeichen je Token), damit kein modellspezifischer Tokenizer nötig ist.
+#########
+
+CHARS_PER_TOKEN = 4
+MESSAGE_TOKEN_OVERHEAD = 4 #Rolle und Trennzeichen je Nachricht
+SUMMARY_CHARS_PER_TURN = 200 #Gekürzte Länge von Frage und Antwort je Runde in der Zusammenfassung
+RECENT_HISTORY_SHARE = 0.7   #Anteil des freien Budgets für die neuesten Runden, der Rest bleibt für Zusammenfassung bzw. relevante ältere Runden
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + MESSAGE_TOKEN_OVERHEAD if text else 0
+
+def context_budget(model_name):
+    return CONTEXT_BUDGETS.get(model_name, CONTEXT_BUDGET)
+
+def shorten(text, max_chars):
+    text = " ".join(text.split())
+    return text if len(text) <= max_chars else text[:max_chars].rstrip() + " ..."
+
+def word_set(text):
+    return {word for word in re.findall(r"\w+", text.lower()) if len(word) > 3}
+
+class ConversationHistory:
+    def __init__(self, system_content=System_Role):
+        self.system_message = {"role": "system", "content": system_content}
+        self.system_tokens = estimate_tokens(system_content)
+        #Eine Runde = Frage und Antwort mit geschätzter Tokenanzahl und Wortmenge für die Relevanzauswahl.
+        self.turns = []
+
+    def add_turn(self, question, answer):
+        self.turns.append({
+            "messages": [{"role": "user", "content": question}, {"role": "assistant", "content": answer}],
+            "tokens": estimate_tokens(question) + estimate_tokens(answer),
+            "words": word_set(question + " " + answer),
+        })
+
+    #Nachrichten für die nächste Anfrage (ohne Kontext und Frage, diese fügen ask_llm_server/ask_openai_server an)
+    #und eine Übersicht der Prompt Größe für die Anzeige.
+    def build_messages(self, question, context_text, budget):
+        fixed_tokens = self.system_tokens + estimate_tokens(question) + estimate_tokens(context_text)
+        available = budget - RESPONSE_TOKEN_RESERVE - fixed_tokens
+
+        #Neueste Runden, solange sie vollständig in ihren Anteil des Budgets passen.
+        recent_budget = available if HISTORY_COMPACTION == "drop" else int(available * RECENT_HISTORY_SHARE)
+        first_recent = len(self.turns)
+        while first_recent > 0 and self.turns[first_recent - 1]["tokens"] <= recent_budget:
+            first_recent -= 1
+            recent_budget -= self.turns[first_recent]["tokens"]
+            available -= self.turns[first_recent]["tokens"]
+        older = self.turns[:first_recent]
+
+        older_messages = []
+        older_sent = 0
+        if older and HISTORY_COMPACTION == "relevance":
+            #Ältere Runden mit den meisten gemeinsamen Wörtern zur Frage, in ursprünglicher Reihenfolge.
+            question_words = word_set(question)
+            ranked = sorted(range(len(older)), key=lambda i: len(older[i]["words"] & question_words), reverse=True)
+            chosen = []
+            for i in ranked:
+                if not older[i]["words"] & question_words:
+                    break
+                if older[i]["tokens"] <= available:
+                    chosen.append(i)
+                    available -= older[i]["tokens"]
+            for i in sorted(chosen):
+                older_messages.extend(older[i]["messages"])
+            older_sent = len(chosen)
+        elif older and HISTORY_COMPACTION == "summary":
+            #Neueste der älteren Runden zuerst, bis das Budget erreicht ist.
+            header = "Zusammenfassung des früheren Gesprächsverlaufs:"
+            available -= estimate_tokens(header)
+            lines = []
+            for turn in reversed(older):
+                line = (f"- Nutzer: {shorten(turn['messages'][0]['content'], SUMMARY_CHARS_PER_TURN)} | "
+                        f"Antwort: {shorten(turn['messages'][1]['content'], SUMMARY_CHARS_PER_TURN)}")
+                line_tokens = len(line) // CHARS_PER_TOKEN + 1
+                if line_tokens > available:
+                    break
+                lines.insert(0, line)
+                available -= line_tokens
+            if lines:
+                older_messages.append({"role": "system", "content": header + "\n" + "\n".join(lines)})
+                older_sent = len(lines)
+
+        messages = [self.system_message] + older_messages
+        for turn in self.turns[first_recent:]:
+            messages.extend(turn["messages"])
+        prompt_tokens = fixed_tokens + sum(estimate_tokens(message["content"]) for message in messages[1:])
+        return messages, {
+            "prompt_tokens": prompt_tokens,
+            "budget": budget,
+            "turns_total": len(self.turns),
+            "turns_recent": len(self.turns) - first_recent,
+            "turns_older_sent": older_sent,
+            "compaction": HISTORY_COMPACTION,
+        }
+
+#Kurzfassung der Prompt Größe für die Anzeige unter dem Ausgabefeld.
+def format_prompt_stats(stats):
+    text = f"Prompt ~{stats['prompt_tokens']}/{stats['budget']} Tokens, {stats['turns_recent']} von {stats['turns_total']} Runden"
+    older = stats["turns_total"] - stats["turns_recent"]
+    if older:
+        label = {"summary": "zusammengefasst", "relevance": "nach Relevanz"}.get(stats["compaction"], "gesendet")
+        text += f" (+{stats['turns_older_sent']} {label}, {older - stats['turns_older_sent']} ausgelassen)"
+    return text
 
 #####
 #Im Folgenden werden zum größten Teil die Komponenten für die Benutzeroberfläche erstellt.
@@ -227,18 +815,28 @@ class LLMApp(window.Tk):
 
         #Liste für die Dokumente die hochgeladen werden.
         self.attached_files = []
+        #Zustand des laufenden Massenuploads je Datei. Die Upload Threads schreiben nur in dieses Dictionary,
+        #die Anzeige wird regelmäßig im Tk Hauptthread aktualisiert (refresh_upload_progress).
+        self.upload_lock = threading.Lock()
+        self.upload_state = {}
+        self.upload_changed = set()
+        self.upload_running = False
 
         self.llm_conversation_history = {}
         all_models = LOCAL_LLM_MODELS + OPENAI_MODELS #Listen der LLM Modelle kombinieren.
         for model_name in all_models:
-            system_message = {
-                "role": "system",
-                "content": System_Role
-            }
+            #Erstellt individuelle Historie für jede Modellbezeichnung mit Systemnachricht am Anfang des Verlaufs.
+            self.llm_conversation_history[model_name] = ConversationHistory(System_Role)
 
-        #Erstellt individuelle Historie für jede Modellbezeichnung mit Systemnachricht am Anfang des Verlaufs.
-        self.llm_conversation_history[model_name] = [system_message]
+        #Die Modelle werden parallel angefragt - Zugriffe auf die Historie werden daher über eine Sperre abgesichert.
+        self.history_lock = threading.Lock()
+        #Ein Worker pro Ausgabefeld (maximal 3 Modelle gleichzeitig).
+        self.request_executor = ThreadPoolExecutor(max_workers=3, thread_name_prefix="LLM-Anfrage")
 
+        #Gestreamte Textteile werden von den Worker Threads in die Queue gelegt und im Hauptthread gesammelt ausgegeben.
+        #Die Anfragenummer verhindert, dass verspätete Textteile einer vorherigen Anfrage in den Ausgabefeldern landen.
+        self.stream_queue = queue.Queue()
+        self.request_counter = 0
 
 
         ###########################################
@@ -298,12 +896,24 @@ class LLMApp(window.Tk):
         #Dateiauswahl Schalftläche
         self.attach_button = window.Button(file_buttons_frame, text="Dateien auswählen", command=self.select_files)
         self.attach_button.pack(anchor="nw", pady=2)
+        #Ordnerauswahl - alle unterstützten Dateien inklusive Unterordnern
+        self.attach_folder_button = window.Button(file_buttons_frame, text="Ordner auswählen", command=self.select_folder)
+        self.attach_folder_button.pack(anchor="nw", pady=2)
         #Schaltfläche Datei hochladen durchführen
         self.upload_button = window.Button(file_buttons_frame, text="Dateien hochladen", command=self.upload_files)
         self.upload_button.pack(anchor="nw", pady=2)
         #Schaltfläche leert Dateiliste
         self.clear_button = window.Button(file_buttons_frame, text="Dateien deselektieren", command=self.clear_file_selection)
         self.clear_button.pack(anchor="nw", pady=2)
+        #Fortschritt des Uploads: Fortschrittsbalken (abgeschlossene Dateien) und Zusammenfassung mit Durchsatz.
+        #Der Status jeder Datei wird direkt in der Dateiliste angezeigt.
+        upload_progress_frame = window.Frame(self.left_top)
+        upload_progress_frame.grid(row=2, column=0, columnspan=4, sticky="ew", padx=5)
+        upload_progress_frame.columnconfigure(1, weight=1)
+        self.upload_progressbar = ttk.Progressbar(upload_progress_frame, mode="determinate", length=150)
+        self.upload_progressbar.grid(row=0, column=0, sticky="w")
+        self.upload_status_label = window.Label(upload_progress_frame, text="", anchor="w")
+        self.upload_status_label.grid(row=0, column=1, sticky="ew", padx=5)
 
         #Kontrollkästchen<->Checkboxen - Anfrage behalten verhindert das Löschen
         self.retain_input_var = window.BooleanVar(value=True)
@@ -319,6 +929,21 @@ class LLMApp(window.Tk):
         self.use_vektordb_variables = window.BooleanVar(value=False)
         self.use_vektordb_checkbox = window.Checkbutton(self.left_top, text="Vektordatenbank einbeziehen", variable=self.use_vektordb_variables)
         self.use_vektordb_checkbox.grid(row=6, column=0, sticky="w", padx=5, pady=2)
+        #Suche auf ausgewählte Dokumente beschränken (None = alle Dokumente).
+        self.source_filter = None
+        self.source_filter_button = window.Button(self.left_top, text="Dokumente: alle", command=self.select_source_filter)
+        self.source_filter_button.grid(row=6, column=1, sticky="w", padx=5, pady=2)
+
+        #Sammlung des Vektorservers für Uploads, Anfragen und Dokumentfilter. Ein neuer Name wird beim ersten Upload angelegt.
+        collection_frame = window.Frame(self.left_top)
+        collection_frame.grid(row=7, column=1, sticky="w", padx=5, pady=5)
+        window.Label(collection_frame, text="Sammlung:").pack(side=window.LEFT)
+        self.collection_var = window.StringVar(value=VECTORDB_COLLECTION)
+        self.collection_combobox = ttk.Combobox(collection_frame, textvariable=self.collection_var, width=20,
+                                                postcommand=self.load_collection_names)
+        self.collection_combobox.pack(side=window.LEFT, padx=5)
+        #Der Dokumentfilter gilt nur für die Sammlung, in der er ausgewählt wurde.
+        self.collection_var.trace_add("write", lambda *args: self.reset_source_filter())
 
         #Verbindung mit lokalem LLM Server und Vektorserver testen. -> Ausgabe der Resultate via Messagebox.
         self.test_button = window.Button(self.left_top, text="Verbindung testen", command=self.run_test_connection)
@@ -344,6 +969,7 @@ class LLMApp(window.Tk):
         #OpenAI Modelle Auswahl- Werden nur angezeigt wenn API Key vorhanden ist.
         #ToDo: Hinzufügen einer automatischen Modellabfrage zu Beginn des Codes über den API Key, damit
         #eine Auswahl aktueller Modelle vorliegt.
+        self.openai_model_vars = [] #Leer, falls kein API Key vorhanden ist.
         if OPENAI_API_KEY:
             openai_models_labelframe = window.LabelFrame(models_frame, text="OpenAI Modelle", width=75)
             openai_models_labelframe.grid(row=0, column=1, sticky="nsew", padx=5)
@@ -362,16 +988,22 @@ class LLMApp(window.Tk):
         self.label_output1.pack()
         self.output_text_1 = scrolledtext.ScrolledText(self.right_frame, height=8)
         self.output_text_1.pack(fill=window.BOTH, expand=True)
+        self.metrics_label_1 = window.Label(self.right_frame, text="", anchor="w", fg="gray25")
+        self.metrics_label_1.pack(fill=window.X)
         #Zweites Ausgabefeld
         self.label_output2 = window.Label(self.right_frame, text="Ausgabe (kein Modell)")
         self.label_output2.pack()
         self.output_text_2 = scrolledtext.ScrolledText(self.right_frame, height=8)
         self.output_text_2.pack(fill=window.BOTH, expand=True)
+        self.metrics_label_2 = window.Label(self.right_frame, text="", anchor="w", fg="gray25")
+        self.metrics_label_2.pack(fill=window.X)
         #Drittes Ausgabefeld
         self.label_output3 = window.Label(self.right_frame, text="Ausgabe (kein Modell)")
         self.label_output3.pack()
         self.output_text_3 = scrolledtext.ScrolledText(self.right_frame, height=8)
         self.output_text_3.pack(fill=window.BOTH, expand=True)
+        self.metrics_label_3 = window.Label(self.right_frame, text="", anchor="w", fg="gray25")
+        self.metrics_label_3.pack(fill=window.X)
 
         ########################
         #Schaltflächen unten rechts: Konversationsverlauf speichern & Konversationsverlauf öffnen (Word Datei)
@@ -387,14 +1019,23 @@ class LLMApp(window.Tk):
         #self.copy_button.pack(side=window.LEFT, padx=5)
         """
         #Konversation speichern Schaltfläche
-        self.save_button = window.Button(btn_frame, text="Konversation speichern", command=self.save_conversation_to_word)
+        self.save_button = window.Button(btn_frame, text="Konversation speichern", command=self.save_conversation)
         self.save_button.pack(side=window.LEFT, padx=5)
+        #Export des Journals als Word/Markdown Datei
+        self.export_button = window.Button(btn_frame, text="Konversation exportieren", command=self.open_export_dialog)
+        self.export_button.pack(side=window.LEFT, padx=5)
         #Konversationsverlauf öffnen
         self.open_button = window.Button(btn_frame, text="Konversationsverlauf öffnen", command=self.open_conversation)
         self.open_button.pack(side=window.LEFT, padx=5)
 
-        #Konversationshistorie - Liste zum Speichern des Chatverlaufs jedes einzelnen Modells
+        #Konversationshistorie - Liste der Anfragen dieser Sitzung, noch nicht gespeicherte werden beim Speichern ins Journal geschrieben
         self.conversation_history = []
+        self.journaled_count = 0
+        self.last_export_path = None
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+
+        #Regelmäßiges Leeren der Stream Queue im Tk Hauptthread starten.
+        self.after(STREAM_REFRESH_MS, self.drain_stream_queue)
 
     ################
     #Methoden
@@ -404,41 +1045,255 @@ class LLMApp(window.Tk):
         #Dateiauswahl & speichern der vollständigen Pfade.
         #Vorerst werden pdf,txt,docx unterstützt.
         paths = filedialog.askopenfilenames(filetypes=[("All Files", "*.pdf;*.docx;*.txt")])
-        for path in paths:
-            absolute_path = os.path.abspath(path)
-            self.attached_files.append(absolute_path)
-            self.files_list.insert(window.END, absolute_path)
+        self.add_files([os.path.abspath(path) for path in paths])
+    #Alle unterstützten Dateien eines Ordners inklusive Unterordnern auswählen.
+    def select_folder(self):
+        folder = filedialog.askdirectory()
+        if not folder:
+            return
+        paths = []
+        for root, _, names in os.walk(folder):
+            for name in sorted(names):
+                if name.lower().endswith(SUPPORTED_UPLOAD_TYPES):
+                    paths.append(os.path.abspath(os.path.join(root, name)))
+        self.add_files(paths)
+    #Dateien ohne Duplikate zur Liste hinzufügen.
+    def add_files(self, paths):
+        known = set(self.attached_files)
+        for absolute_path in paths:
+            if absolute_path not in known:
+                known.add(absolute_path)
+                self.attached_files.append(absolute_path)
+                self.files_list.insert(window.END, absolute_path)
     #Dateiupload  durchführen
     def upload_files(self):
-        if self.attached_files:
-            threading.Thread(target=self.upload_sequentially, daemon=True).start()
-        else:
+        if self.upload_running:
+            return
+        if not self.attached_files:
             messagebox.showinfo("Upload", "Keine Dateien zum Hochladen ausgewählt.")
             return
-    #Dateien nacheinander hochladen (Fix)
-    def upload_sequentially(self):
         files_to_upload = list(self.attached_files)
-        for fpath in files_to_upload:
-            result = upload_files_to_rag_server([fpath])
-            if "erfolgreich" in result.lower():
-                self.remove_file_from_list(fpath)
+        collection = self.current_collection()
+        self.upload_running = True
+        for button in (self.attach_button, self.attach_folder_button, self.upload_button, self.clear_button):
+            button.config(state=window.DISABLED)
+        self.upload_progressbar.config(maximum=len(files_to_upload), value=0)
+        self.upload_state = {path: {"state": "wartet", "text": "wartet", "sent": 0, "size": 0, "started": None}
+                             for path in files_to_upload}
+        self.upload_changed = set(files_to_upload)
+        self.upload_started = time.time()
+        threading.Thread(target=self.run_bulk_upload, args=(files_to_upload, collection), daemon=True).start()
+        self.after(200, self.refresh_upload_progress)
+
+    #Massenupload: bis zu UPLOAD_CONCURRENCY Dateien werden gleichzeitig hochgeladen. Der Verarbeitungsstatus aller
+    #hochgeladenen Dateien wird gesammelt über /jobs abgefragt, statt je Datei einen eigenen Abfrage-Thread zu belegen.
+    def run_bulk_upload(self, files_to_upload, collection):
+        try:
+            manifest = load_upload_manifest(collection)
+            tracked_jobs = {} #job_id -> Dateipfad
+            jobs_lock = threading.Lock()
+            try:
+                ensure_collection(collection)
+            except (requests.exceptions.RequestException, ValueError) as e:
+                for path in files_to_upload:
+                    self.set_upload_state(path, "failed", f"Sammlung {collection}: {e}")
+                return
+
+            def upload_one(path):
+                try:
+                    signature = file_signature(path)
+                except OSError as e:
+                    self.set_upload_state(path, "failed", f"Fehler: {e}")
+                    return
+                if manifest.get(path) == signature:
+                    self.set_upload_state(path, "skipped", "bereits hochgeladen (Protokoll)")
+                    return
+                with self.upload_lock:
+                    self.upload_state[path].update(size=signature[0], started=time.time())
+                self.set_upload_state(path, "uploading", "lädt hoch")
+                result = upload_file_to_rag_server(path, on_bytes=lambda sent: self.set_upload_sent(path, sent), collection=collection)
+                if "error" in result:
+                    self.set_upload_state(path, "failed", f"Fehler: {result['error']}")
+                elif result.get("duplicate"):
+                    record_upload(path, signature, collection)
+                    self.set_upload_state(path, "done", "bereits in der Vektordatenbank")
+                elif not result.get("job_id"):
+                    #Ohne Job ID ist unklar, ob die Datei verarbeitet wird - nicht ins Protokoll, beim nächsten Mal erneut hochladen.
+                    self.set_upload_state(path, "failed", "Fehler: Server hat keine Job ID geliefert")
+                else:
+                    self.set_upload_state(path, "processing", "wird verarbeitet", signature=signature)
+                    with jobs_lock:
+                        tracked_jobs[result["job_id"]] = path
+
+            with ThreadPoolExecutor(max_workers=UPLOAD_CONCURRENCY, thread_name_prefix="Upload") as pool:
+                futures = [pool.submit(upload_one, path) for path in files_to_upload]
+                while True:
+                    uploads_finished = all(future.done() for future in futures)
+                    with jobs_lock:
+                        pending = dict(tracked_jobs)
+                    if pending:
+                        self.poll_upload_jobs(pending, tracked_jobs, jobs_lock, collection)
+                    elif uploads_finished:
+                        break
+                    time.sleep(UPLOAD_POLL_INTERVAL)
+            #Fehler aus upload_one weitergeben, sonst bliebe die betroffene Datei bei "lädt hoch" stehen.
+            for future in futures:
+                future.result()
+        except Exception as e:
+            #Unerwarteter Fehler: nicht abgeschlossene Dateien als fehlgeschlagen anzeigen, statt die Upload Schaltflächen gesperrt zu lassen.
+            logger.exception("Fehler beim Massenupload: %s", e)
+            with self.upload_lock:
+                unfinished = [path for path, entry in self.upload_state.items() if entry["state"] not in ("done", "skipped", "failed")]
+            for path in unfinished:
+                self.set_upload_state(path, "failed", f"Fehler: {e}")
+        finally:
+            self.upload_running = False
+
+    #Status der hochgeladenen, noch nicht verarbeiteten Dateien abfragen.
+    def poll_upload_jobs(self, pending, tracked_jobs, jobs_lock, collection):
+        try:
+            server_jobs = fetch_ingest_jobs()
+        except (requests.exceptions.RequestException, ValueError, KeyError):
+            return #Nächster Versuch im nächsten Intervall
+        for job_id, path in pending.items():
+            job = server_jobs.get(job_id)
+            if job is None:
+                #Job wurde bereits aus dem Verlauf des Servers entfernt.
+                try:
+                    response = http_get(f"{VECTORDATABASE_JOBS}/{job_id}")
+                    job = response.json() if response.ok else None
+                except (requests.exceptions.RequestException, ValueError):
+                    continue
+                if job is None:
+                    #Ergebnis unbekannt (z.B. Serverneustart oder Verlauf gekürzt): nicht ins Protokoll, beim nächsten Mal erneut hochladen.
+                    self.set_upload_state(path, "failed", f"Fehler: Job auf dem Server nicht mehr bekannt (Status {response.status_code})")
+                    with jobs_lock:
+                        tracked_jobs.pop(job_id, None)
+                    continue
+            if job["state"] == "done":
+                record_upload(path, self.upload_state[path]["signature"], collection)
+                self.set_upload_state(path, "done", f"fertig ({job.get('chunks', '?')} Chunks)")
+            elif job["state"] == "failed":
+                self.set_upload_state(path, "failed", f"Fehler bei der Verarbeitung: {job.get('error')}")
             else:
-                messagebox.showerror("Upload-Fehler", result)
-        messagebox.showinfo("Upload", "Upload-Prozess abgeschlossen.")
+                self.set_upload_state(path, "processing", f"{job['state']} ({job.get('chunks', '?')} Chunks)")
+                continue
+            with jobs_lock:
+                tracked_jobs.pop(job_id, None)
+
+    def set_upload_state(self, path, state, text, **extra):
+        with self.upload_lock:
+            self.upload_state[path].update(state=state, text=text, **extra)
+            self.upload_changed.add(path)
+
+    def set_upload_sent(self, path, sent):
+        with self.upload_lock:
+            self.upload_state[path]["sent"] = sent
+            self.upload_changed.add(path)
+
+    #Aktualisiert Dateiliste, Fortschrittsbalken und Zusammenfassung im Tk Hauptthread. Nur geänderte Einträge werden neu gezeichnet.
+    def refresh_upload_progress(self):
+        now = time.time()
+        #Vor dem Auslesen prüfen: ist der Upload beendet, sind damit alle Statusänderungen bereits enthalten.
+        running = self.upload_running
+        with self.upload_lock:
+            changed = self.upload_changed
+            self.upload_changed = set()
+            states = {path: dict(entry) for path, entry in self.upload_state.items()}
+        positions = {path: i for i, path in enumerate(self.attached_files)} if changed else {}
+        for path in changed:
+            entry = states[path]
+            text = entry["text"]
+            if entry["state"] == "uploading" and entry["size"]:
+                rate = entry["sent"] / max(now - entry["started"], 1e-6) / 1e6
+                text = f"lädt hoch {entry['sent'] * 100 // entry['size']}% ({rate:.1f} MB/s)"
+            i = positions[path]
+            self.files_list.delete(i)
+            self.files_list.insert(i, f"{path}  -  {text}")
+
+        finished = [path for path, entry in states.items() if entry["state"] in ("done", "skipped", "failed")]
+        failed = sum(1 for path in finished if states[path]["state"] == "failed")
+        sent_total = sum(entry["sent"] for entry in states.values())
+        rate_total = sent_total / max(now - self.upload_started, 1e-6) / 1e6
+        self.upload_progressbar.config(value=len(finished))
+        self.upload_status_label.config(text=f"{len(finished)}/{len(states)} Dateien abgeschlossen, {failed} Fehler - "
+                                             f"{sent_total / 1e6:.1f} MB hochgeladen ({rate_total:.1f} MB/s)")
+
+        if running:
+            self.after(200, self.refresh_upload_progress)
+            return
+        #Upload beendet: erfolgreiche Dateien aus der Liste entfernen, fehlgeschlagene bleiben mit Fehlermeldung stehen.
+        for path in finished:
+            if states[path]["state"] != "failed":
+                self.remove_file_from_list(path)
+        for button in (self.attach_button, self.attach_folder_button, self.upload_button, self.clear_button):
+            button.config(state=window.NORMAL)
     #Funktion - Dateien von Liste entfernen
     def remove_file_from_list(self, filepath):
         if filepath in self.attached_files:
-            self.attached_files.remove(filepath)
-        for i in range(self.files_list.size()):
-            if self.files_list.get(i) == filepath:
-                self.files_list.delete(i)
-                break
+            i = self.attached_files.index(filepath)
+            del self.attached_files[i]
+            self.files_list.delete(i)
     #2. Funktion Dateien von Liste entfernen
     def clear_file_selection(self):
         self.attached_files.clear()
         self.files_list.delete(0, window.END)
 
 
+    ###########
+    #Dokumentfilter - die Dokumentliste wird im Hintergrund geladen, die Auswahl erfolgt in einem eigenen Fenster.
+    def select_source_filter(self):
+        collection = self.current_collection()
+        def load_sources():
+            try:
+                sources = fetch_vector_sources(collection)
+            except requests.exceptions.RequestException as e:
+                self.after(0, lambda: messagebox.showerror("Vektordatenbank", f"Dokumentliste konnte nicht geladen werden: {e}"))
+                return
+            self.after(0, self.open_source_filter_dialog, sources)
+        threading.Thread(target=load_sources, daemon=True).start()
+
+    def open_source_filter_dialog(self, sources):
+        if not sources:
+            messagebox.showinfo("Info", f"Die Sammlung '{self.current_collection()}' enthält noch keine Dokumente.")
+            return
+        dialog = window.Toplevel(self)
+        dialog.title("Suche auf Dokumente beschränken")
+        dialog.transient(self)
+        listbox = window.Listbox(dialog, selectmode=window.EXTENDED, width=70, height=min(20, len(sources)), exportselection=False)
+        listbox.pack(fill=window.BOTH, expand=True, padx=5, pady=5)
+        names = [source["id"] for source in sources]
+        for source in sources:
+            tags = f" [{', '.join(source['tags'])}]" if source["tags"] else ""
+            listbox.insert(window.END, f"{source['id']}{tags} - {source['chunks']} Chunks")
+            if self.source_filter and source["id"] in self.source_filter:
+                listbox.selection_set(window.END)
+
+        def apply_filter(selected):
+            self.source_filter = selected or None
+            self.source_filter_button.config(text=f"Dokumente: {len(selected)} ausgewählt" if selected else "Dokumente: alle")
+            dialog.destroy()
+
+        button_frame = window.Frame(dialog)
+        button_frame.pack(fill=window.X, pady=5)
+        window.Button(button_frame, text="Übernehmen",
+                      command=lambda: apply_filter([names[i] for i in listbox.curselection()])).pack(side=window.LEFT, padx=5)
+        window.Button(button_frame, text="Alle Dokumente", command=lambda: apply_filter([])).pack(side=window.LEFT, padx=5)
+
+    def reset_source_filter(self):
+        self.source_filter = None
+        self.source_filter_button.config(text="Dokumente: alle")
+
+    def current_collection(self):
+        return self.collection_var.get().strip() or "default"
+
+    #Auswahlliste der Sammlungen beim Öffnen aktualisieren (Fehler werden ignoriert, der Name kann auch eingegeben werden).
+    def load_collection_names(self):
+        try:
+            self.collection_combobox.config(values=fetch_collections())
+        except (requests.exceptions.RequestException, ValueError, KeyError):
+            pass
+
     ###########
     #Verbindungstest - Konfiguration und Addressen verifizieren
     def run_test_connection(self):
@@ -450,7 +1305,7 @@ class LLMApp(window.Tk):
         status_message = ""
         #Test LLM-Server mit leerer Anfrage, warte auf Antwort 404
         try:
-            resp = requests.get(LLM_SERVER_URL, timeout=5)
+            resp = http_get(LLM_SERVER_URL, timeout=(HTTP_CONNECT_TIMEOUT, 5))
             if resp.status_code == 404:
                 status_message += "Erfolgreich lokaler LLM-Server. "
             else:
@@ -460,7 +1315,7 @@ class LLMApp(window.Tk):
 
         #Test: Vektordatenbank
         try:
-            resp2 = requests.get(VECTORDATABASE_URL, timeout=5)
+            resp2 = http_get(VECTORDATABASE_URL, timeout=(HTTP_CONNECT_TIMEOUT, 5))
             if resp2.status_code == 200:
                 status_message += "Erfolgreich Vektordatenbank. "
             else:
@@ -522,8 +1377,18 @@ class LLMApp(window.Tk):
         #Setzt die Namen der Modelle zu den entsprechenden Ausgabefeldern.
         self.setup_output_labels(all_models)
 
+        #Neue Anfragenummer - Textteile älterer Anfragen werden ab jetzt verworfen.
+        self.request_counter += 1
+
+        #Einstellungen im Hauptthread lesen - Tkinter Variablen dürfen im Hintergrundthread nicht verwendet werden.
+        vector_options = None
+        if self.use_vektordb_variables.get():
+            vector_options = {"sources": self.source_filter, "collection": self.current_collection()}
+        finish_options = {"auto_save": self.auto_save_var.get(), "retain_input": self.retain_input_var.get()}
+
         #Anfragen an Modelle im Thread senden.
-        threading.Thread(target=self.process_request_sequential, args=(user_input, all_models), daemon=True).start()
+        threading.Thread(target=self.process_request_concurrent, args=(user_input, all_models, self.request_counter, vector_options, finish_options),
+                         daemon=True).start()
 
     #Aktualisiert die Namen der Ausgabefelder zu den entsprechenden Modellnamen
     def setup_output_labels(self, model_list):
@@ -548,111 +1413,268 @@ class LLMApp(window.Tk):
             self.label_output3.config(text="Ausgabe (kein Modell)")
         self.output_text_3.delete("1.0", window.END)
 
-    #Sequentielle Abfrage der ausgewählten Modelle.
-    #Optimierungsvorschlag: OpenAI Modelle und andere schnelle API Anbieter, die eine schnellere Verarbeitungszeit aufweisen sollten hier priorisiert werden,
-    #   da dies dem Nutzer die Möglichkeit bietet bereits die Inhalte der Ausgabe zu evaluieren.
-    def process_request_sequential(self, user_input, model_list):
+        #Messwerte der vorherigen Anfrage entfernen.
+        for metrics_label in (self.metrics_label_1, self.metrics_label_2, self.metrics_label_3):
+            metrics_label.config(text="")
+
+    #Parallele Abfrage der ausgewählten Modelle.
+    #Alle Modelle werden gleichzeitig angefragt. Die Wartezeit entspricht damit ungefähr der des langsamsten Modells und nicht der Summe aller Modelle.
+    #Jedes Ausgabefeld wird befüllt, sobald das zugehörige Modell geantwortet hat.
+    #vector_options: None (ohne Vektordatenbank) oder {"sources", "collection"}, finish_options: {"auto_save", "retain_input"}.
+    #Beide werden in send_request im Hauptthread gelesen.
+    def process_request_concurrent(self, user_input, model_list, request_id, vector_options, finish_options):
         """ Anfrage an die Vektordatenbank und die entsprechenden LLM Server.
         Abschließend werden in der Funktion die Ergebnisse der LLM Anfragen in den Ausgabefeldern eingesetzt.  """
         #Anfrage Vektordatenbank, falls aktiviert.
         vectordb_result = {"documents": []}
         vector_context_result = ""
-        if self.use_vektordb_variables.get():
-            vectordb_result = request_vector_context(user_input, max_results=5)
-            if Debug:
-                log_vector_response(vectordb_result)
+        vector_lookup_seconds = None
+        if vector_options is not None:
+            lookup_start = time.time()
+            vectordb_result = request_vector_context(user_input, max_results=RAG_CANDIDATES if RAG_CONTEXT_TOKENS > 0 else 5,
+                                                     token_budget=RAG_CONTEXT_TOKENS or None, sources=vector_options["sources"],
+                                                     collection=vector_options["collection"])
+            vector_lookup_seconds = round(time.time() - lookup_start, 3)
+            log_vector_response(vectordb_result)
             #Kontext für die LLM Modelle, falls aktiviert und kein Fehler.
             if "documents" in vectordb_result and not "error" in vectordb_result:
                 vector_context_result = prepare_context(vectordb_result["documents"])
 
-        responses = [] #Liste LLM Antworten
+        responses = [""] * len(model_list) #Liste LLM Antworten in der Reihenfolge der Ausgabefelder
+        journal_responses = [None] * len(model_list) #Antworten mit Modell und Messwerten für das Konversationsjournal
+        futures = {}
         for idx, model_name in enumerate(model_list):
-            if model_name in OPENAI_MODELS:
-                #Lädt den bisherigen Gesprächsverlauf, falls vorhanden, ansonsten initialisiert Gesprächsverlauf
-                history = self.llm_conversation_history.get(model_name, [{"role": "system", "content": System_Role}])
-                resp = ask_openai_server(history, vectordb_result, user_input, model=model_name)
-                #Fügt Rollen und Verlauf in die Historie hinzu.
-                history.append({"role": "user", "content": user_input})
-                history.append({"role": "assistant", "content": resp.get("response", "")})
-                self.llm_conversation_history[model_name] = history
-
-            elif model_name in LOCAL_LLM_MODELS:
-                #Lokale Modelle mit Gedächtnis
-                history = self.llm_conversation_history.get(model_name, [{"role": "system", "content": System_Role}])
-                resp = ask_llm_server(conversation_history=history, question=user_input, model=model_name, vector_context_result=vector_context_result)
-                history.append({"role": "user", "content": user_input})
-                history.append({"role": "assistant", "content": resp.get("response", "")})
-                self.llm_conversation_history[model_name] = history
-
-            responses.append(resp["response"])
-            #Ergebnis anzeigen.
-            self.update_output_box(idx, responses[-1])
-
-        def update_output_box(self, model_index, text):
-            # Fügt die LLM Ergebnisse in die entsprechenden Augabefelder ein.
-            if model_index == 0:
-                self.output_text_1.delete("1.0", window.END)
-                self.output_text_1.insert(window.END, text)
-            elif model_index == 1:
-                self.output_text_2.delete("1.0", window.END)
-                self.output_text_2.insert(window.END, text)
-            elif model_index == 2:
-                self.output_text_3.delete("1.0", window.END)
-                self.output_text_3.insert(window.END, text)
-
-        #Konversationsergebnisse für Logging sammeln, strukturieren und Datum hinzufügen.
-        self.conversation_history.append({
+            future = self.request_executor.submit(self.ask_model, model_name, user_input, vectordb_result, vector_context_result,
+                                                  lambda text, idx=idx: self.stream_queue.put(("append", request_id, idx, text)),
+                                                  lambda text, idx=idx: self.stream_queue.put(("metrics", request_id, idx, text)))
+            futures[future] = idx
+
+        #Ergebnisse in der Reihenfolge der Fertigstellung anzeigen.
+        for future in as_completed(futures):
+            idx = futures[future]
+            try:
+                resp = future.result()
+            except Exception as e:
+                resp = {"error": f"Unerwarteter Fehler bei der Anfrage: {e}"}
+            responses[idx] = resp.get("response", resp.get("error", ""))
+            #Abschließend den vollständigen (bereinigten) Text bzw. die Fehlermeldung setzen.
+            #Tkinter ist nicht threadsicher - die Ausgabe erfolgt über die Queue im Hauptthread.
+            self.stream_queue.put(("replace", request_id, idx, responses[idx]))
+
+            #Messwerte unter dem Ausgabefeld anzeigen und in der JSONL Datei festhalten.
+            metrics = dict(resp.get("metrics") or {}, vector_lookup_seconds=vector_lookup_seconds)
+            metrics_text = format_response_metrics(metrics)
+            if resp.get("prompt"):
+                metrics["prompt"] = resp["prompt"]
+                metrics_text = format_prompt_stats(resp["prompt"]) + (" | " + metrics_text if metrics_text else "")
+            self.stream_queue.put(("metrics", request_id, idx, metrics_text))
+            journal_responses[idx] = {
+                "model": model_list[idx],
+                "provider": "openai" if model_list[idx] in OPENAI_MODELS else "lokal",
+                "response": resp.get("response", ""),
+                "error": resp.get("error"),
+                "metrics": metrics,
+            }
+            try:
+                log_request_metrics(dict(metrics,
+                    time=datetime.datetime.now().isoformat(timespec="seconds"),
+                    model=model_list[idx],
+                    provider="openai" if model_list[idx] in OPENAI_MODELS else "lokal",
+                    vector_documents=len(vectordb_result.get("documents") or []),
+                    question_chars=len(user_input),
+                    response_chars=len(resp.get("response", "")),
+                    error=resp.get("error")))
+            except OSError as e:
+                logger.error("Messwerte konnten nicht gespeichert werden: %s", e)
+
+        #Konversationsergebnisse für das Journal sammeln, strukturieren und Datum hinzufügen.
+        entry = {
+            "time": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
             "input": user_input,
-            "models": model_list,
-            "responses": responses,
-            "time": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        })
+            "vector_documents": len(vectordb_result.get("documents") or []),
+            "vector_lookup_seconds": vector_lookup_seconds,
+            "responses": journal_responses,
+        }
+        with self.history_lock:
+            self.conversation_history.append(entry)
+
+        self.after(0, self.finish_request, finish_options)
 
-        #Automatisch Konversation speichern, falls aktiviert.
-        if self.auto_save_var.get():
-            self.save_conversation_to_word()
+    #Abschluss einer Anfrage im Hauptthread.
+    def finish_request(self, finish_options):
+        #Automatisch Konversation speichern, falls aktiviert. Eine Zeile im Journal, unabhängig von der Länge des Verlaufs.
+        if finish_options["auto_save"]:
+            self.save_conversation(show_info=False)
 
         #Eingabefeld geleert, falls Checkbox nicht aktiviert.
-        if not self.retain_input_var.get():
+        if not finish_options["retain_input"]:
             self.input_text.delete("1.0", window.END)
 
+    #Anfrage an ein einzelnes Modell - wird parallel für jedes ausgewählte Modell im Threadpool ausgeführt.
+    #on_prompt erhält die Prompt Größe zur Anzeige, bevor die Anfrage gesendet wird.
+    def ask_model(self, model_name, user_input, vectordb_result, vector_context_result, on_chunk=None, on_prompt=None):
+        #Auszug des bisherigen Gesprächsverlaufs im Token Budget des Modells. Die Nachrichten sind eine neue Liste,
+        #parallel laufende Anfragen beeinflussen sich daher nicht gegenseitig.
+        with self.history_lock:
+            conversation = self.llm_conversation_history.setdefault(model_name, ConversationHistory(System_Role))
+            history, prompt_stats = conversation.build_messages(user_input, vector_context_result, context_budget(model_name))
+        if on_prompt:
+            on_prompt(format_prompt_stats(prompt_stats))
+
+        if model_name in OPENAI_MODELS:
+            resp = ask_openai_server(history, vectordb_result, user_input, model=model_name, on_chunk=on_chunk)
+        elif model_name in LOCAL_LLM_MODELS:
+            #Lokale Modelle mit Gedächtnis
+            resp = ask_llm_server(conversation_history=history, question=user_input, model=model_name, vector_context_result=vector_context_result, on_chunk=on_chunk)
+        else:
+            return {"error": f"Unbekanntes Modell: {model_name}"}
+
+        #Fügt Rollen und Verlauf in die Historie hinzu.
+        with self.history_lock:
+            conversation.add_turn(user_input, resp.get("response", ""))
+        return dict(resp, prompt=prompt_stats)
+
+    def update_output_box(self, model_index, text):
+        # Fügt die LLM Ergebnisse in die entsprechenden Augabefelder ein.
+        if model_index == 0:
+            self.output_text_1.delete("1.0", window.END)
+            self.output_text_1.insert(window.END, text)
+        elif model_index == 1:
+            self.output_text_2.delete("1.0", window.END)
+            self.output_text_2.insert(window.END, text)
+        elif model_index == 2:
+            self.output_text_3.delete("1.0", window.END)
+            self.output_text_3.insert(window.END, text)
+
+    #Hängt gestreamten Text an ein Ausgabefeld an.
+    def append_output_box(self, model_index, text):
+        output_boxes = [self.output_text_1, self.output_text_2, self.output_text_3]
+        if model_index < len(output_boxes):
+            output_boxes[model_index].insert(window.END, text)
+            output_boxes[model_index].see(window.END)
+
+    #Leert die Stream Queue im Tk Hauptthread. Alle seit dem letzten Durchlauf eingetroffenen Textteile
+    #werden pro Ausgabefeld zusammengefasst, damit das Textfeld nicht für jedes einzelne Token neu gezeichnet wird.
+    def drain_stream_queue(self):
+        pending = {} #Ausgabefeld -> gesammelte Textteile
+        try:
+            while True:
+                action, request_id, idx, text = self.stream_queue.get_nowait()
+                if request_id != self.request_counter:
+                    continue #Veraltete Anfrage
+                if action == "metrics":
+                    metrics_labels = [self.metrics_label_1, self.metrics_label_2, self.metrics_label_3]
+                    if idx < len(metrics_labels):
+                        metrics_labels[idx].config(text=text)
+                elif action == "replace":
+                    pending.pop(idx, None)
+                    self.update_output_box(idx, text)
+                else:
+                    pending.setdefault(idx, []).append(text)
+        except queue.Empty:
+            pass
+        for idx, parts in pending.items():
+            self.append_output_box(idx, "".join(parts))
+        self.after(STREAM_REFRESH_MS, self.drain_stream_queue)
+
 
 
     ##################################################################
     #Weitere Hilfsfunktionen
-    #Speichert Konversation in Docx/Word Datei.
-    def save_conversation_to_word(self):
-        doc_path = "Konversationsverlauf_LLM.docx"
-        if os.path.exists(doc_path):
-            document = Document(doc_path)
-        else:
-            document = Document()
-            document.add_heading('Konversationsverlauf LLM', 0)
-
-        now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        #Letzter Eintrag der Konversationshistorie
-        if self.conversation_history:
-            latest_entry = self.conversation_history[-1]
-            document.add_paragraph(f"Datum und Zeit: {now}")
-            document.add_paragraph(f"Gewählte Modelle: {', '.join(latest_entry['models'])}")
-            document.add_paragraph(f"Eingabe:\n{latest_entry['input']}")
-            for i, resp in enumerate(latest_entry['responses']):
-                document.add_paragraph(f"Antwort Modell {i+1}:\n{resp}")
-            document.add_page_break()
-            document.save(doc_path)
-            if Debug:
-                print(f"Konversation wurde in '{doc_path}' gespeichert.")
-        else:
-            messagebox.showinfo("Info", "Keine Konversation zum Speichern vorhanden.")
-    #Öffnet die Docx/Word Datei, die den Gesprächsverlauf beinhaltet
+    #Schreibt alle noch nicht gespeicherten Anfragen dieser Sitzung in das Konversationsjournal.
+    def save_conversation(self, show_info=True):
+        with self.history_lock:
+            pending = self.conversation_history[self.journaled_count:]
+            try:
+                for entry in pending:
+                    conversation_journal.append(entry)
+                    self.journaled_count += 1
+            except OSError as e:
+                logger.error("Konversation konnte nicht gespeichert werden: %s", e)
+                return
+        if pending:
+            logger.debug("%d Anfrage(n) in '%s' gespeichert.", len(pending), CONVERSATION_JOURNAL_PATH)
+        elif show_info:
+            messagebox.showinfo("Info", "Keine neue Konversation zum Speichern vorhanden.")
+
+    #Auswahl von Zeitraum, Modell und Format für den Export des Konversationsjournals.
+    def open_export_dialog(self):
+        self.save_conversation(show_info=False)
+        dialog = window.Toplevel(self)
+        dialog.title("Konversation exportieren")
+        dialog.transient(self)
+
+        window.Label(dialog, text="Von (JJJJ-MM-TT):").grid(row=0, column=0, sticky="w", padx=5, pady=2)
+        date_from_entry = window.Entry(dialog, width=12)
+        date_from_entry.grid(row=0, column=1, sticky="w", padx=5, pady=2)
+        window.Label(dialog, text="Bis (JJJJ-MM-TT):").grid(row=1, column=0, sticky="w", padx=5, pady=2)
+        date_to_entry = window.Entry(dialog, width=12)
+        date_to_entry.grid(row=1, column=1, sticky="w", padx=5, pady=2)
+
+        window.Label(dialog, text="Modell:").grid(row=2, column=0, sticky="w", padx=5, pady=2)
+        model_var = window.StringVar(value="Alle")
+        ttk.Combobox(dialog, textvariable=model_var, state="readonly",
+                     values=["Alle"] + LOCAL_LLM_MODELS + OPENAI_MODELS).grid(row=2, column=1, sticky="w", padx=5, pady=2)
+
+        window.Label(dialog, text="Format:").grid(row=3, column=0, sticky="w", padx=5, pady=2)
+        format_var = window.StringVar(value="docx")
+        format_frame = window.Frame(dialog)
+        format_frame.grid(row=3, column=1, sticky="w", padx=5, pady=2)
+        window.Radiobutton(format_frame, text="Word", variable=format_var, value="docx").pack(side=window.LEFT)
+        window.Radiobutton(format_frame, text="Markdown", variable=format_var, value="md").pack(side=window.LEFT)
+
+        def start_export():
+            try:
+                date_from = datetime.date.fromisoformat(date_from_entry.get().strip()) if date_from_entry.get().strip() else None
+                date_to = datetime.date.fromisoformat(date_to_entry.get().strip()) if date_to_entry.get().strip() else None
+            except ValueError:
+                messagebox.showerror("Ungültiges Datum", "Bitte das Datum im Format JJJJ-MM-TT angeben.", parent=dialog)
+                return
+            extension = format_var.get()
+            path = filedialog.asksaveasfilename(parent=dialog, defaultextension=f".{extension}",
+                                                initialfile=f"{CONVERSATION_EXPORT_PATH}.{extension}",
+                                                filetypes=[("Word", "*.docx")] if extension == "docx" else [("Markdown", "*.md")])
+            if not path:
+                return
+            model = None if model_var.get() == "Alle" else model_var.get()
+            dialog.destroy()
+            #Lesen und Schreiben im Hintergrund, damit die Oberfläche bei langen Verläufen nicht blockiert.
+            threading.Thread(target=self.export_conversation, args=(path, extension, date_from, date_to, model), daemon=True).start()
+
+        window.Button(dialog, text="Exportieren", command=start_export).grid(row=4, column=0, columnspan=2, pady=5)
+
+    def export_conversation(self, path, extension, date_from, date_to, model):
+        try:
+            entries = conversation_journal.read(date_from, date_to, model)
+            if not entries:
+                self.after(0, lambda: messagebox.showinfo("Info", "Keine Konversation im gewählten Zeitraum bzw. für das gewählte Modell."))
+                return
+            if extension == "docx":
+                export_conversations_docx(entries, path)
+            else:
+                export_conversations_markdown(entries, path)
+        except Exception as e:
+            self.after(0, lambda: messagebox.showerror("Fehler beim Export", str(e)))
+            return
+        self.last_export_path = path
+        logger.info("%d Anfrage(n) nach '%s' exportiert.", len(entries), path)
+        self.after(0, lambda: messagebox.showinfo("Export abgeschlossen", f"{len(entries)} Anfrage(n) nach '{path}' exportiert."))
+
+    #Öffnet die zuletzt exportierte Datei bzw. den Standard-Export, der den Gesprächsverlauf beinhaltet
     def open_conversation(self):
-        doc_path = "Konversationsverlauf_LLM.docx"
+        doc_path = self.last_export_path or f"{CONVERSATION_EXPORT_PATH}.docx"
         if os.path.exists(doc_path):
             os.startfile(doc_path)
         else:
-            messagebox.showwarning("Datei nicht gefunden", "Es gibt noch keine gespeicherte Konversation.")
+            messagebox.showwarning("Datei nicht gefunden", "Es gibt noch keine exportierte Konversation. Bitte zuerst 'Konversation exportieren' verwenden.")
+
+    #Beim Schließen das Journal vollständig auf die Festplatte schreiben.
+    def on_close(self):
+        conversation_journal.close()
+        self.destroy()
 
 #Start der App
 if __name__ == "__main__":
+    setup_logging(LOG_PATH)
     app = LLMApp()
     app.mainloop()
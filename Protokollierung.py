@@ -0,0 +1,95 @@
+#Gemeinsame Protokollierung für LLM_Interface_v1.py und Vektordatenbank_Server.py
+#Einträge werden im aufrufenden Thread nur in eine Queue gelegt. Ein Hintergrundthread (QueueListener) schreibt sie
+#in die Konsole und in eine Logdatei, die ab LOG_MAX_BYTES rotiert wird. Dadurch kostet ein Logeintrag auf dem
+#Anfragepfad keine Datei- oder Konsolenausgabe, auch nicht mit LOG_LEVEL=DEBUG.
+#Große Inhalte (Anfragen an LLMs, Kontext, Antworten der Vektordatenbank) werden nur als Zusammenfassung
+#(Größe, Anzahl, Hash) protokolliert, solange LOG_FULL_PAYLOADS nicht aktiviert ist.
+
+import os
+import json
+import queue
+import atexit
+import hashlib
+import logging
+import logging.handlers
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()                 #DEBUG, INFO, WARNING, ERROR
+LOG_CONSOLE_LEVEL = os.getenv("LOG_CONSOLE_LEVEL", LOG_LEVEL).upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()               #text oder json (eine JSON Zeile je Eintrag)
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", "10000000"))        #Größe, ab der die Logdatei rotiert wird
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))         #Anzahl aufbewahrter alter Logdateien
+LOG_FULL_PAYLOADS = os.getenv("LOG_FULL_PAYLOADS", "false").lower() in ("1", "true", "yes")
+
+TEXT_FORMAT = "%(asctime)s %(levelname)-7s %(name)s [%(threadName)s] %(message)s"
+
+log_listener = None
+log_lock = threading.Lock()
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        #Zusätzliche Felder über extra={"fields": {...}}
+        if isinstance(getattr(record, "fields", None), dict):
+            entry.update(record.fields)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+#Richtet die Protokollierung einmal je Prozess ein. Weitere Aufrufe (z.B. durch das zweite Modul) ändern nichts.
+def setup_logging(log_path):
+    global log_listener
+    with log_lock:
+        if log_listener is not None:
+            return
+        folder = os.path.dirname(log_path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        formatter = JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT)
+        file_handler = logging.handlers.RotatingFileHandler(log_path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8")
+        file_handler.setFormatter(formatter)
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s", "%H:%M:%S"))
+        console_handler.setLevel(LOG_CONSOLE_LEVEL)
+
+        log_queue = queue.SimpleQueue()
+        root = logging.getLogger()
+        root.setLevel(LOG_LEVEL)
+        root.addHandler(logging.handlers.QueueHandler(log_queue))
+        log_listener = logging.handlers.QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+        log_listener.start()
+        #Beim Beenden alle noch in der Queue liegenden Einträge schreiben.
+        atexit.register(stop_logging)
+
+def stop_logging():
+    global log_listener
+    with log_lock:
+        if log_listener is not None:
+            log_listener.stop()
+            log_listener = None
+
+#Zusammenfassung eines großen Inhalts: Zeichenanzahl, Kurz-Hash und je nach Typ Anzahl Nachrichten bzw. Dokumente.
+#Mit LOG_FULL_PAYLOADS wird stattdessen der vollständige Inhalt (einzeilig) zurückgegeben.
+def payload_summary(payload):
+    text = payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False, default=str)
+    if LOG_FULL_PAYLOADS:
+        return text
+    summary = {"chars": len(text), "sha256": hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]}
+    if isinstance(payload, dict):
+        for key in ("messages", "documents", "results"):
+            if isinstance(payload.get(key), list):
+                summary[key] = len(payload[key])
+        if "model" in payload:
+            summary["model"] = payload["model"]
+        if "error" in payload:
+            summary["error"] = payload["error"]
+    return json.dumps(summary, ensure_ascii=False)
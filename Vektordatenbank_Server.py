@@ -1,157 +1,1857 @@
 import os
 import shutil
 import threading #N
+import queue
+import time
+import datetime
+import uuid
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import hashlib
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+from dotenv import load_dotenv
 #import webbrowser #Kann entfernt werden, sofern die Funktion des automatischen Aufrufs bei jedem Start entfernt werden kann.
 
 #Flask Webserver
-from flask import request
+from flask import request, g
 from flask import Flask as FlaskServer
 from flask import jsonify as JsonResponse
 import json
+import re
+import logging
+from Protokollierung import setup_logging, payload_summary
 
 #Vektordatenbank
-from langchain_chroma import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain.schema import Document
-from langchain_community.document_loaders import TextLoader
-from langchain_community.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import Docx2txtLoader
-
-#Importe für das das Symbol in der Taskleiste
-from PIL import Image
-from PIL import ImageDraw
-from pystray import Icon, Menu, MenuItem
+#Die langchain/Chroma/HuggingFace Importe erfolgen erst bei der ersten Verwendung (siehe get_embedding_model, get_vector_db, iter_parse_tasks),
+#damit der Server schnell startet und das Modul ohne Wartezeit importiert werden kann.
+import numpy
+
+#Importe für das das Symbol in der Taskleiste erfolgen in create_icon/start_tray_icon.
 
 #Anforderungen um das Skript inklusive Abhängigkeiten zu starten sind der requirements.txt Datei zu entnehmen.
 #Für den Betrieb des Vektordatenservers ist die Installation von der "Visualstudio cpp build tools app" nötig
 #Für Visualstudio app install siehe https://visualstudio.microsoft.com/visual-cpp-build-tools/
 
+#Lädt die Konfiguration (.env) - Parameter des Vektorservers siehe config.env.
+load_dotenv()
+
+#Protokollierung (Level, Rotation, Format siehe Protokollierung.py). Die Logdatei wird erst beim Start des Servers eingerichtet.
+logger = logging.getLogger("Vektordatenbank_Server")
+LOG_PATH = os.getenv("SERVER_LOG_PATH", "Vektordatenbank/Vektorserver.log")
+
 #Server IP http://127.0.0.1:8000/
 #Datenordner für Vektordatenbank mit Unterordnern für übersichtlichere Datenverwaltung
-os.makedirs("Vektordatenbank", exist_ok=True)
+#Fortschritt laufender Ingestion Jobs, um nach einem Absturz fortsetzen zu können
+jobs_folder = "Vektordatenbank/jobs"
 #Chroma Datenordner
 data_folder = "Vektordatenbank/chromadb_files"
-os.makedirs(data_folder, exist_ok=True)
 #Chroma Datenbank (sqlite3 etc)
 database_folder = "Vektordatenbank/chromadb_data"
-os.makedirs(database_folder, exist_ok=True)
+#Dateien und Dokumentenprotokolle weiterer Sammlungen (je Sammlung ein Unterordner)
+collections_folder = "Vektordatenbank/collections"
+
+#Die Ordner werden bei der ersten Verwendung angelegt, nicht beim Import.
+def ensure_data_folders():
+    for folder in ("Vektordatenbank", data_folder, database_folder, jobs_folder):
+        os.makedirs(folder, exist_ok=True)
+
+#########
+#Sammlungen (Namespaces)
+#Dokumente können in getrennten, benannten Sammlungen abgelegt werden, z.B. je Projekt. Jede Sammlung hat eine eigene
+#Chroma Collection und ein eigenes Dokumentenprotokoll, Suchen betreffen nur eine Sammlung. Eine Sammlung kann gelöscht werden,
+#ohne die übrigen neu aufbauen zu müssen.
+#Die Sammlung "default" verwendet die bisherigen Pfade (chromadb_files, Dokumentenprotokoll.json und die Chroma Collection
+#von langchain), bestehende Installationen bleiben dadurch unverändert nutzbar.
+#Weitere Sammlungen: Chroma Collection "col_<Name>" in database_folder, Dateien und Protokoll unter collections/<Name>/.
+#########
+DEFAULT_COLLECTION = "default"
+collection_registry_path = "Vektordatenbank/Sammlungen.json" #Name -> {"created"}
+#Chroma erlaubt für Collections nur Buchstaben, Ziffern, "_" und "-" (Anfang und Ende Buchstabe oder Ziffer).
+COLLECTION_NAME_PATTERN = re.compile(r"^[A-Za-z0-9](?:[A-Za-z0-9_-]{0,62}[A-Za-z0-9])?$")
+
+collection_registry = None #Wird bei der ersten Verwendung geladen
+
+def get_collection_registry():
+    global collection_registry
+    if collection_registry is None:
+        with init_lock:
+            if collection_registry is None:
+                collection_registry = {}
+                if os.path.exists(collection_registry_path):
+                    with open(collection_registry_path, "r", encoding="utf-8") as f:
+                        collection_registry = json.load(f)
+    return collection_registry
+
+def save_collection_registry(): #Aufruf nur mit index_lock.
+    ensure_data_folders()
+    temp_path = collection_registry_path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(get_collection_registry(), f, ensure_ascii=False)
+    os.replace(temp_path, collection_registry_path)
+
+def collection_exists(collection):
+    return collection == DEFAULT_COLLECTION or collection in get_collection_registry()
+
+def collection_names():
+    return [DEFAULT_COLLECTION] + sorted(get_collection_registry())
+
+#Ordner der hochgeladenen Dateien einer Sammlung.
+def collection_files_folder(collection):
+    if collection == DEFAULT_COLLECTION:
+        return data_folder
+    return os.path.join(collections_folder, collection, "files")
+
+def document_index_path(collection):
+    if collection == DEFAULT_COLLECTION:
+        return past_fileuploads_path
+    return os.path.join(collections_folder, collection, "Dokumentenprotokoll.json")
 
 #Zur protokollierung bereits hochgeladener Dateien. Dopplungen von Dokumenten führen zu mehrfachen Ergebnissen - entwertet die Ergebnisse des Vektorservers.
 #Nachträglich zur Problembehebung eingeführt, da Kontextsuchergebnisse sich ständig 1:1 wiederholten.
+#Die Deduplizierung erfolgt über den SHA-256 Hash des Dateiinhalts und jedes (normalisierten) Chunks, nicht über den Dateinamen:
+#   documents: Dateiname -> {"file_hash", "chunks": [Chunk Hashes], "uploaded", "tags": [Schlagworte]}
+#   chunks:    Chunk Hash -> Anzahl der Dokumente, die diesen Chunk enthalten
+#   metadata_version: Stand der Chunk Metadaten in Chroma (siehe backfill_chunk_metadata)
+#Der Chunk Hash ist gleichzeitig die ID in Chroma, identische Chunks werden dadurch nur einmal eingebettet und gespeichert.
+#Jede Sammlung hat ein eigenes Protokoll (siehe document_index_path), dies ist das Protokoll der Sammlung "default".
 past_fileuploads_path = "Vektordatenbank/Dokumentenprotokoll.json"
 
-def load_uploaded_files(): #Lädt die Protokoll-Datei für einen Abgleich.
-    if os.path.exists(past_fileuploads_path):
-        with open(past_fileuploads_path, "r", encoding="utf-8") as f:
-            return set(json.load(f))
-    return set()
+def load_document_index(collection=DEFAULT_COLLECTION): #Lädt die Protokoll-Datei für einen Abgleich.
+    path = document_index_path(collection)
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, list):
+            #Altes Protokoll (nur Dateinamen): Die Chunks dieser Dokumente haben zufällige IDs und können nicht zugeordnet werden.
+            return {"documents": {name: {"file_hash": None, "chunks": [], "uploaded": None} for name in data}, "chunks": {}}
+        return data
+    return {"documents": {}, "chunks": {}, "metadata_version": CHUNK_METADATA_VERSION}
+
+def save_document_index(collection=DEFAULT_COLLECTION): #Speichert das vollständige Protokoll. Aufruf nur mit index_lock.
+    #Erst in temporäre Datei schreiben und dann ersetzen, damit ein Absturz das Protokoll nicht beschädigt.
+    ensure_data_folders()
+    path = document_index_path(collection)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(get_document_index(collection), f, ensure_ascii=False)
+    os.replace(temp_path, path)
+
+document_indexes = {} #Sammlung -> Protokoll, jeweils bei der ersten Verwendung geladen
+#Mehrere Ingestion Worker können gleichzeitig Dateien abschließen.
+index_lock = threading.Lock()
+
+def get_document_index(collection=DEFAULT_COLLECTION):
+    if collection not in document_indexes:
+        with init_lock:
+            if collection not in document_indexes:
+                document_indexes[collection] = load_document_index(collection)
+    return document_indexes[collection]
+#Chunk Hashes je Sammlung, die gerade von laufenden Jobs verwendet werden (Sammlung -> Hash -> Anzahl Jobs).
+#Solche Chunks werden nicht aus Chroma gelöscht, auch wenn ihr Referenzzähler zwischenzeitlich auf 0 fällt.
+inflight_chunks = {}
+#Wird bei jeder Änderung des Index (Ingestion, Löschen, Zurücksetzen) erhöht und macht zwischengespeicherte Suchergebnisse ungültig.
+index_generation = 0
+#Schützt Erhöhung und Cache-Leerung gemeinsam, da Ingestion Worker und IndexWriter gleichzeitig den Index ändern.
+generation_lock = threading.Lock()
+
+def bump_index_generation():
+    global index_generation
+    with generation_lock:
+        index_generation += 1
+        result_cache.clear()
+
+def current_index_generation():
+    with generation_lock:
+        return index_generation
+
+#Speichert ein Suchergebnis nur, wenn sich der Index seit Beginn der Suche nicht geändert hat.
+def cache_result(cache_key, generation, documents):
+    with generation_lock:
+        if generation == index_generation:
+            result_cache.put(cache_key, (generation, documents))
+
+UPLOAD_BLOCK_SIZE = 1024 * 1024
+
+#Speichert einen Upload blockweise und berechnet dabei den SHA-256 Hash, ohne die Datei vollständig im Speicher zu halten.
+def save_upload_stream(stream, target_path):
+    digest = hashlib.sha256()
+    with open(target_path, "wb") as f:
+        for block in iter(lambda: stream.read(UPLOAD_BLOCK_SIZE), b""):
+            digest.update(block)
+            f.write(block)
+    return digest.hexdigest()
+
+#Leerzeichen und Zeilenumbrüche werden vereinheitlicht, damit sich identische Textabschnitte nicht nur durch Formatierung unterscheiden.
+def chunk_sha256(text):
+    normalized = " ".join(text.split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+#Name des Dokuments mit identischem Inhalt in der Sammlung, falls vorhanden.
+def find_document_by_hash(collection, file_hash):
+    with index_lock:
+        for name, entry in get_document_index(collection)["documents"].items():
+            if entry["file_hash"] == file_hash:
+                return name
+    return None
+
+#Reserviert die Chunks eines Jobs und gibt die Hashes zurück, die noch nicht eingebettet sind.
+def reserve_chunks(collection, chunk_hashes):
+    with index_lock:
+        inflight = inflight_chunks.setdefault(collection, {})
+        for chunk_hash in chunk_hashes:
+            inflight[chunk_hash] = inflight.get(chunk_hash, 0) + 1
+        return [chunk_hash for chunk_hash in chunk_hashes if chunk_hash not in get_document_index(collection)["chunks"]]
+
+#Gibt reservierte Chunks frei und liefert die Chunks, die von keinem Dokument und keinem Job mehr verwendet werden. Aufruf nur mit index_lock.
+def release_chunks(collection, chunk_hashes):
+    orphaned = []
+    inflight = inflight_chunks.setdefault(collection, {})
+    for chunk_hash in chunk_hashes:
+        inflight[chunk_hash] -= 1
+        if inflight[chunk_hash] <= 0:
+            del inflight[chunk_hash]
+            if chunk_hash not in get_document_index(collection)["chunks"]:
+                orphaned.append(chunk_hash)
+    return orphaned
+
+#########
+#Chunk Metadaten
+#Jeder Chunk wird in Chroma mit content_hash, source (Dokument, mit dem er zuerst gespeichert wurde), page (nur PDF, ab 1),
+#uploaded_at und updated_at (Unix Zeit) gespeichert. Da ein Chunk in mehreren Dokumenten vorkommen kann, erhält er zusätzlich
+#je Dokument einen Schlüssel "src_<Hash des Dateinamens>": True und je Schlagwort seiner Dokumente "tag_<Hash des Schlagworts>": True.
+#Filter werden auf diese Schlüssel abgebildet und als "where" Bedingung direkt in der Chroma Suche angewendet, nicht nachträglich
+#auf die Treffer: Schlagworte direkt über die Schlagwort-Schlüssel, Dokumente und Zeitraum über die Dokument-Schlüssel.
+#########
+CHUNK_METADATA_VERSION = 2 #1: Dokument-Schlüssel und content_hash, 2: Schlagwort-Schlüssel
+METADATA_BATCH_SIZE = 1000 #Chunks je Metadaten-Aktualisierung in Chroma
+
+def source_key(filename):
+    return "src_" + hashlib.sha256(filename.encode("utf-8")).hexdigest()[:16]
 
-def save_uploaded_files(): #Speichert die neue vollständige Liste zur Datei.
-    with open(past_fileuploads_path, "w", encoding="utf-8") as f:
-        json.dump(list(uploaded_files), f, ensure_ascii=False, indent=2)
+def tag_key(tag):
+    return "tag_" + hashlib.sha256(tag.encode("utf-8")).hexdigest()[:16]
 
-uploaded_files = load_uploaded_files()
+#Setzt (True) bzw. entfernt (None) den Dokument-Schlüssel einer Datei an den angegebenen Chunks. Aufruf nur mit index_lock.
+def set_source_flag(collection, filename, chunk_hashes, present):
+    key = source_key(filename)
+    now = int(time.time())
+    chunk_hashes = list(chunk_hashes)
+    for start in range(0, len(chunk_hashes), METADATA_BATCH_SIZE):
+        batch = chunk_hashes[start:start + METADATA_BATCH_SIZE]
+        index_update_metadata(collection, batch, [{key: True if present else None, "updated_at": now} for _ in batch])
 
-#Flask - API Interaktion (Entwicklungsserver - Sollte ersetzt werden laut Konsole durch einen WSGI Produktionsserver)
+#Setzt die Schlagwort-Schlüssel an den angegebenen Chunks. Aufruf nur mit index_lock.
+def set_tag_flags(collection, tags, chunk_hashes):
+    if not tags:
+        return
+    flags = {tag_key(tag): True for tag in tags}
+    chunk_hashes = list(chunk_hashes)
+    for start in range(0, len(chunk_hashes), METADATA_BATCH_SIZE):
+        batch = chunk_hashes[start:start + METADATA_BATCH_SIZE]
+        index_update_metadata(collection, batch, [dict(flags) for _ in batch])
+
+#Entfernt an den angegebenen Chunks die Schlagwort-Schlüssel, die kein Dokument im Protokoll, das den Chunk enthält, mehr trägt.
+#Aufruf nur mit index_lock, nachdem das Protokoll aktualisiert wurde.
+def refresh_tag_flags(collection, tags, chunk_hashes):
+    index = get_document_index(collection)
+    remaining = {chunk_hash: set(tags) for chunk_hash in chunk_hashes if chunk_hash in index["chunks"]}
+    if not tags or not remaining:
+        return
+    for entry in index["documents"].values():
+        shared_tags = set(entry.get("tags") or []) & set(tags)
+        if not shared_tags:
+            continue
+        for chunk_hash in remaining.keys() & set(entry["chunks"]):
+            remaining[chunk_hash] -= shared_tags
+    chunk_ids = [chunk_hash for chunk_hash, stale_tags in remaining.items() if stale_tags]
+    for start in range(0, len(chunk_ids), METADATA_BATCH_SIZE):
+        batch = chunk_ids[start:start + METADATA_BATCH_SIZE]
+        index_update_metadata(collection, batch, [{tag_key(tag): None for tag in remaining[chunk_hash]} for chunk_hash in batch])
+
+#Chunks, deren "source" auf ein entferntes Dokument (bzw. die ersetzte Version) zeigt, erhalten ein anderes Dokument, das sie
+#weiterhin enthält, als "source" - ohne Seitenangabe. Aufruf nur mit index_lock, nachdem das Protokoll aktualisiert wurde.
+def reassign_chunk_sources(collection, filename, chunk_hashes):
+    chunk_hashes = list(chunk_hashes)
+    chroma_collection = get_collection(collection)
+    affected = set()
+    for start in range(0, len(chunk_hashes), METADATA_BATCH_SIZE):
+        result = chroma_collection.get(ids=chunk_hashes[start:start + METADATA_BATCH_SIZE], include=["metadatas"])
+        affected.update(chunk_id for chunk_id, metadata in zip(result["ids"], result["metadatas"]) if (metadata or {}).get("source") == filename)
+    if not affected:
+        return
+    new_sources = {}
+    for name, entry in get_document_index(collection)["documents"].items():
+        if name == filename:
+            continue
+        for chunk_hash in affected.intersection(entry["chunks"]):
+            new_sources.setdefault(chunk_hash, name)
+        if len(new_sources) == len(affected):
+            break
+    chunk_ids = list(new_sources)
+    for start in range(0, len(chunk_ids), METADATA_BATCH_SIZE):
+        batch = chunk_ids[start:start + METADATA_BATCH_SIZE]
+        index_update_metadata(collection, batch, [{"source": new_sources[chunk_hash], "page": None} for chunk_hash in batch])
+
+#Chunks, die mit einem älteren Stand der Metadaten gespeichert wurden, erhalten einmalig die fehlenden Schlüssel:
+#Dokument-Schlüssel und content_hash (nur "default", vor Version 1) sowie die Schlagwort-Schlüssel (Version 2).
+def backfill_chunk_metadata():
+    for collection in collection_names():
+        with index_lock:
+            index = get_document_index(collection)
+            version = index.get("metadata_version", 0)
+            if version >= CHUNK_METADATA_VERSION:
+                continue
+            for filename, entry in index["documents"].items():
+                if version < 1:
+                    set_source_flag(collection, filename, entry["chunks"], True)
+                    for start in range(0, len(entry["chunks"]), METADATA_BATCH_SIZE):
+                        batch = entry["chunks"][start:start + METADATA_BATCH_SIZE]
+                        index_update_metadata(collection, batch, [{"content_hash": chunk_hash} for chunk_hash in batch])
+                set_tag_flags(collection, entry.get("tags") or [], entry["chunks"])
+            index["metadata_version"] = CHUNK_METADATA_VERSION
+            save_document_index(collection)
+            bump_index_generation()
+        logger.info("Chunk Metadaten der Sammlung %s für %d Dokumente ergänzt.", collection, len(index["documents"]))
+
+#Verringert die Referenzzähler der Chunks eines Dokuments und liefert die Chunks, die nun von keinem Dokument und keinem Job
+#mehr verwendet werden. Aufruf nur mit index_lock.
+def dereference_chunks(collection, chunk_hashes):
+    chunk_refs = get_document_index(collection)["chunks"]
+    stale = []
+    for chunk_hash in chunk_hashes:
+        chunk_refs[chunk_hash] = chunk_refs.get(chunk_hash, 1) - 1
+        if chunk_refs[chunk_hash] <= 0:
+            del chunk_refs[chunk_hash]
+            if chunk_hash not in inflight_chunks.get(collection, {}):
+                stale.append(chunk_hash)
+    return stale
+
+#Trägt ein (neues oder geändertes) Dokument ins Protokoll ein und entfernt nicht mehr verwendete Chunks aus Chroma.
+#Die Dokument-Schlüssel der hinzugekommenen Chunks werden gesetzt, die der nicht mehr enthaltenen (aber weiter verwendeten) entfernt.
+#Rückgabe: Anzahl der entfernten Chunks.
+def commit_document(collection, filename, file_hash, chunk_hashes, tags=None):
+    with index_lock:
+        index = get_document_index(collection)
+        chunk_refs = index["chunks"]
+        old_entry = index["documents"].get(filename)
+        old_hashes = set(old_entry["chunks"]) if old_entry else set()
+        old_tags = set(old_entry.get("tags") or []) if old_entry else set()
+        new_hashes = set(chunk_hashes)
+        if tags is None: #Ohne Angabe bleiben die Schlagworte einer früheren Version erhalten, [] entfernt sie.
+            tags = sorted(old_tags)
+
+        #Auch bereits vorhandene Chunks (aus anderen Dokumenten) sind nun Teil dieses Dokuments.
+        #Vor den Änderungen am Protokoll, damit ein Fehler hier das Protokoll unverändert lässt.
+        set_source_flag(collection, filename, new_hashes - old_hashes, True)
+        #Bei geänderten Schlagworten erhalten alle Chunks des Dokuments die Schlagwort-Schlüssel, sonst nur die hinzugekommenen.
+        set_tag_flags(collection, tags, new_hashes if set(tags) != old_tags else new_hashes - old_hashes)
+
+        for chunk_hash in new_hashes - old_hashes:
+            chunk_refs[chunk_hash] = chunk_refs.get(chunk_hash, 0) + 1
+        stale = dereference_chunks(collection, old_hashes - new_hashes)
+        still_used = [chunk_hash for chunk_hash in old_hashes - new_hashes if chunk_hash in chunk_refs]
+        index["documents"][filename] = {"file_hash": file_hash, "chunks": list(chunk_hashes), "uploaded": time.time(), "tags": tags}
+
+        if stale:
+            index_delete(collection, stale)
+        set_source_flag(collection, filename, still_used, False)
+        reassign_chunk_sources(collection, filename, still_used)
+        refresh_tag_flags(collection, old_tags, still_used)
+        refresh_tag_flags(collection, old_tags - set(tags), new_hashes & old_hashes)
+        save_document_index(collection)
+        bump_index_generation()
+    return len(stale)
+
+#Ändert nur die Schlagworte eines Dokuments, dessen Inhalt unverändert ist. Rückgabe: False, falls sie bereits übereinstimmen.
+def update_document_tags(collection, filename, tags):
+    with index_lock:
+        entry = get_document_index(collection)["documents"][filename]
+        old_tags = set(entry.get("tags") or [])
+        if set(tags) == old_tags:
+            return False
+        set_tag_flags(collection, tags, entry["chunks"])
+        entry["tags"] = list(tags)
+        refresh_tag_flags(collection, old_tags - set(tags), entry["chunks"])
+        save_document_index(collection)
+        bump_index_generation()
+    return True
+
+#Entfernt ein Dokument aus dem Protokoll. Nur Chunks, die in keinem anderen Dokument vorkommen, werden aus Chroma gelöscht,
+#bei den übrigen wird lediglich der Dokument-Schlüssel entfernt. Die gespeicherte Datei wird ebenfalls gelöscht.
+#Rückgabe: Anzahl der entfernten Chunks bzw. None, falls das Dokument nicht im Protokoll steht.
+def remove_document(collection, filename):
+    with index_lock:
+        index = get_document_index(collection)
+        entry = index["documents"].pop(filename, None)
+        if entry is None:
+            return None
+        stale = dereference_chunks(collection, set(entry["chunks"]))
+        if stale:
+            index_delete(collection, stale)
+        still_used = [chunk_hash for chunk_hash in entry["chunks"] if chunk_hash in index["chunks"]]
+        set_source_flag(collection, filename, still_used, False)
+        reassign_chunk_sources(collection, filename, still_used)
+        refresh_tag_flags(collection, entry.get("tags") or [], still_used)
+        save_document_index(collection)
+        bump_index_generation()
+        file_path = os.path.join(collection_files_folder(collection), filename)
+        if os.path.exists(file_path):
+            os.remove(file_path)
+    return len(stale)
+
+#Gibt die reservierten Chunks eines Jobs frei (nach commit_document bzw. nach einem Fehler) und entfernt bereits eingebettete,
+#aber von keinem Dokument verwendete Chunks. Je Job genau einmal aufrufen. Rückgabe: Anzahl der entfernten Chunks.
+def release_document_chunks(collection, chunk_hashes):
+    with index_lock:
+        orphaned = release_chunks(collection, chunk_hashes)
+        if orphaned:
+            index_delete(collection, orphaned)
+            bump_index_generation()
+    return len(orphaned)
+
+#Flask - API Interaktion
+#Im Produktionsmodus (SERVER_MODE=production) wird die Anwendung über den WSGI Server waitress mit mehreren Threads betrieben,
+#im Entwicklungsmodus über den Flask Entwicklungsserver. Siehe start_server.
 server = FlaskServer(__name__)
 
+SERVER_MODE = os.getenv("SERVER_MODE", "production").lower()  #production oder development
+SERVER_HOST = os.getenv("SERVER_HOST", "127.0.0.1")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8000"))
+SERVER_THREADS = int(os.getenv("SERVER_THREADS", "8"))          #Parallele Anfragen im Produktionsmodus
+
+#Einbettung in festen Batches: begrenzt den Speicherbedarf bei großen Dokumenten und lässt den Durchsatz einstellen.
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+#Anzahl der CPU Threads für das Embedding Modell. 0 = Standardwert von PyTorch (alle Kerne).
+EMBED_THREADS = int(os.getenv("EMBED_THREADS", "0"))
+
+def configure_embedding_threads():
+    if EMBED_THREADS > 0:
+        import torch #Wird von sentence-transformers/HuggingFaceEmbeddings mitinstalliert.
+        torch.set_num_threads(EMBED_THREADS)
+
+#########
+#Metriken
+#/metrics liefert Zähler, Messwerte und Latenz-Histogramme im Prometheus Textformat, z.B. für Dashboards und Alarme auf p99 Latenzen
+#(histogram_quantile in Prometheus). Zähler und Histogramme werden beim Auftreten erfasst, Messwerte mit function=... erst beim Abruf berechnet.
+#########
+
+#Obergrenzen der Histogramm-Buckets in Sekunden
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+metrics_registry = []
+
+class Metric:
+    kind = "untyped"
+
+    #function: liefert beim Abruf einen Wert oder ein Dictionary {Label-Werte (Tupel): Wert}.
+    def __init__(self, name, description, labels=(), function=None):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.function = function
+        self.values = {}
+        self.lock = threading.Lock()
+        metrics_registry.append(self)
+
+    def label_text(self, label_values, extra=()):
+        pairs = list(zip(self.labels, label_values)) + list(extra)
+        if not pairs:
+            return ""
+        escaped = (str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for _, value in pairs)
+        return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+    def samples(self):
+        if self.function is not None:
+            values = self.function()
+            return values if isinstance(values, dict) else {(): values}
+        with self.lock:
+            return dict(self.values)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+        for label_values, value in sorted(self.samples().items()):
+            lines.append(f"{self.name}{self.label_text(label_values)} {value}")
+        return lines
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *label_values, amount=1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def inc(self, *label_values, amount=1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def dec(self, *label_values, amount=1):
+        self.inc(*label_values, amount=-amount)
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, description, labels=(), buckets=METRICS_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = buckets
 
+    def observe(self, value, *label_values):
+        with self.lock:
+            counts = self.values.get(label_values)
+            if counts is None:
+                counts = self.values[label_values] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, upper_bound in enumerate(self.buckets):
+                if value <= upper_bound:
+                    counts["buckets"][i] += 1
+                    break
+            counts["sum"] += value
+            counts["count"] += 1
+
+    #Misst die Dauer des with-Blocks.
+    @contextmanager
+    def time(self, *label_values):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.observe(time.time() - start, *label_values)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            values = {label_values: {"buckets": list(counts["buckets"]), "sum": counts["sum"], "count": counts["count"]}
+                      for label_values, counts in self.values.items()}
+        for label_values, counts in sorted(values.items()):
+            cumulative = 0
+            for upper_bound, bucket_count in zip(self.buckets, counts["buckets"]):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{self.label_text(label_values, [('le', upper_bound)])} {cumulative}")
+            lines.append(f"{self.name}_bucket{self.label_text(label_values, [('le', '+Inf')])} {counts['count']}")
+            lines.append(f"{self.name}_sum{self.label_text(label_values)} {round(counts['sum'], 6)}")
+            lines.append(f"{self.name}_count{self.label_text(label_values)} {counts['count']}")
+        return lines
+
+def render_metrics():
+    lines = []
+    for metric in metrics_registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+#HTTP Schicht - Label "endpoint" ist die Route (z.B. /jobs/<job_id>), nicht die konkrete URL.
+http_requests_total = Counter("vectordb_http_requests_total", "HTTP Anfragen nach Route, Methode und Statuscode.", ("endpoint", "method", "status"))
+http_request_seconds = Histogram("vectordb_http_request_duration_seconds", "Bearbeitungsdauer von HTTP Anfragen.", ("endpoint",))
+http_requests_in_flight = Gauge("vectordb_http_requests_in_flight", "Aktuell bearbeitete HTTP Anfragen.", ("endpoint",))
+#Anfragen
+ask_seconds = Histogram("vectordb_ask_duration_seconds", "Gesamtdauer von /ask, getrennt nach Treffer im Ergebniscache.", ("cache",))
+query_embedding_seconds = Histogram("vectordb_query_embedding_seconds", "Einbettung der Frage(n) je Anfrage.", ("endpoint",))
+search_seconds = Histogram("vectordb_search_seconds", "Suche in Chroma je Anfrage.", ("endpoint",))
+#Ingestion - Dauer je Dokument. parse und split sind die summierte Rechenzeit in den Parse Prozessen.
+ingest_stage_seconds = Histogram("vectordb_ingest_stage_seconds", "Dauer der Ingestion Schritte je Dokument (parse, split, embed, insert).", ("stage",))
+ingest_document_seconds = Histogram("vectordb_ingest_document_seconds", "Gesamtdauer der Verarbeitung je Dokument.")
+ingest_documents_total = Counter("vectordb_ingest_documents_total", "Verarbeitete Dokumente nach Ergebnis.", ("result",))
+chunks_ingested_total = Counter("vectordb_chunks_ingested_total", "Neu eingebettete und gespeicherte Chunks.")
+
+def request_endpoint_label():
+    return request.url_rule.rule if request.url_rule is not None else "unbekannt"
+
+@server.before_request
+def metrics_before_request():
+    g.metrics_start = time.time()
+    g.metrics_endpoint = request_endpoint_label()
+    http_requests_in_flight.inc(g.metrics_endpoint)
+
+@server.after_request
+def metrics_after_request(response):
+    if "metrics_start" in g:
+        http_request_seconds.observe(time.time() - g.metrics_start, g.metrics_endpoint)
+        http_requests_total.inc(g.metrics_endpoint, request.method, str(response.status_code))
+        logger.debug("%s %s %d %.1f ms", request.method, request.path, response.status_code, (time.time() - g.metrics_start) * 1000)
+    return response
+
+@server.teardown_request
+def metrics_teardown_request(error=None):
+    if "metrics_endpoint" in g:
+        http_requests_in_flight.dec(g.metrics_endpoint)
+
+#########
+#Persistenter Embedding Cache
+#Beim Neuaufbau der Datenbank oder erneutem Hochladen werden unveränderte Chunks nicht erneut durch das Modell berechnet,
+#sondern aus dem Cache gelesen. Schlüssel ist (Modellname, Hash des normalisierten Textes).
+#Ablage kompakt als memory-mapped Arrays je Modell:
+#   vectors.bin  capacity x dim Vektoren (float16 oder float32)
+#   keys.bin     capacity x 32 Byte SHA-256 des Textes je Slot - dient der Prüfung und dem Wiederaufbau des Index beim Start
+#   ticks.bin    capacity x uint64 Zeitpunkt der letzten Verwendung je Slot für die LRU Verdrängung
+#########
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "200000"))   #Maximale Anzahl Vektoren im Cache, 0 = Cache deaktiviert
+EMBEDDING_CACHE_DTYPE = os.getenv("EMBEDDING_CACHE_DTYPE", "float16")     #float16 halbiert den Platzbedarf, float32 ist verlustfrei
+embedding_cache_folder = "Vektordatenbank/embedding_cache"
+
+class EmbeddingCache:
+    def __init__(self, folder, model_name, capacity, dtype):
+        self.folder = os.path.join(folder, "".join(c if c.isalnum() or c in "-_." else "_" for c in model_name))
+        self.model_name = model_name
+        self.capacity = capacity
+        self.dtype = numpy.dtype(dtype)
+        self.lock = threading.Lock()
+        self.slots = {}       #Hash (bytes) -> Slot, sortiert nach letzter Verwendung (älteste zuerst)
+        self.tick = 0
+        self.vectors = None   #Wird mit der ersten Dimension angelegt
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(self.folder, exist_ok=True)
+        self.open_existing()
+
+    def path(self, name):
+        return os.path.join(self.folder, name)
+
+    #Öffnet einen vorhandenen Cache und baut den Index aus keys.bin und ticks.bin wieder auf.
+    def open_existing(self):
+        meta_path = self.path("meta.json")
+        if not os.path.exists(meta_path):
+            return
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("model") != self.model_name or meta.get("capacity") != self.capacity or meta.get("dtype") != self.dtype.name:
+            logger.warning("Embedding Cache Konfiguration geändert - Cache wird neu angelegt.")
+            return
+        self.create_arrays(meta["dim"], mode="r+")
+        used = numpy.flatnonzero(self.ticks)
+        for slot in used[numpy.argsort(self.ticks[used])]:
+            self.slots[self.keys[slot].tobytes()] = int(slot)
+        self.tick = int(self.ticks.max()) if len(used) else 0
+        logger.info("Embedding Cache geladen: %d Vektoren.", len(self.slots))
+
+    def create_arrays(self, dim, mode):
+        self.dim = dim
+        self.vectors = numpy.memmap(self.path("vectors.bin"), dtype=self.dtype, mode=mode, shape=(self.capacity, dim))
+        self.keys = numpy.memmap(self.path("keys.bin"), dtype=numpy.uint8, mode=mode, shape=(self.capacity, 32))
+        self.ticks = numpy.memmap(self.path("ticks.bin"), dtype=numpy.uint64, mode=mode, shape=(self.capacity,))
+        if mode == "w+":
+            with open(self.path("meta.json"), "w", encoding="utf-8") as f:
+                json.dump({"model": self.model_name, "dim": dim, "capacity": self.capacity, "dtype": self.dtype.name}, f)
+
+    #Liefert für jeden Schlüssel den Vektor oder None.
+    def get_many(self, keys):
+        results = []
+        with self.lock:
+            for key in keys:
+                slot = self.slots.pop(key, None)
+                if slot is None:
+                    self.misses += 1
+                    results.append(None)
+                    continue
+                self.slots[key] = slot #Ans Ende verschieben (zuletzt verwendet)
+                self.tick += 1
+                self.ticks[slot] = self.tick
+                self.hits += 1
+                results.append(self.vectors[slot].astype(numpy.float32).tolist())
+        return results
+
+    def put_many(self, keys, vectors):
+        with self.lock:
+            if self.vectors is None:
+                self.create_arrays(len(vectors[0]), mode="w+")
+            for key, vector in zip(keys, vectors):
+                slot = self.slots.pop(key, None)
+                if slot is None:
+                    if len(self.slots) < self.capacity:
+                        slot = len(self.slots)
+                    else:
+                        #Cache voll - am längsten nicht verwendeten Eintrag verdrängen.
+                        oldest_key = next(iter(self.slots))
+                        slot = self.slots.pop(oldest_key)
+                        self.evictions += 1
+                self.slots[key] = slot
+                self.tick += 1
+                self.vectors[slot] = vector
+                self.keys[slot] = numpy.frombuffer(key, dtype=numpy.uint8)
+                self.ticks[slot] = self.tick
+
+    #Schreibt geänderte Seiten auf die Festplatte (z.B. nach Abschluss eines Ingestion Jobs).
+    def flush(self):
+        with self.lock:
+            if self.vectors is not None:
+                self.vectors.flush()
+                self.keys.flush()
+                self.ticks.flush()
+
+    def stats(self):
+        with self.lock:
+            return {"entries": len(self.slots), "capacity": self.capacity, "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+#Einfacher threadsicherer LRU Cache im Arbeitsspeicher mit Treffer-Statistik.
+class LRUCache:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        if self.capacity <= 0:
+            return
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            return {"entries": len(self.entries), "capacity": self.capacity, "hits": self.hits, "misses": self.misses}
+
+#Anfragen werden häufig wiederholt (z.B. gleiche Frage an andere Modelle, "Anfrage behalten" in der GUI).
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024")) #Anzahl Anfrage-Vektoren im Arbeitsspeicher
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "1024"))                   #Anzahl zwischengespeicherter Suchergebnisse
+#(Frage, max_results, token_budget, Dokumentfilter, Sammlung) -> (Index Generation, Dokumente)
+result_cache = LRUCache(RESULT_CACHE_SIZE)
+
+#Einfaches Embedding ohne Modell: Wörter werden per Hash auf Dimensionen verteilt (Feature Hashing).
+#Nur für Tests und Benchmarks ohne Internetverbindung (EMBEDDING_MODEL=hash oder hash:<Dimension>), die Suchqualität ist gering.
+class HashEmbeddings:
+    def __init__(self, dimension=384):
+        self.dimension = dimension
+
+    def embed_query(self, text):
+        vector = numpy.zeros(self.dimension, dtype=numpy.float32)
+        for word in text.lower().split():
+            vector[int.from_bytes(hashlib.md5(word.encode("utf-8")).digest()[:4], "little") % self.dimension] += 1.0
+        norm = numpy.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+#Wrapper um das Embedding Modell, der Dokument- und Anfrage-Einbettungen über den Cache beantwortet.
+#Implementiert die Schnittstelle der langchain Embeddings (embed_documents/embed_query), die Chroma erwartet.
+class CachedEmbeddings:
+    def __init__(self, model, cache):
+        self.model = model
+        self.cache = cache
+        self.query_cache = LRUCache(QUERY_EMBEDDING_CACHE_SIZE)
+
+    @staticmethod
+    def cache_key(text, kind):
+        #Anfragen und Dokumente getrennt, da manche Modelle unterschiedliche Präfixe für beide verwenden.
+        normalized = " ".join(text.split())
+        return hashlib.sha256(f"{kind}\0{normalized}".encode("utf-8")).digest()
+
+    def embed_documents(self, texts):
+        if self.cache is None:
+            return self.model.embed_documents(texts)
+        keys = [self.cache_key(text, "document") for text in texts]
+        vectors = self.cache.get_many(keys)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            computed = self.model.embed_documents([texts[i] for i in missing])
+            self.cache.put_many([keys[i] for i in missing], computed)
+            for i, vector in zip(missing, computed):
+                vectors[i] = vector
+        return vectors
+
+    def embed_query(self, text):
+        #Zuerst im Arbeitsspeicher, dann im persistenten Cache nachsehen.
+        vector = self.query_cache.get(text)
+        if vector is not None:
+            return vector
+        if self.cache is None:
+            vector = self.model.embed_query(text)
+        else:
+            key = self.cache_key(text, "query")
+            vector = self.cache.get_many([key])[0]
+            if vector is None:
+                vector = self.model.embed_query(text)
+                self.cache.put_many([key], [vector])
+        self.query_cache.put(text, vector)
+        return vector
+
+    #Bettet mehrere Anfragen ein. Nicht zwischengespeicherte Anfragen werden gemeinsam in einem Durchlauf des Modells berechnet.
+    #HuggingFaceEmbeddings verwendet für Anfragen und Dokumente dieselbe Kodierung, daher kann embed_documents genutzt werden.
+    def embed_queries(self, texts):
+        vectors = [self.query_cache.get(text) for text in texts]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing and self.cache is not None:
+            keys = [self.cache_key(texts[i], "query") for i in missing]
+            for i, vector in zip(missing, self.cache.get_many(keys)):
+                vectors[i] = vector
+            missing = [i for i in missing if vectors[i] is None]
+        if missing:
+            unique_texts = list(dict.fromkeys(texts[i] for i in missing)) #Doppelte Fragen nur einmal berechnen
+            computed = dict(zip(unique_texts, self.model.embed_documents(unique_texts)))
+            if self.cache is not None:
+                self.cache.put_many([self.cache_key(text, "query") for text in unique_texts], list(computed.values()))
+            for i in missing:
+                vectors[i] = computed[texts[i]]
+        for text, vector in zip(texts, vectors):
+            self.query_cache.put(text, vector)
+        return vectors
+
+#########
+#Verzögerte Initialisierung
+#Embedding Modell und Chroma werden erst bei der ersten Verwendung geladen bzw. beim Serverstart im Hintergrund (WARMUP_ON_START).
+#Der Server nimmt dadurch sofort Verbindungen an, /ready meldet, sobald Modell und Index bereit sind.
+#########
+WARMUP_ON_START = os.getenv("WARMUP_ON_START", "true").lower() == "true"
+
+init_lock = threading.RLock() #RLock, da get_vector_db das Embedding Modell lädt
+embedding_cache = None
+embedding_model = None
 #Globale Variable für die Vektordatenbank
 vector_db = None
-#Aus langchain.embeddings Bibliothek Modell zur semantischen Erfassung - vortrainierter Transformer
-embedding_model = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+
+def get_embedding_model():
+    global embedding_model, embedding_cache
+    if embedding_model is None:
+        with init_lock:
+            if embedding_model is None:
+                ensure_data_folders()
+                if EMBEDDING_CACHE_SIZE > 0:
+                    embedding_cache = EmbeddingCache(embedding_cache_folder, EMBEDDING_MODEL_NAME, EMBEDDING_CACHE_SIZE, EMBEDDING_CACHE_DTYPE)
+                if EMBEDDING_MODEL_NAME.startswith("hash"):
+                    model = HashEmbeddings(int(EMBEDDING_MODEL_NAME.partition(":")[2] or "384"))
+                else:
+                    #Aus langchain.embeddings Bibliothek Modell zur semantischen Erfassung - vortrainierter Transformer
+                    from langchain_huggingface import HuggingFaceEmbeddings
+                    configure_embedding_threads()
+                    model = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME, encode_kwargs={"batch_size": EMBED_BATCH_SIZE})
+                embedding_model = CachedEmbeddings(model, embedding_cache)
+                logger.info("Embedding Modell %s geladen.", EMBEDDING_MODEL_NAME)
+    return embedding_model
+
+def get_vector_db():
+    global vector_db
+    if vector_db is None:
+        with init_lock:
+            if vector_db is None:
+                from langchain_chroma import Chroma
+                ensure_data_folders()
+                #Datenbank erzeugen/laden
+                vector_db = Chroma(persist_directory=database_folder, embedding_function=get_embedding_model())
+                logger.info("Chroma Vektordatenbank geladen.")
+    return vector_db
+
+#Chroma Collections der Sammlungen außer "default" (Sammlung -> Collection)
+chroma_collections = {}
+
+#Chroma Collection einer Sammlung. "default" ist die Collection von langchain (get_vector_db), weitere Sammlungen
+#verwenden denselben Chroma Client. Die Vektoren werden immer vorab berechnet übergeben, daher ohne Embedding Funktion.
+#Nur create_collection legt die Chroma Collection an (create=True), damit eine gerade gelöschte Sammlung nicht neu entsteht.
+def get_collection(collection, create=False):
+    if collection == DEFAULT_COLLECTION:
+        return get_vector_db()._collection
+    if collection not in chroma_collections:
+        if not create and not collection_exists(collection):
+            raise KeyError(f"Sammlung '{collection}' existiert nicht.")
+        with init_lock:
+            if collection not in chroma_collections:
+                chroma_collections[collection] = get_vector_db()._client.get_or_create_collection(f"col_{collection}", embedding_function=None)
+    return chroma_collections[collection]
+
+def is_ready():
+    return embedding_model is not None and vector_db is not None
+
+#Lädt Modell und Index im Hintergrund, damit die erste Anfrage nicht darauf warten muss.
+def warm_up():
+    try:
+        get_vector_db()
+        backfill_chunk_metadata()
+    except Exception as e:
+        logger.exception("Fehler beim Laden der Vektordatenbank: %s", e)
+
+#########
+#Einziger Schreiber für den Index
+#Anfragen (/ask) lesen parallel aus Chroma. Alle schreibenden Zugriffe (Hinzufügen und Löschen von Chunks) laufen dagegen
+#nacheinander über einen eigenen Thread, damit parallele Ingestion Jobs den persistierten Index nicht beschädigen.
+#Die Einbettung selbst findet weiterhin parallel in den Ingestion Workern statt, nur das Schreiben ist serialisiert.
+#########
+class IndexWriter:
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    #Reiht eine Schreiboperation ein und gibt ein Future für das Ergebnis zurück.
+    def submit(self, operation, *args, **kwargs):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="Index-Schreiber", daemon=True)
+                self.thread.start()
+        future = Future()
+        self.queue.put((future, operation, args, kwargs))
+        return future
+
+    def run(self):
+        while True:
+            future, operation, args, kwargs = self.queue.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(operation(*args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+
+    def pending(self):
+        return self.queue.qsize()
+
+index_writer = IndexWriter()
+
+#add statt upsert: Ein Chunk, den ein paralleler Job bereits gespeichert hat, wird nicht ersetzt und behält dadurch seine Metadaten.
+def index_add(collection, ids, embeddings, documents, metadatas):
+    chroma_collection = get_collection(collection)
+    return index_writer.submit(chroma_collection.add, ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas).result()
+
+#Ergänzt die Metadaten der Chunks (vorhandene Schlüssel bleiben erhalten, None entfernt einen Schlüssel).
+def index_update_metadata(collection, ids, metadatas):
+    chroma_collection = get_collection(collection)
+    return index_writer.submit(chroma_collection.update, ids=ids, metadatas=metadatas).result()
+
+def index_delete(collection, ids):
+    chroma_collection = get_collection(collection)
+    return index_writer.submit(chroma_collection.delete, ids=ids).result()
+
+#Legt eine neue, leere Sammlung an. Rückgabe: False, falls sie bereits existiert.
+def create_collection(collection):
+    with index_lock:
+        if collection_exists(collection):
+            return False
+        get_collection(collection, create=True)
+        os.makedirs(collection_files_folder(collection), exist_ok=True)
+        get_collection_registry()[collection] = {"created": time.time()}
+        save_collection_registry()
+    logger.info("Sammlung %s angelegt.", collection)
+    return True
+
+#Löscht eine Sammlung mit Chroma Collection, Protokoll und hochgeladenen Dateien. Andere Sammlungen bleiben unverändert.
+def drop_collection(collection):
+    with index_lock:
+        chroma_name = get_collection(collection).name
+        index_writer.submit(get_vector_db()._client.delete_collection, chroma_name).result()
+        with init_lock:
+            chroma_collections.pop(collection, None)
+            document_indexes.pop(collection, None)
+        inflight_chunks.pop(collection, None)
+        shutil.rmtree(os.path.join(collections_folder, collection), ignore_errors=True)
+        del get_collection_registry()[collection]
+        save_collection_registry()
+        bump_index_generation()
+    logger.info("Sammlung %s gelöscht.", collection)
 
 #Bitte ändern, falls in der Zukunft die Datenbank jedes Mal neu aufgebaut werden soll.
+#reset_db leert nur die Sammlung "default", weitere Sammlungen werden über drop_collection einzeln gelöscht.
 def initialize_database(reset_db=False):
     global vector_db
 
     if reset_db:
-        #Zurücksetzen der Vektordatenbank.
-        shutil.rmtree(database_folder, ignore_errors=True)
-        #Ordner erneut erstellen.
-        os.makedirs(database_folder, exist_ok=True)
-        print("Vektordatenbank wurde zurückgesetzt.")
+        with index_lock, init_lock: #Reihenfolge wie in commit_document: erst index_lock, dann init_lock
+            #Zurücksetzen der Vektordatenbank. Das Dokumentenprotokoll wird ebenfalls geleert, da es sonst auf nicht mehr vorhandene Chunks verweist.
+            index_writer.submit(get_vector_db().delete_collection).result()
+            vector_db = None
+            document_indexes[DEFAULT_COLLECTION] = {"documents": {}, "chunks": {}, "metadata_version": CHUNK_METADATA_VERSION}
+            inflight_chunks.pop(DEFAULT_COLLECTION, None)
+            save_document_index(DEFAULT_COLLECTION)
+            bump_index_generation()
+        logger.info("Vektordatenbank wurde zurückgesetzt.")
 
-    if vector_db is None:
-        #Datenbank erzeugen/laden
-        vector_db = Chroma(persist_directory=database_folder, embedding_function=embedding_model)
-        print("Chroma Vektordatenbank geladen.")
+    get_vector_db()
+
+#########
+#Ingestion Jobs
+#Das Einlesen, Aufteilen und Einbetten großer Dokumente dauert teilweise Minuten. Damit die HTTP Anfrage nicht so lange blockiert,
+#speichert /upload nur die Datei und legt einen Job in die Warteschlange. Hintergrund-Worker verarbeiten die Jobs,
+#der Fortschritt kann über /jobs/<id> abgefragt werden.
+#Dokumente werden abschnittsweise verarbeitet (PDF: Seite, DOCX/TXT: Textblock), jeder Abschnitt wird aufgeteilt, eingebettet
+#und gespeichert, bevor der nächste gelesen wird. Der Speicherbedarf hängt dadurch nicht von der Dokumentgröße ab.
+#Nach jedem Abschnitt wird der Fortschritt in Vektordatenbank/jobs/<id>.progress.jsonl festgehalten. Nach einem Absturz
+#werden unterbrochene Jobs beim Start ab dem ersten nicht abgeschlossenen Abschnitt fortgesetzt.
+#########
+#Einlesen und Aufteilen der Dokumente ist reiner Python Code und durch den GIL auf einen Kern begrenzt.
+#Es läuft deshalb in einem Pool aus PARSE_WORKERS Prozessen (0 = Anzahl der CPU Kerne). Einbetten und Schreiben bleiben im Serverprozess.
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", "0")) or os.cpu_count() or 1
+PARSE_PAGES_PER_TASK = int(os.getenv("PARSE_PAGES_PER_TASK", "16"))  #PDF Seiten pro Aufgabe im Prozess-Pool
+#Anzahl paralleler Ingestion Worker (0 = PARSE_WORKERS, damit bei vielen Dateien alle Parse Prozesse ausgelastet sind)
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "0")) or PARSE_WORKERS
+JOB_HISTORY_LIMIT = int(os.getenv("JOB_HISTORY_LIMIT", "1000")) #Maximale Anzahl abgeschlossener Jobs, die abrufbar bleiben
+
+INGEST_QUEUE_LIMIT = int(os.getenv("INGEST_QUEUE_LIMIT", "100"))   #Maximale Anzahl wartender Jobs, danach 429
+INGEST_RETRY_AFTER = int(os.getenv("INGEST_RETRY_AFTER", "30"))    #Empfohlene Wartezeit in Sekunden bei voller Warteschlange
+
+SUPPORTED_FILE_TYPES = (".txt", ".pdf", ".docx")
+#Ungefähre Größe eines Abschnitts in Zeichen bei DOCX und TXT Dateien.
+STREAM_PIECE_CHARS = int(os.getenv("STREAM_PIECE_CHARS", "50000"))
+
+ingest_queue = queue.Queue()
+jobs = {} #job_id -> Job Informationen
+jobs_lock = threading.Lock()
+ingest_threads = []
+#Duplikatprüfung, Ersetzen der Datei und Anlegen des Jobs erfolgen gemeinsam unter upload_lock, damit von zwei gleichzeitigen
+#Uploads derselben Datei (bzw. desselben Inhalts) nur einer angenommen wird. Reihenfolge: upload_lock vor index_lock und jobs_lock.
+upload_lock = threading.Lock()
+
+#job_id/created werden beim Fortsetzen eines unterbrochenen Jobs übergeben.
+def create_job(filename, file_path, file_hash, job_id=None, created=None, tags=None, collection=DEFAULT_COLLECTION):
+    job = {
+        "id": job_id or uuid.uuid4().hex,
+        "collection": collection,
+        "filename": filename,
+        "tags": tags,        #None: Schlagworte einer früheren Version übernehmen (siehe commit_document)
+        "file_path": file_path,
+        "file_hash": file_hash,
+        "state": "queued",   #queued -> running -> done / failed
+        "chunks": 0,
+        "chunks_new": 0,      #Neu einzubettende Chunks (übrige Chunks sind bereits vorhanden)
+        "chunks_removed": 0,  #Nicht mehr verwendete Chunks einer früheren Version des Dokuments
+        "chunks_embedded": 0, #Fortschritt während der Einbettung
+        "chunks_per_second": None,
+        "pieces_done": 0,     #Abgeschlossene Abschnitte (PDF Seiten bzw. Textblöcke)
+        "pieces_total": None, #Nur bei PDF Dateien im Voraus bekannt
+        "resumed": job_id is not None,
+        "error": None,
+        "created": created or time.time(),
+        "started": None,
+        "finished": None,
+        "timings": {},       #Dauer der einzelnen Verarbeitungsschritte in Sekunden
+    }
+    with jobs_lock:
+        jobs[job["id"]] = job
+        prune_finished_jobs()
+    if job_id is None:
+        ensure_data_folders()
+        with open(job_meta_path(job["id"]), "w", encoding="utf-8") as f:
+            json.dump({"id": job["id"], "filename": filename, "file_path": file_path, "file_hash": file_hash, "created": job["created"],
+                       "tags": job["tags"], "collection": collection}, f)
+    return job
+
+def job_meta_path(job_id):
+    return os.path.join(jobs_folder, f"{job_id}.json")
+
+def job_progress_path(job_id):
+    return os.path.join(jobs_folder, f"{job_id}.progress.jsonl")
+
+#Liest den Fortschritt eines unterbrochenen Jobs: nächster Abschnitt und bereits gespeicherte Chunk Hashes.
+#Eine unvollständig geschriebene letzte Zeile (Absturz während des Schreibens) wird ignoriert.
+def load_job_progress(job_id):
+    next_piece = 0
+    chunk_hashes = []
+    if os.path.exists(job_progress_path(job_id)):
+        with open(job_progress_path(job_id), "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                next_piece = entry["piece"] + 1
+                chunk_hashes.extend(entry["chunks"])
+    return next_piece, chunk_hashes
+
+#Hält einen abgeschlossenen Abschnitt fest. fsync, damit der Fortschritt einen Absturz übersteht.
+def append_job_progress(job_id, piece_index, chunk_hashes):
+    with open(job_progress_path(job_id), "a", encoding="utf-8") as f:
+        f.write(json.dumps({"piece": piece_index, "chunks": chunk_hashes}) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+def remove_job_files(job_id):
+    for path in (job_meta_path(job_id), job_progress_path(job_id)):
+        if os.path.exists(path):
+            os.remove(path)
+
+#Stellt beim Serverstart alle Jobs wieder in die Warteschlange, die vor einem Absturz nicht abgeschlossen wurden.
+def resume_interrupted_jobs():
+    if not os.path.isdir(jobs_folder):
+        return
+    for name in sorted(os.listdir(jobs_folder)):
+        if not name.endswith(".json"):
+            continue
+        with open(os.path.join(jobs_folder, name), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if not os.path.exists(meta["file_path"]):
+            remove_job_files(meta["id"])
+            continue
+        job = create_job(meta["filename"], meta["file_path"], meta["file_hash"], job_id=meta["id"], created=meta["created"], tags=meta.get("tags"),
+                         collection=meta.get("collection", DEFAULT_COLLECTION))
+        logger.info("Unterbrochener Job für %s wird fortgesetzt.", job["filename"])
+        ensure_ingest_workers()
+        ingest_queue.put(job["id"])
+
+#Entfernt die ältesten abgeschlossenen Jobs, damit die Jobliste nicht unbegrenzt wächst. Aufruf nur mit jobs_lock.
+def prune_finished_jobs():
+    finished = [job for job in jobs.values() if job["state"] in ("done", "failed")]
+    if len(finished) > JOB_HISTORY_LIMIT:
+        finished.sort(key=lambda job: job["finished"])
+        for job in finished[:len(finished) - JOB_HISTORY_LIMIT]:
+            del jobs[job["id"]]
+
+def update_job(job_id, **changes):
+    with jobs_lock:
+        jobs[job_id].update(changes)
+
+#Kopie eines Jobs für die API Antwort, inklusive Warte- und Gesamtdauer.
+def job_snapshot(job):
+    snapshot = {key: value for key, value in job.items() if key != "file_path"}
+    snapshot["timings"] = dict(job["timings"])
+    now = time.time()
+    if job["started"] is not None:
+        snapshot["timings"]["queued"] = round(job["started"] - job["created"], 3)
+        snapshot["timings"]["total"] = round((job["finished"] or now) - job["started"], 3)
+    return snapshot
+
+#Prüft ob eine Datei gleichen Namens oder gleichen Inhalts gerade in der Warteschlange der Sammlung ist oder verarbeitet wird.
+def job_pending_for(collection, filename, file_hash):
+    with jobs_lock:
+        return any(job["collection"] == collection and (job["filename"] == filename or job["file_hash"] == file_hash)
+                   and job["state"] in ("queued", "running")
+                   for job in jobs.values())
+
+#Offene Jobs einer Sammlung - eine Sammlung wird erst gelöscht, wenn keine Jobs mehr laufen.
+def collection_has_pending_jobs(collection):
+    with jobs_lock:
+        return any(job["collection"] == collection and job["state"] in ("queued", "running") for job in jobs.values())
+
+#########
+#Priorisierung von Anfragen gegenüber der Ingestion
+#Anfragen (/ask) und Ingestion teilen sich das Embedding Modell und die CPU. Während einer großen Ingestion würden Anfragen
+#sonst Sekunden statt Millisekunden benötigen. Vor jedem Einbettungs-Batch wartet die Ingestion daher, bis keine Anfrage mehr
+#läuft (höchstens INGEST_MAX_YIELD Sekunden, damit die Ingestion bei Dauerlast nicht verhungert).
+#Außerdem ist die Anzahl gleichzeitig eingebetteter Ingestion Batches begrenzt.
+#########
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", "1"))     #Gleichzeitig eingebettete Ingestion Batches
+INGEST_MAX_YIELD = float(os.getenv("INGEST_MAX_YIELD", "2"))       #Maximale Wartezeit eines Batches auf laufende Anfragen in Sekunden
+
+class PriorityScheduler:
+    def __init__(self, ingest_concurrency, max_yield):
+        self.condition = threading.Condition()
+        self.ingest_concurrency = ingest_concurrency
+        self.max_yield = max_yield
+        self.active_queries = 0
+        self.active_ingest = 0
+        self.waiting_ingest = 0
+        self.ingest_yields = 0       #Anzahl Batches, die für Anfragen gewartet haben
+        self.ingest_wait_time = 0.0  #Summe der Wartezeit der Ingestion in Sekunden
+
+    #Anfragen haben Vorrang und werden nie blockiert.
+    @contextmanager
+    def query(self):
+        with self.condition:
+            self.active_queries += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.active_queries -= 1
+                self.condition.notify_all()
+
+    #Ein Ingestion Batch startet erst, wenn ein Platz frei ist und keine Anfrage läuft.
+    @contextmanager
+    def ingestion(self):
+        start = time.time()
+        deadline = start + self.max_yield
+        with self.condition:
+            self.waiting_ingest += 1
+            yielded = False
+            while self.active_ingest >= self.ingest_concurrency or (self.active_queries > 0 and time.time() < deadline):
+                yielded = yielded or self.active_queries > 0
+                self.condition.wait(timeout=0.05)
+            self.waiting_ingest -= 1
+            self.active_ingest += 1
+            if yielded:
+                self.ingest_yields += 1
+            self.ingest_wait_time += time.time() - start
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.active_ingest -= 1
+                self.condition.notify_all()
+
+    def stats(self):
+        with self.condition:
+            return {"active_queries": self.active_queries, "active_ingest_batches": self.active_ingest,
+                    "waiting_ingest_batches": self.waiting_ingest, "ingest_yields": self.ingest_yields,
+                    "ingest_wait_seconds": round(self.ingest_wait_time, 3)}
+
+scheduler = PriorityScheduler(INGEST_CONCURRENCY, INGEST_MAX_YIELD)
+
+#Einbettungsschritt der Ingestion: die Chunks werden in Batches der Größe EMBED_BATCH_SIZE eingebettet
+#und jeder Batch direkt in Chroma geschrieben. Dadurch liegen nie mehr als ein Batch an Vektoren im Speicher.
+#Die IDs in Chroma entsprechen den Chunk Hashes, chunk_metadatas enthält die Metadaten je Chunk (siehe Chunk Metadaten).
+#embedded_before: Anzahl bereits eingebetteter Chunks des Jobs aus vorherigen Abschnitten (für die Fortschrittsanzeige).
+#Rückgabe: Dauer der Einbettung und des Schreibens in Sekunden.
+def embed_and_store(collection, chunk_texts, chunk_ids, chunk_metadatas, job_id=None, embedded_before=0, time_before=0.0):
+    embed_time = 0.0
+    insert_time = 0.0
+    for start in range(0, len(chunk_texts), EMBED_BATCH_SIZE):
+        texts = chunk_texts[start:start + EMBED_BATCH_SIZE]
+        batch_ids = chunk_ids[start:start + EMBED_BATCH_SIZE]
+
+        with scheduler.ingestion():
+            step_start = time.time()
+            embeddings = get_embedding_model().embed_documents(texts)
+            embed_time += time.time() - step_start
+
+        step_start = time.time()
+        index_add(collection, batch_ids, embeddings, texts, chunk_metadatas[start:start + EMBED_BATCH_SIZE])
+        insert_time += time.time() - step_start
+
+        if job_id is not None:
+            done = embedded_before + start + len(texts)
+            elapsed = time_before + embed_time + insert_time
+            update_job(job_id, chunks_embedded=done, chunks_per_second=round(done / max(elapsed, 1e-6), 1))
+    return embed_time, insert_time
+
+#########
+#Abschnittsweises Einlesen
+#Bisher unterstützt sind nur txt, pdf und docx Formate. Jede Funktion liefert (Abschnittsnummer, Text) ab start_piece,
+#ohne das gesamte Dokument in den Speicher zu laden.
+#########
+
+#PDF: eine Seite pro Abschnitt. pypdf (auch von PyPDFLoader verwendet) liest die Seiten erst beim Zugriff.
+def iter_pdf_pages(file_path, start_piece, end_piece=None):
+    from pypdf import PdfReader
+    reader = PdfReader(file_path)
+    for page_index in range(start_piece, min(end_piece or len(reader.pages), len(reader.pages))):
+        yield page_index, reader.pages[page_index].extract_text() or ""
+
+def count_pdf_pages(file_path):
+    from pypdf import PdfReader
+    return len(PdfReader(file_path).pages)
+
+#TXT: Zeilen werden gesammelt, bis ein Block STREAM_PIECE_CHARS Zeichen erreicht.
+#Die Kodierung entspricht dem bisherigen TextLoader (Standardkodierung des Systems).
+def iter_text_blocks(file_path, start_piece):
+    piece_index = 0
+    lines = []
+    size = 0
+    with open(file_path, "r") as f:
+        for line in f:
+            lines.append(line)
+            size += len(line)
+            if size >= STREAM_PIECE_CHARS:
+                if piece_index >= start_piece:
+                    yield piece_index, "".join(lines)
+                piece_index += 1
+                lines = []
+                size = 0
+    if lines and piece_index >= start_piece:
+        yield piece_index, "".join(lines)
+
+#DOCX: word/document.xml wird mit iterparse Absatz für Absatz gelesen und zu Abschnitten von ca. STREAM_PIECE_CHARS Zeichen zusammengefasst.
+WORD_NAMESPACE = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+def iter_docx_sections(file_path, start_piece):
+    import zipfile
+    from xml.etree.ElementTree import iterparse
+    piece_index = 0
+    paragraphs = []
+    size = 0
+    with zipfile.ZipFile(file_path) as archive, archive.open("word/document.xml") as xml_file:
+        for _, element in iterparse(xml_file, events=("end",)):
+            if element.tag != WORD_NAMESPACE + "p":
+                continue
+            parts = []
+            for node in element.iter():
+                if node.tag == WORD_NAMESPACE + "t":
+                    parts.append(node.text or "")
+                elif node.tag == WORD_NAMESPACE + "tab":
+                    parts.append("\t")
+                elif node.tag in (WORD_NAMESPACE + "br", WORD_NAMESPACE + "cr"):
+                    parts.append("\n")
+            element.clear() #Verarbeitete Absätze freigeben
+            paragraphs.append("".join(parts))
+            size += len(paragraphs[-1])
+            if size >= STREAM_PIECE_CHARS:
+                if piece_index >= start_piece:
+                    yield piece_index, "\n\n".join(paragraphs)
+                piece_index += 1
+                paragraphs = []
+                size = 0
+    if paragraphs and piece_index >= start_piece:
+        yield piece_index, "\n\n".join(paragraphs)
+
+#Text wird in Chunks aufgeteilt. Zusätzliche Parameter wurden gewählt, um die Chunks zu vergrößern und so einen größeren zusammenhängenden Kontext bei Anfragen wiederzugeben.
+#overlap gibt die kontextuelle Überschneidung vor. size legt die größe der Chunks fest.
+#Bedarf feinjustierung und wurde sehr hoch angesetzt, da kleine Kontexte zusammenhangslos als Antwort wiedergegeben wurden, sodass das LLM keine sinnvolle Antwort gegeben hat.
+#Achtung: bei weitergabe an OpenAI mit großen Dokumenten & großen Chunks erhöht sich massive die größe der Verbrauchten Input Tokens und erhöht dadurch kosten.
+#Bei Verwendung besonders kostenintensiver OpenAI Modelle wie "o1" sind die resultierenden Kosten nicht absehbar. Kontext: eine kleine "gpt4o" Anfrage kostet ca 4 cent
+def create_text_splitter():
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    return RecursiveCharacterTextSplitter(
+        chunk_size=1200,    #chunk_size ist die Größe des Dokuments/Kontextes
+        chunk_overlap=110,  #Kontextuelle überschneidung
+        separators=["\n\n", "\n", " ", ""])
+
+#########
+#Prozess-Pool für Einlesen und Aufteilen
+#Die Funktionen parse_pdf_pages und split_piece laufen in den Pool-Prozessen und liefern je Abschnitt
+#(Abschnittsnummer, [(Chunk Hash, Chunk Text), ...]) an den Serverprozess zurück.
+#########
+
+parse_pool = None
+#Text Splitter des jeweiligen Pool-Prozesses
+process_text_splitter = None
+
+def split_into_hashed_chunks(text):
+    global process_text_splitter
+    if process_text_splitter is None:
+        process_text_splitter = create_text_splitter()
+    return [(chunk_sha256(chunk_text), chunk_text) for chunk_text in process_text_splitter.split_text(text) if chunk_text.strip()]
+
+#Zusätzlich zu den Abschnitten wird die Dauer des Einlesens und Aufteilens in Sekunden zurückgegeben (für /metrics).
+#PDF: Text eines Seitenbereichs extrahieren und aufteilen.
+def parse_pdf_pages(file_path, first_page, last_page):
+    parsed_pieces = []
+    parse_time = 0.0
+    split_time = 0.0
+    pages = iter_pdf_pages(file_path, first_page, last_page)
+    while True:
+        step_start = time.time()
+        page = next(pages, None)
+        parse_time += time.time() - step_start
+        if page is None:
+            return parsed_pieces, parse_time, split_time
+        step_start = time.time()
+        parsed_pieces.append((page[0], split_into_hashed_chunks(page[1])))
+        split_time += time.time() - step_start
+
+#DOCX/TXT: der Abschnitt wird im Serverprozess gelesen, nur das Aufteilen läuft im Pool.
+def split_piece(piece_index, text):
+    step_start = time.time()
+    parsed_pieces = [(piece_index, split_into_hashed_chunks(text))]
+    return parsed_pieces, 0.0, time.time() - step_start
+
+#Der Pool wird mit "spawn" gestartet: ein fork des Serverprozesses würde die Threads von torch, Chroma und waitress in einem undefinierten Zustand kopieren.
+def get_parse_pool():
+    global parse_pool
+    with init_lock:
+        if parse_pool is None:
+            parse_pool = ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+            logger.info("Parse Pool mit %d Prozessen gestartet.", PARSE_WORKERS)
+        return parse_pool
+
+#Nach dem Absturz eines Pool-Prozesses ist der Pool unbrauchbar und wird beim nächsten Zugriff neu gestartet.
+def reset_parse_pool(pool):
+    global parse_pool
+    with init_lock:
+        if parse_pool is pool:
+            parse_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+#Liefert die Aufgaben für den Prozess-Pool ab start_piece. PDF Dateien werden in Seitenbereiche aufgeteilt,
+#damit auch ein einzelnes großes PDF parallel verarbeitet wird.
+def iter_parse_tasks(filename, file_path, start_piece=0, page_count=None):
+    if filename.lower().endswith(".pdf"):
+        for first_page in range(start_piece, page_count, PARSE_PAGES_PER_TASK):
+            yield parse_pdf_pages, (file_path, first_page, first_page + PARSE_PAGES_PER_TASK)
+        return
+    if filename.lower().endswith(".txt"):
+        pieces = iter_text_blocks(file_path, start_piece)
+    else:
+        pieces = iter_docx_sections(file_path, start_piece)
+    for piece_index, piece_text in pieces:
+        yield split_piece, (piece_index, piece_text)
+
+#Datei abschnittsweise einlesen, in Chunks aufteilen und in die Vektordatenbank einbetten.
+def process_ingest_job(job_id):
+    with jobs_lock:
+        job = jobs[job_id]
+        filename = job["filename"]
+        file_path = job["file_path"]
+        file_hash = job["file_hash"]
+        tags = job["tags"]
+        collection = job["collection"]
+    job_start = time.time()
+    is_pdf = filename.lower().endswith(".pdf")
+    update_job(job_id, state="running", started=job_start)
+    timings = {"parse": 0.0, "split": 0.0, "embed": 0.0, "insert": 0.0}
+
+    chunk_hashes = []
+    released = False
+    chunks_new = 0
+
+    #Höchstens PARSE_WORKERS * 2 Aufgaben je Job gleichzeitig im Pool, damit der Speicherbedarf begrenzt bleibt.
+    #Die Ergebnisse werden in Dokumentreihenfolge verarbeitet, so bleibt der Fortschritt in der Checkpoint Datei lückenlos.
+    pool = None
+    pending = deque()
+    try:
+        #Bei einem fortgesetzten Job sind die Chunks der abgeschlossenen Abschnitte bereits gespeichert.
+        next_piece, progress_hashes = load_job_progress(job_id)
+        seen_hashes = set(progress_hashes)
+        reserve_chunks(collection, progress_hashes)
+        chunk_hashes = progress_hashes
+
+        pool = get_parse_pool()
+        page_count = None
+        if is_pdf:
+            page_count = count_pdf_pages(file_path)
+            update_job(job_id, pieces_total=page_count)
+        tasks = iter_parse_tasks(filename, file_path, next_piece, page_count)
+        while True:
+            while len(pending) < PARSE_WORKERS * 2:
+                #Bei DOCX/TXT wird hier der nächste Abschnitt gelesen.
+                step_start = time.time()
+                task = next(tasks, None)
+                timings["parse"] += time.time() - step_start
+                if task is None:
+                    break
+                pending.append(pool.submit(task[0], *task[1]))
+            if not pending:
+                break
+            parsed_pieces, parse_time, split_time = pending.popleft().result()
+            timings["parse"] += parse_time
+            timings["split"] += split_time
+
+            for piece_index, piece_chunks in parsed_pieces:
+                #Chunks über ihren Hash deduplizieren - auch innerhalb des Dokuments.
+                chunks_by_hash = {}
+                for chunk_hash, chunk_text in piece_chunks:
+                    if chunk_hash not in seen_hashes:
+                        seen_hashes.add(chunk_hash)
+                        chunks_by_hash[chunk_hash] = chunk_text
+                piece_hashes = list(chunks_by_hash)
+
+                #Nur Chunks einbetten, die noch in keinem Dokument vorkommen. Bei einer geänderten Datei sind das nur die geänderten Abschnitte.
+                #chunk_hashes enthält nur reservierte Chunks, damit beim Freigeben kein fremder Zähler verringert wird.
+                new_hashes = reserve_chunks(collection, piece_hashes)
+                chunk_hashes.extend(piece_hashes)
+                now = int(time.time())
+                piece_metadata = {"source": filename, "uploaded_at": now, "updated_at": now, source_key(filename): True}
+                if is_pdf:
+                    piece_metadata["page"] = piece_index + 1
+                embed_time, insert_time = embed_and_store(collection, [chunks_by_hash[chunk_hash] for chunk_hash in new_hashes], new_hashes,
+                                                          [dict(piece_metadata, content_hash=chunk_hash) for chunk_hash in new_hashes], job_id,
+                                                          embedded_before=chunks_new, time_before=timings["embed"] + timings["insert"])
+                timings["embed"] += embed_time
+                timings["insert"] += insert_time
+                chunks_new += len(new_hashes)
+                chunks_ingested_total.inc(amount=len(new_hashes))
+
+                #Abschnitt ist gespeichert - Fortschritt festhalten und neue Chunks für Anfragen sichtbar machen.
+                append_job_progress(job_id, piece_index, piece_hashes)
+                if new_hashes:
+                    bump_index_generation()
+                update_job(job_id, chunks=len(chunk_hashes), chunks_new=chunks_new, pieces_done=piece_index + 1)
 
-#Initialisiere Vektordatenbank beim Programmstart.
-#Setze zu True,falls in der Zukunft die Datenbank per Default jedes Mal neu aufgebaut werden soll. (nur falls kein Parameter mit dem Kommando verwendet wird.)
-initialize_database(reset_db=False)
+        chunks_per_second = round(chunks_new / max(timings["embed"] + timings["insert"], 1e-6), 1)
+
+        #Dokument im Protokoll ablegen und veraltete Chunks einer früheren Version entfernen.
+        removed = commit_document(collection, filename, file_hash, chunk_hashes, tags)
+        #Die Reservierung wird auch bei einem Fehler beim Freigeben nicht erneut freigegeben (siehe except).
+        released = True
+        removed += release_document_chunks(collection, chunk_hashes)
+        remove_job_files(job_id)
+        logger.info("Dokument %s hinzugefügt. %d Chunks, davon %d neu eingebettet (%s Chunks/s), %d entfernt.",
+                    filename, len(chunk_hashes), chunks_new, chunks_per_second, removed)
+        if embedding_cache is not None:
+            embedding_cache.flush()
+        update_job(job_id, state="done", chunks_removed=removed, chunks_per_second=chunks_per_second,
+                   timings={step: round(duration, 3) for step, duration in timings.items()}, finished=time.time())
+        for step, duration in timings.items():
+            ingest_stage_seconds.observe(duration, step)
+        ingest_document_seconds.observe(time.time() - job_start)
+        ingest_documents_total.inc("done")
+
+    except Exception as e:
+        logger.exception("Fehler beim Laden/verarbeiten: %s: %s", filename, e)
+        for future in pending:
+            future.cancel()
+        if isinstance(e, BrokenProcessPool):
+            reset_parse_pool(pool)
+        if not released:
+            released = True
+            release_document_chunks(collection, chunk_hashes)
+        remove_job_files(job_id)
+        update_job(job_id, state="failed", error=str(e), timings={step: round(duration, 3) for step, duration in timings.items()}, finished=time.time())
+        ingest_documents_total.inc("failed")
+
+def ingest_worker():
+    while True:
+        job_id = ingest_queue.get()
+        try:
+            process_ingest_job(job_id)
+        except Exception as e:
+            #Fehler außerhalb der Fehlerbehandlung des Jobs (z.B. in der Fehlerbehandlung selbst): Der Worker läuft weiter und
+            #der Job bleibt nicht dauerhaft "running", sonst würden Uploads und Löschen dieses Dokuments blockiert.
+            logger.exception("Ingestion Job %s abgebrochen: %s", job_id, e)
+            update_job(job_id, state="failed", error=str(e), finished=time.time())
+            remove_job_files(job_id)
+        finally:
+            ingest_queue.task_done()
+
+#Startet die Ingestion Worker beim ersten Upload.
+def ensure_ingest_workers():
+    with jobs_lock:
+        if ingest_threads:
+            return
+        for i in range(INGEST_WORKERS):
+            worker = threading.Thread(target=ingest_worker, name=f"Ingestion-{i + 1}", daemon=True)
+            worker.start()
+            ingest_threads.append(worker)
 
 #API-Schnittstelle zum Hochladen auf diesen Server zur Verarbeitung
 #Hinweis: die JsonResponse Antworten könnten besser in dem GUI Programm implementiert werden.
+#Die Verarbeitung erfolgt asynchron - die Antwort enthält die Job ID, über die der Fortschritt unter /jobs/<id> abgefragt werden kann.
+#Dateien können als multipart Formular (Feld "file") oder direkt als Anfrageinhalt hochgeladen werden.
+#Beim direkten Upload steht der Dateiname im Parameter "filename" oder im Header "X-Filename". Der Inhalt wird dann
+#ohne Zwischenspeicherung durch das Formular-Parsing blockweise auf die Festplatte geschrieben.
+#Optional: Schlagworte für Suchfilter als kommagetrennte Liste im Parameter "tags" bzw. Header "X-Tags",
+#Zielsammlung im Parameter "collection" bzw. Header "X-Collection" (Standard: "default").
 @server.route("/upload", methods=["POST"])
 def file_upload():
-    global uploaded_files
     #Dateianhang und Dateinamen Prüfung
-    if "file" not in request.files:
-        print("Anfrage enthält keine Datei. Error 401")
+    raw_filename = request.args.get("filename") or request.headers.get("X-Filename")
+    if raw_filename is not None:
+        filename = os.path.basename(raw_filename)
+        stream = request.stream
+    elif "file" in request.files:
+        file = request.files["file"]
+        filename = file.filename
+        stream = file.stream
+    else:
+        logger.warning("Anfrage enthält keine Datei. Error 401")
         return JsonResponse({"error": "Anfrage enthält keine Datei."}), 401
 
-    file = request.files["file"]
-    if file.filename == "":
-        print("Datei hat keinen Namen. Error 402")
+    if filename == "":
+        logger.warning("Datei hat keinen Namen. Error 402")
         return JsonResponse({"error": "Datei hat keinen Namen."}), 402
 
-    file_path = os.path.join(data_folder, file.filename)
+    collection = request.args.get("collection") or request.headers.get("X-Collection") or DEFAULT_COLLECTION
+    if not collection_exists(collection):
+        return JsonResponse({"error": f"Sammlung '{collection}' existiert nicht."}), 404
+
+    #Nicht unterstützte Dateitypen werden abgelehnt, bevor die Datei gespeichert wird.
+    if not filename.lower().endswith(SUPPORTED_FILE_TYPES):
+        logger.warning("Dateityp wird nicht unterstützt: %s. Error 400", filename)
+        return JsonResponse({"error": "Dateityp wird nicht unterstützt."}), 400
 
-    #Überprüfe, ob die Datei bereits hochgeladen wurde
-    if file.filename in uploaded_files:
-        print("Datei wurde bereits hochgeladen. Error 403")
-        return JsonResponse({"error": "Datei wurde bereits hochgeladen."}), 403
+    return start_ingestion(collection, filename, stream, parse_tags())
 
-    file.save(file_path)
-    print(f"File uploaded successfully to {file_path}.")
+#Schlagworte als kommagetrennte Liste im Parameter "tags" bzw. Header "X-Tags". None, falls keine angegeben wurden,
+#eine leere Angabe (tags=) ergibt [] und entfernt die Schlagworte.
+def parse_tags():
+    raw_tags = request.args.get("tags")
+    if raw_tags is None:
+        raw_tags = request.headers.get("X-Tags")
+    if raw_tags is None:
+        return None
+    return [tag.strip() for tag in raw_tags.split(",") if tag.strip()]
 
-    #Dokumente einlesen und in die Vektordatenbank implementieren/einbetten
-    #Bisher unterstützt sind nur txt, pdf und docx Formate
+#Speichert eine hochgeladene Datei in der Sammlung und legt einen Ingestion Job an (gemeinsam für /upload und PUT /documents).
+#require_existing (PUT): Das Dokument muss im Protokoll stehen, ein unveränderter Inhalt ist kein Fehler.
+def start_ingestion(collection, filename, stream, tags, require_existing=False):
+    #Gegendruck: Bei voller Warteschlange wird der Upload abgelehnt, bevor die Datei gespeichert wird.
+    if ingest_queue.qsize() >= INGEST_QUEUE_LIMIT:
+        logger.warning("Ingestion Warteschlange ist voll. Error 429")
+        response = JsonResponse({"error": "Die Verarbeitungswarteschlange ist voll. Bitte später erneut versuchen."})
+        response.headers["Retry-After"] = str(INGEST_RETRY_AFTER)
+        return response, 429
+
+    ensure_data_folders()
+    os.makedirs(collection_files_folder(collection), exist_ok=True)
+    file_path = os.path.join(collection_files_folder(collection), filename)
+    #Zunächst unter temporärem Namen speichern, damit eine bereits vorhandene Version erst nach der Prüfung ersetzt wird.
+    temp_path = f"{file_path}.{uuid.uuid4().hex}.upload"
     try:
-        loader = None
-        if file.filename.lower().endswith(".txt"):
-            loader = TextLoader(file_path)
-        elif file.filename.lower().endswith(".pdf"):
-            loader = PyPDFLoader(file_path)
-        elif file.filename.lower().endswith(".docx"):
-            loader = Docx2txtLoader(file_path)
-        else:
-            print(f"Skipping unsupported file type: {file.filename}")
-            print("Dateityp wird nicht unterstützt. Error 400")
-            return JsonResponse({"error": "Dateityp wird nicht unterstützt."}), 400
-
-        if loader:
-            docs = loader.load()
-
-            #Text wird in Chunks aufgeteilt. Zusätzliche Parameter wurden gewählt, um die Chunks zu vergrößern und so einen größeren zusammenhängenden Kontext bei Anfragen wiederzugeben.
-            #overlap gibt die kontextuelle Überschneidung vor. size legt die größe der Chunks fest.
-            #Bedarf feinjustierung und wurde sehr hoch angesetzt, da kleine Kontexte zusammenhangslos als Antwort wiedergegeben wurden, sodass das LLM keine sinnvolle Antwort gegeben hat.
-            #Achtung: bei weitergabe an OpenAI mit großen Dokumenten & großen Chunks erhöht sich massive die größe der Verbrauchten Input Tokens und erhöht dadurch kosten.
-            #Bei Verwendung besonders kostenintensiver OpenAI Modelle wie "o1" sind die resultierenden Kosten nicht absehbar. Kontext: eine kleine "gpt4o" Anfrage kostet ca 4 cent
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=1200,    #chunk_size ist die Größe des Dokuments/Kontextes
-                chunk_overlap=110,  #Kontextuelle überschneidung
-                separators=["\n\n", "\n", " ", ""])
-
-            split_documents = text_splitter.split_documents(docs)
-
-            #Chunks in die Vektordatenbank hinzufügen
-            vector_db.add_documents([Document(page_content=doc.page_content) for doc in split_documents])
-            print("Dokument " + file.filename +" hinzugefügt.")
-
-            #Dateinamen in der Liste von bereits hochgeladenen Dateien ablegen.
-            uploaded_files.add(file.filename)
-            save_uploaded_files()
-        else:
-            print("Fehler - Es wurde kein Embeddings hinzugefügt.")
+        file_hash = save_upload_stream(stream, temp_path)
+    except Exception:
+        #Abgebrochene Übertragung - unvollständige Datei nicht liegen lassen.
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
 
-    except Exception as e:
-        print(f"Fehler beim Laden/verarbeiten: {file.filename}: {e}")
-        return JsonResponse({"error": str(e)}), 500
+    with upload_lock:
+        #Die Sammlung kann während der Übertragung gelöscht worden sein (drop_collection hält ebenfalls upload_lock).
+        if not collection_exists(collection):
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return JsonResponse({"error": f"Sammlung '{collection}' existiert nicht."}), 404
+        #Das Dokument kann während der Übertragung gelöscht worden sein (DELETE /documents hält ebenfalls upload_lock).
+        if require_existing:
+            with index_lock:
+                exists = filename in get_document_index(collection)["documents"]
+            if not exists:
+                os.remove(temp_path)
+                return JsonResponse({"error": f"Dokument {filename} nicht gefunden."}), 404
+        #Überprüfe, ob eine Datei mit identischem Inhalt bereits hochgeladen wurde oder gerade verarbeitet wird - unabhängig vom Dateinamen.
+        #Eine geänderte Datei mit bekanntem Namen wird dagegen inkrementell neu verarbeitet.
+        try:
+            existing_name = find_document_by_hash(collection, file_hash)
+            if require_existing and existing_name == filename:
+                os.remove(temp_path)
+                tags_updated = tags is not None and update_document_tags(collection, filename, tags)
+                return JsonResponse({"message": f"Dokument {filename} ist unverändert.", "status": "unchanged", "tags_updated": tags_updated})
+            if existing_name is not None or job_pending_for(collection, None, file_hash):
+                os.remove(temp_path)
+                logger.info("Datei wurde bereits hochgeladen: %s. Error 403", filename)
+                return JsonResponse({"error": f"Datei wurde bereits hochgeladen{f' (als {existing_name})' if existing_name else ''}.",
+                                     "duplicate": True}), 403
+            #Eine andere Version der Datei wird noch verarbeitet - der Client soll es später erneut versuchen.
+            if job_pending_for(collection, filename, None):
+                os.remove(temp_path)
+                logger.info("Andere Version wird noch verarbeitet: %s. Error 409", filename)
+                return JsonResponse({"error": f"Eine andere Version der Datei {filename} wird gerade verarbeitet."}), 409
+
+            os.replace(temp_path, file_path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        logger.info("Datei hochgeladen: %s.", file_path)
+
+        job = create_job(filename, file_path, file_hash, tags=tags, collection=collection)
+    ensure_ingest_workers()
+    ingest_queue.put(job["id"])
+
+    return JsonResponse({"message": "Datei wurde erfolgreich hochgeladen! Die Verarbeitung des Dateiinhaltes kann etwas Zeit in Anspruch nehmen.",
+                         "job_id": job["id"]}), 202
+
+#########
+#Dokumentverwaltung
+#Einzelne Dokumente einer Sammlung auflisten, löschen oder ersetzen, ohne die Datenbank zurückzusetzen (reset_db).
+#Die ID eines Dokuments ist sein Dateiname (URL-kodiert), die Sammlung wird im Parameter "collection" angegeben.
+#Beim Löschen werden nur Chunks entfernt, die in keinem anderen Dokument vorkommen. Beim Ersetzen wird die neue Version wie ein
+#Upload verarbeitet: nur geänderte Chunks werden eingebettet, nicht mehr enthaltene entfernt (siehe commit_document).
+#########
+
+#Dokumente mit Inhalts-Hash, Schlagworten, Zeitpunkt, Anzahl Chunks und ggf. laufender Verarbeitung.
+#Auch Grundlage für Suchfilter (Dokumentauswahl in der GUI).
+@server.route("/documents", methods=["GET"])
+def list_documents():
+    collection = request.args.get("collection") or DEFAULT_COLLECTION
+    if not collection_exists(collection):
+        return JsonResponse({"error": f"Sammlung '{collection}' existiert nicht."}), 404
+    with jobs_lock:
+        pending = {job["filename"]: job["id"] for job in jobs.values()
+                   if job["collection"] == collection and job["state"] in ("queued", "running")}
+    with index_lock:
+        documents = [{"id": name,
+                      "file_hash": entry["file_hash"],
+                      "tags": entry.get("tags") or [],
+                      "uploaded": entry.get("uploaded"),
+                      "chunks": len(entry["chunks"]),
+                      "pending_job": pending.get(name)}
+                     for name, entry in sorted(get_document_index(collection)["documents"].items())]
+    return JsonResponse({"collection": collection, "documents": documents})
+
+@server.route("/documents/<document_id>", methods=["DELETE"])
+def delete_document(document_id):
+    collection = request.args.get("collection") or DEFAULT_COLLECTION
+    if not collection_exists(collection):
+        return JsonResponse({"error": f"Sammlung '{collection}' existiert nicht."}), 404
+    #Unter upload_lock, damit zwischen Prüfung und Löschen kein Upload bzw. PUT einen Job für das Dokument anlegt.
+    with upload_lock:
+        #Ein laufender Job würde das Dokument anschließend wieder eintragen.
+        if job_pending_for(collection, document_id, None):
+            return JsonResponse({"error": f"Das Dokument {document_id} wird gerade verarbeitet."}), 409
+        removed = remove_document(collection, document_id)
+    if removed is None:
+        return JsonResponse({"error": f"Dokument {document_id} nicht gefunden."}), 404
+    logger.info("Dokument %s aus Sammlung %s gelöscht, %d Chunks entfernt.", document_id, collection, removed)
+    return JsonResponse({"message": f"Dokument {document_id} wurde gelöscht.", "chunks_removed": removed})
+
+#Ersetzt den Inhalt eines vorhandenen Dokuments (Anfrageinhalt oder multipart Feld "file"). Ohne "tags" bleiben die Schlagworte erhalten.
+@server.route("/documents/<document_id>", methods=["PUT"])
+def replace_document(document_id):
+    collection = request.args.get("collection") or DEFAULT_COLLECTION
+    if not collection_exists(collection):
+        return JsonResponse({"error": f"Sammlung '{collection}' existiert nicht."}), 404
+    #Schnelle Ablehnung vor der Übertragung. Maßgeblich ist die Prüfung in start_ingestion unter upload_lock.
+    with index_lock:
+        exists = document_id in get_document_index(collection)["documents"]
+    if not exists:
+        return JsonResponse({"error": f"Dokument {document_id} nicht gefunden."}), 404
+    stream = request.files["file"].stream if request.mimetype == "multipart/form-data" and "file" in request.files else request.stream
+    return start_ingestion(collection, document_id, stream, parse_tags(), require_existing=True)
+
+#Status aller bekannten Ingestion Jobs.
+@server.route("/jobs", methods=["GET"])
+def list_jobs():
+    with jobs_lock:
+        snapshots = [job_snapshot(job) for job in sorted(jobs.values(), key=lambda job: job["created"])]
+    return JsonResponse({"jobs": snapshots, "queued": ingest_queue.qsize()})
+
+#Status eines einzelnen Ingestion Jobs.
+@server.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    with jobs_lock:
+        job = jobs.get(job_id)
+        if job is None:
+            return JsonResponse({"error": "Job nicht gefunden."}), 404
+        return JsonResponse(job_snapshot(job))
+
+#########
+#Kontextauswahl
+#Jeder Treffer erhält seine Ähnlichkeit zur Frage ("score"). Beinahe-Duplikate eines besser bewerteten Treffers werden bereits
+#hier verworfen, damit sie nicht übertragen werden. Mit token_budget werden die besten Treffer aufgenommen, bis das Budget
+#erreicht ist; ein letzter, zu langer Treffer wird gekürzt. Damit ist die Größe des Kontexts im Prompt vorhersehbar.
+#########
+
+#Kosinus-Ähnlichkeit, ab der ein Treffer als Beinahe-Duplikat eines besseren Treffers gilt (0 = deaktiviert).
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.95"))
+CHARS_PER_TOKEN = 4        #Schätzung wie in der GUI (LLM_Interface_v1.estimate_tokens)
+MIN_TRIMMED_TOKENS = 50    #Kürzere Reste des Budgets werden nicht mit einem gekürzten Treffer aufgefüllt
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+#Kürzt einen Text auf ungefähr max_tokens, möglichst an einer Wortgrenze.
+def trim_to_tokens(text, max_tokens):
+    max_chars = max(0, (max_tokens - 1) * CHARS_PER_TOKEN - 4)
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind(" ", 0, max_chars)
+    return text[:cut if cut > max_chars // 2 else max_chars].rstrip() + " ..."
+
+def normalize_vector(vector):
+    vector = numpy.asarray(vector, dtype=numpy.float32)
+    norm = numpy.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+#Die Treffer kommen von Chroma bereits nach Distanz sortiert.
+def select_documents(query_vector, texts, vectors, metadatas, token_budget=None):
+    query_vector = normalize_vector(query_vector)
+    selected = []
+    selected_vectors = []
+    used_tokens = 0
+    for text, vector, metadata in zip(texts, vectors, metadatas):
+        vector = normalize_vector(vector)
+        if NEAR_DUPLICATE_THRESHOLD > 0 and any(float(numpy.dot(vector, other)) >= NEAR_DUPLICATE_THRESHOLD for other in selected_vectors):
+            continue
+        document = {"content": text, "score": round(float(numpy.dot(query_vector, vector)), 4)}
+        for key in ("source", "page"):
+            if metadata and key in metadata:
+                document[key] = metadata[key]
+        if token_budget is not None:
+            tokens = estimate_tokens(text)
+            remaining = token_budget - used_tokens
+            if tokens > remaining:
+                if remaining >= MIN_TRIMMED_TOKENS:
+                    document["content"] = trim_to_tokens(text, remaining)
+                    document["tokens"] = estimate_tokens(document["content"])
+                    document["trimmed"] = True
+                    selected.append(document)
+                break
+            document["tokens"] = tokens
+            used_tokens += tokens
+        selected.append(document)
+        selected_vectors.append(vector)
+    return selected
+
+#Sucht für mehrere Anfrage-Vektoren mit gleicher Sammlung, Ergebnisanzahl und gleichem Filter in einem Aufruf von Chroma.
+#max_results ist die Anzahl der Kandidaten je Frage, token_budgets optional ein Budget je Frage.
+#search_filter: None = alle Chunks, sonst ("sources", Dateinamen) bzw. ("tags", Schlagworte) aus parse_search_filter.
+#Gefunden werden nur Chunks, die mindestens einen der Dokument- bzw. Schlagwort-Schlüssel tragen (Filter innerhalb der Chroma Suche).
+def search_by_vectors(collection, embeddings, max_results, token_budgets=None, search_filter=None):
+    token_budgets = token_budgets or [None] * len(embeddings)
+    where = None
+    if search_filter is not None:
+        kind, values = search_filter
+        if not values:
+            return [[] for _ in embeddings]
+        key = source_key if kind == "sources" else tag_key
+        conditions = [{key(value): True} for value in values]
+        where = conditions[0] if len(conditions) == 1 else {"$or": conditions}
+    result = get_collection(collection).query(query_embeddings=embeddings, n_results=max_results, where=where,
+                                              include=["documents", "embeddings", "metadatas"])
+    return [select_documents(embedding, texts, vectors, metadatas, token_budget)
+            for embedding, texts, vectors, metadatas, token_budget
+            in zip(embeddings, result["documents"], result["embeddings"], result["metadatas"], token_budgets)]
 
-    return JsonResponse({"message": "Datei wurde erfolgreich hochgeladen! Die Verarbeitung des Dateiinhaltes kann etwas Zeit in Anspruch nehmen."})
+#Maximale Anzahl Bedingungen (Dokumente bzw. Schlagworte) eines Suchfilters. Jede Bedingung verlängert die "where" Klausel jeder Suche.
+MAX_FILTER_TERMS = int(os.getenv("MAX_FILTER_TERMS", "200"))
+
+#Suchfilter einer Anfrage: {"sources": [Dateinamen], "tags": [Schlagworte], "uploaded_from": "JJJJ-MM-TT", "uploaded_to": "JJJJ-MM-TT"}.
+#Alle Angaben sind optional und werden kombiniert (Schlagworte: mindestens eines). Nur Schlagworte werden direkt über die
+#Schlagwort-Schlüssel gefiltert, sonst wird der Filter anhand des Dokumentenprotokolls in eine Menge von Dokumenten übersetzt.
+#Rückgabe: None (kein Filter), ("tags", sortiertes Tupel der Schlagworte) oder ("sources", sortiertes Tupel der Dateinamen).
+#ValueError, falls der Filter mehr als MAX_FILTER_TERMS Bedingungen ergibt.
+def parse_search_filter(query, collection=DEFAULT_COLLECTION):
+    search_filter = query.get("filter")
+    if not search_filter:
+        return None
+    if not isinstance(search_filter, dict):
+        raise ValueError("'filter' muss ein Objekt sein.")
+    unknown = set(search_filter) - {"sources", "tags", "uploaded_from", "uploaded_to"}
+    if unknown:
+        raise ValueError(f"Unbekannte Filterangabe: {', '.join(sorted(unknown))}")
+    sources = search_filter.get("sources")
+    tags = search_filter.get("tags")
+    for name, value in (("sources", sources), ("tags", tags)):
+        if value is not None and (not isinstance(value, list) or not all(isinstance(item, str) for item in value)):
+            raise ValueError(f"'{name}' muss eine Liste von Texten sein.")
+    #Datumsangaben einschließlich: uploaded_to gilt bis zum Ende des Tages, sofern keine Uhrzeit angegeben ist.
+    try:
+        uploaded_from = datetime.datetime.fromisoformat(search_filter["uploaded_from"]).timestamp() if search_filter.get("uploaded_from") else None
+        uploaded_to = None
+        if search_filter.get("uploaded_to"):
+            uploaded_to = datetime.datetime.fromisoformat(search_filter["uploaded_to"])
+            if len(search_filter["uploaded_to"]) <= 10:
+                uploaded_to += datetime.timedelta(days=1)
+            uploaded_to = uploaded_to.timestamp()
+    except (TypeError, ValueError):
+        raise ValueError("'uploaded_from'/'uploaded_to' müssen im Format JJJJ-MM-TT angegeben werden.")
+
+    if tags and sources is None and uploaded_from is None and uploaded_to is None:
+        tags = tuple(sorted(set(tags)))
+        if len(tags) > MAX_FILTER_TERMS:
+            raise ValueError(f"Der Filter enthält {len(tags)} Schlagworte (maximal {MAX_FILTER_TERMS}).")
+        return ("tags", tags)
+
+    with index_lock:
+        documents = get_document_index(collection)["documents"]
+        selected = []
+        for name, entry in documents.items():
+            if sources is not None and name not in sources:
+                continue
+            if tags and not set(tags) & set(entry.get("tags") or []):
+                continue
+            uploaded = entry.get("uploaded") or 0
+            if (uploaded_from is not None and uploaded < uploaded_from) or (uploaded_to is not None and uploaded >= uploaded_to):
+                continue
+            selected.append(name)
+        #Umfasst der Filter alle Dokumente, wird ohne Bedingung gesucht.
+        if len(selected) == len(documents) and documents:
+            return None
+    if len(selected) > MAX_FILTER_TERMS:
+        raise ValueError(f"Der Filter umfasst {len(selected)} Dokumente (maximal {MAX_FILTER_TERMS}). "
+                         "Bitte den Filter eingrenzen oder nur nach Schlagworten filtern.")
+    return ("sources", tuple(sorted(selected)))
+
+#Sammlung einer Anfrage (Standard: "default"). KeyError, falls sie nicht existiert.
+def parse_collection(query):
+    collection = query.get("collection") or DEFAULT_COLLECTION
+    if not isinstance(collection, str) or not collection_exists(collection):
+        raise KeyError(f"Sammlung '{collection}' existiert nicht.")
+    return collection
+
+#token_budget aus einer Anfrage lesen: None (ohne Budget) oder positive Ganzzahl.
+def parse_token_budget(query):
+    token_budget = query.get("token_budget")
+    if token_budget is None:
+        return None
+    if not isinstance(token_budget, int) or isinstance(token_budget, bool) or token_budget <= 0:
+        raise ValueError("'token_budget' muss eine positive Ganzzahl sein.")
+    return token_budget
 
 #Webserver Adresse zur Stellung von Anfragen.
 @server.route("/ask", methods=["POST"])
@@ -168,37 +1868,228 @@ def ask_question():
         #Servern Verwendung abhängig vom Modell kostenintensiv sein könnte.
         question = data["question"]
         max_results = data.get("max_results", 3)  #Anzahl ändern, um die maximale Anzahl relevanter Dokumente zurückzugeben. 3 ist ein default Wert falls nichts anderes angegeben wurde.
+        #Optional: maximale Größe des Kontexts in Tokens. max_results ist dann die Anzahl der betrachteten Kandidaten.
+        #Optional: Suchfilter (Dokumente, Schlagworte, Zeitraum), siehe parse_search_filter.
+        #Optional: Sammlung, in der gesucht wird (Standard: "default").
+        try:
+            collection = parse_collection(data)
+            token_budget = parse_token_budget(data)
+            search_filter = parse_search_filter(data, collection)
+        except KeyError as e:
+            return JsonResponse({"error": e.args[0]}), 404
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}), 400
+        ask_start = time.time()
+
+        #Wiederholte Anfragen werden aus dem Ergebniscache beantwortet, solange sich der Index nicht geändert hat.
+        generation = current_index_generation()
+        cache_key = (question, max_results, token_budget, search_filter, collection)
+        cached = result_cache.get(cache_key)
+        if cached is not None and cached[0] == generation:
+            ask_seconds.observe(time.time() - ask_start, "hit")
+            return JsonResponse({"documents": cached[1]})
+
+        #Frage wird an die Vektordatenbank "gestellt". Die Einbettung der Frage kommt ggf. aus dem Anfrage-Cache.
+        #max_results entspricht dem Parameter "k" der Suche.
+        with scheduler.query():
+            with query_embedding_seconds.time("/ask"):
+                question_embedding = get_embedding_model().embed_query(question)
+            with search_seconds.time("/ask"):
+                documents = search_by_vectors(collection, [question_embedding], max_results, [token_budget], search_filter)[0]
+        #Feedback darüber wie viele Dokumente gefunden wurden. Die Frage nur als Zusammenfassung, außer LOG_FULL_PAYLOADS ist aktiviert.
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Anzahl der gefundenen Dokumente: %d für die Frage: %s", len(documents), payload_summary(question))
 
-        #Frage wird an die Vektordatenbank "gestellt".
-        retriever = vector_db.as_retriever(search_kwargs={"k": max_results}) #search kwargs wird im folgenden "max_results" für ein besseres Verständnis umbenannt.
-        #Alternativ ohne max_results festzulegen
-        #retriever = vectorstore.as_retriever()
-        docs = retriever.invoke(question)
-        print(f"Anzahl der gefundenen Dokumente: {len(docs)} für die Frage: '{question}'") #Feedback darüber wie viele Dokumente gefunden wurden.
+        cache_result(cache_key, generation, documents)
+        ask_seconds.observe(time.time() - ask_start, "miss")
 
         #Antwort an den Client PC/an die GUI, um Kontext bereitzustellen.
         return JsonResponse({
-            "documents": [{"content": doc.page_content} for doc in docs]
+            "documents": documents
         })
 
     except Exception as e:
-        print("Ein Fehler ist aufgetreten:", e)
+        logger.exception("Ein Fehler ist aufgetreten: %s", e)
         return JsonResponse({"error": f"Ein Fehler ist aufgetreten: {str(e)}"}), 500
+#Mehrere Fragen in einer Anfrage. Alle nicht zwischengespeicherten Fragen werden in einem Durchlauf eingebettet
+#und die Suchen je max_results gemeinsam ausgeführt. Die Ergebnisse werden in der Reihenfolge der Fragen zurückgegeben.
+#Format: {"queries": [{"question": "...", "max_results": 3, "token_budget": 1500, "filter": {...}, "collection": "..."}, "Frage als Text", ...]}
+MAX_BATCH_QUERIES = int(os.getenv("MAX_BATCH_QUERIES", "256"))
+
+@server.route("/ask_batch", methods=["POST"])
+def ask_question_batch():
+    try:
+        data = request.json
+        if not data or not isinstance(data.get("queries"), list):
+            return JsonResponse({"error": "Json Anfrage enthält keine 'queries' Liste"}), 400
+        if len(data["queries"]) > MAX_BATCH_QUERIES:
+            return JsonResponse({"error": f"Maximal {MAX_BATCH_QUERIES} Fragen pro Anfrage."}), 400
+
+        queries = []
+        for query in data["queries"]:
+            if isinstance(query, str):
+                query = {"question": query}
+            if not isinstance(query, dict) or "question" not in query:
+                return JsonResponse({"error": "Jede Anfrage benötigt einen 'question' key"}), 400
+            try:
+                collection = parse_collection(query)
+                queries.append((query["question"], query.get("max_results", 3), parse_token_budget(query),
+                                parse_search_filter(query, collection), collection))
+            except KeyError as e:
+                return JsonResponse({"error": e.args[0]}), 404
+            except ValueError as e:
+                return JsonResponse({"error": str(e)}), 400
+
+        #Zuerst den Ergebniscache prüfen.
+        generation = current_index_generation()
+        results = [None] * len(queries)
+        pending = []
+        for i, cache_key in enumerate(queries):
+            cached = result_cache.get(cache_key)
+            if cached is not None and cached[0] == generation:
+                results[i] = cached[1]
+            else:
+                pending.append(i)
+
+        if pending:
+            with scheduler.query():
+                with query_embedding_seconds.time("/ask_batch"):
+                    embeddings = get_embedding_model().embed_queries([queries[i][0] for i in pending])
+                #Suchen mit gleicher Sammlung, gleichem max_results und Filter werden gemeinsam an Chroma übergeben.
+                by_search = {}
+                for i, embedding in zip(pending, embeddings):
+                    by_search.setdefault((queries[i][4], queries[i][1], queries[i][3]), []).append((i, embedding))
+                with search_seconds.time("/ask_batch"):
+                    for (collection, max_results, search_filter), group in by_search.items():
+                        found = search_by_vectors(collection, [embedding for _, embedding in group], max_results, [queries[i][2] for i, _ in group],
+                                                  search_filter)
+                        for (i, _), documents in zip(group, found):
+                            results[i] = documents
+                            cache_result(queries[i], generation, documents)
+        logger.debug("Batch Anfrage mit %d Fragen, davon %d nicht im Cache.", len(queries), len(pending))
+
+        return JsonResponse({"results": [{"documents": documents} for documents in results]})
+
+    except Exception as e:
+        logger.exception("Ein Fehler ist aufgetreten: %s", e)
+        return JsonResponse({"error": f"Ein Fehler ist aufgetreten: {str(e)}"}), 500
+
+#Sammlungen auflisten, anlegen ({"name": "..."}) und löschen.
+@server.route("/collections", methods=["GET"])
+def list_collections():
+    registry = get_collection_registry()
+    with index_lock:
+        collections = [{"name": name,
+                        "created": registry.get(name, {}).get("created"),
+                        "documents": len(get_document_index(name)["documents"]),
+                        "chunks": len(get_document_index(name)["chunks"])}
+                       for name in collection_names()]
+    return JsonResponse({"collections": collections})
+
+@server.route("/collections", methods=["POST"])
+def add_collection():
+    data = request.json
+    name = data.get("name") if isinstance(data, dict) else None
+    if not isinstance(name, str) or not COLLECTION_NAME_PATTERN.match(name):
+        return JsonResponse({"error": "Ungültiger Name. Erlaubt sind 1-64 Buchstaben, Ziffern, '_' und '-' (Anfang und Ende Buchstabe oder Ziffer)."}), 400
+    if not create_collection(name):
+        return JsonResponse({"error": f"Sammlung '{name}' existiert bereits."}), 409
+    return JsonResponse({"message": f"Sammlung '{name}' wurde angelegt.", "name": name}), 201
+
+@server.route("/collections/<name>", methods=["DELETE"])
+def remove_collection(name):
+    if name == DEFAULT_COLLECTION:
+        return JsonResponse({"error": "Die Sammlung 'default' kann nicht gelöscht werden."}), 400
+    #Unter upload_lock, damit zwischen Prüfung und Löschen kein Upload einen Job für die Sammlung anlegt.
+    with upload_lock:
+        if not collection_exists(name):
+            return JsonResponse({"error": f"Sammlung '{name}' existiert nicht."}), 404
+        if collection_has_pending_jobs(name):
+            return JsonResponse({"error": f"Für die Sammlung '{name}' laufen noch Ingestion Jobs."}), 409
+        drop_collection(name)
+    return JsonResponse({"message": f"Sammlung '{name}' wurde gelöscht."})
+
+#Messwerte, die beim Abruf von /metrics aus dem aktuellen Zustand berechnet werden.
+def cache_metric(field):
+    caches = {"result": result_cache.stats()}
+    if embedding_model is not None:
+        caches["query_embedding"] = embedding_model.query_cache.stats()
+    if embedding_cache is not None:
+        caches["embedding"] = embedding_cache.stats()
+    return {(name,): stats[field] for name, stats in caches.items()}
+
+def index_metric(field):
+    with index_lock:
+        return {(name,): len(get_document_index(name)[field]) for name in collection_names()}
+
+Counter("vectordb_cache_hits_total", "Treffer je Cache.", ("cache",), function=lambda: cache_metric("hits"))
+Counter("vectordb_cache_misses_total", "Fehlzugriffe je Cache.", ("cache",), function=lambda: cache_metric("misses"))
+Gauge("vectordb_cache_entries", "Einträge je Cache.", ("cache",), function=lambda: cache_metric("entries"))
+Gauge("vectordb_index_chunks", "Gespeicherte (eindeutige) Chunks je Sammlung.", ("collection",), function=lambda: index_metric("chunks"))
+Gauge("vectordb_index_documents", "Dokumente je Sammlung.", ("collection",), function=lambda: index_metric("documents"))
+Gauge("vectordb_index_generation", "Anzahl der Indexänderungen seit dem Start.", function=lambda: index_generation)
+Gauge("vectordb_ingest_queue_depth", "Wartende Ingestion Jobs.", function=lambda: ingest_queue.qsize())
+Gauge("vectordb_index_writer_queue_depth", "Wartende Schreibvorgänge des Index Writers.", function=lambda: index_writer.pending())
+Gauge("vectordb_active_queries", "Aktuell laufende Suchanfragen (Scheduler).", function=lambda: scheduler.stats()["active_queries"])
+Gauge("vectordb_active_ingest_batches", "Aktuell eingebettete Ingestion Batches (Scheduler).", function=lambda: scheduler.stats()["active_ingest_batches"])
+Gauge("vectordb_ready", "1, sobald Embedding Modell und Index geladen sind.", function=lambda: int(is_ready()))
+
+@server.route("/metrics", methods=["GET"])
+def metrics():
+    return render_metrics(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+#Trefferquoten der Caches, aktuelle Index Generation und Auslastung der Warteschlangen.
+@server.route("/stats", methods=["GET"])
+def cache_stats():
+    return JsonResponse({
+        "index_generation": current_index_generation(),
+        "result_cache": result_cache.stats(),
+        "query_embedding_cache": embedding_model.query_cache.stats() if embedding_model is not None else None,
+        "embedding_cache": embedding_cache.stats() if embedding_cache is not None else None,
+        "scheduler": dict(scheduler.stats(), ingest_queue_depth=ingest_queue.qsize(), ingest_queue_limit=INGEST_QUEUE_LIMIT,
+                          index_writer_queue_depth=index_writer.pending()),
+    })
+
+#Liveness: Der Prozess läuft und nimmt Anfragen an - unabhängig davon, ob Modell und Index bereits geladen sind.
+@server.route("/health", methods=["GET"])
+def health():
+    return JsonResponse({"status": "ok"})
+
+#Readiness: Embedding Modell geladen und Index geöffnet. Bis dahin 503, z.B. für Loadbalancer während des Starts.
+@server.route("/ready", methods=["GET"])
+def ready():
+    status = {"ready": is_ready(), "embedding_model": embedding_model is not None, "vector_db": vector_db is not None}
+    return JsonResponse(status), 200 if status["ready"] else 503
+
 #Informationsseite/Startseite. Zum Testen der Verbindung sowie der kleinen Dokumentation über die möglichen API Schnittstellen
 @server.route("/", methods=["GET"])
 def index():
-    return "Vektordatenbank ist aktiv. Dateien hochladen unter /upload. Kontextanfragen stellen under /ask."
+    return "Vektordatenbank ist aktiv. Dateien hochladen unter /upload, Verarbeitungsstatus unter /jobs. Kontextanfragen stellen under /ask bzw. /ask_batch. Metriken unter /metrics."
 
 def start_server():
-    port = 8000
-    url = f"http://127.0.0.1:{port}"
+    port = SERVER_PORT
+    url = f"http://{SERVER_HOST}:{port}"
 
 
     #Öffnet den Webbrowser bei Start des Servers. Import Kommentierung Rückgängig machen, um diese Funktion wieder zu aktivieren.
     #threading.Timer(1, lambda: webbrowser.open(url)).start()
 
-    print(f"Server läuft unter {url}")
-    server.run(port=port, debug=False)
+    #Modell und Index im Hintergrund laden, während der Server bereits Anfragen annimmt.
+    if WARMUP_ON_START:
+        threading.Thread(target=warm_up, name="Warmup", daemon=True).start()
+    #Vor einem Absturz nicht abgeschlossene Ingestion Jobs fortsetzen.
+    resume_interrupted_jobs()
+
+    logger.info("Server läuft unter %s (%s)", url, SERVER_MODE)
+    if SERVER_MODE == "production":
+        #Mehrere Worker Threads beantworten /ask Anfragen parallel. Das Embedding Modell (PyTorch) und Chroma geben
+        #während der Berechnung den GIL frei, dadurch skalieren parallele Anfragen mit der Anzahl der Kerne.
+        #Mehrere Prozesse werden bewusst nicht verwendet: Chroma, Caches und Jobliste liegen im Speicher dieses Prozesses
+        #und der Index hat genau einen Schreiber.
+        from waitress import serve
+        serve(server, host=SERVER_HOST, port=port, threads=SERVER_THREADS)
+    else:
+        server.run(host=SERVER_HOST, port=port, debug=False, threaded=True)
 
 #########
 #System Tray Icon, kann ebenfalls mit existierendem Bild umgesetzt werden.
@@ -207,6 +2098,8 @@ def start_server():
 
 #Einfaches System Tray Icon erstellen
 def create_icon():
+    from PIL import Image
+    from PIL import ImageDraw
     width, height = 64, 64
     icon = Image.new('RGB', (width, height), "white")
     draw = ImageDraw.Draw(icon)
@@ -221,12 +2114,14 @@ def stop_server(icon, item):
 
 #Startet das Taskleistensymbol zum einfacheren Beenden.
 def start_tray_icon():
+    from pystray import Icon, Menu, MenuItem
     menu = Menu(MenuItem("Beenden", stop_server))
     icon = Icon("Vektordatenbank Server", create_icon(), menu=menu)
     icon.run()
 
 #Starte Hauptprogramm mit Threading, da Sys Tray Icon + Server nicht gleichzeitig betrieben werden können - Führt zu Systemeinfrieren und Fehlern.
 if __name__ == "__main__":
+    setup_logging(LOG_PATH)
     tray_thread = threading.Thread(target=start_tray_icon, daemon=True)
     tray_thread.start()
     start_server()
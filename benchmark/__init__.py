@@ -0,0 +1,4 @@
+#Benchmark für Vektorserver und GUI Anfrageablauf.
+#Erzeugt einen synthetischen Dokumentenkorpus, startet den Vektorserver im selben Prozess sowie lokale Testserver für
+#Ollama (/api/chat) und OpenAI (chat/completions) und misst Ingestion, /ask Latenzen und die gesamte RAG Anfragekette.
+#Aufruf aus dem Projektordner: python -m benchmark --help
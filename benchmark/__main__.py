@@ -0,0 +1,269 @@
+#Benchmark Ablauf: Korpus erzeugen -> Testserver und Vektorserver starten -> Ingestion -> /ask unter Last -> RAG Anfragekette.
+#Ergebnis ist ein JSON Bericht, der mit --compare gegen einen früheren Lauf verglichen werden kann.
+#Läuft ohne Internetverbindung und ohne GPU (Standard: EMBEDDING_MODEL=hash).
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmark.corpus import generate_corpus, generate_questions
+from benchmark.stubs import start_stub_server
+
+PROJECT_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(prog="python -m benchmark", description="Benchmark für Vektorserver und RAG Anfragekette")
+    #Korpus
+    parser.add_argument("--files", type=int, default=30, help="Anzahl Dokumente")
+    parser.add_argument("--formats", default="txt,pdf,docx", help="Dateiformate, abwechselnd verwendet")
+    parser.add_argument("--pages", type=int, default=5, help="Seiten bzw. Abschnitte je Dokument")
+    parser.add_argument("--words-per-page", type=int, default=400)
+    parser.add_argument("--seed", type=int, default=42)
+    #Vektorserver
+    parser.add_argument("--embedding", default="hash", help="EMBEDDING_MODEL des Servers (hash = ohne Modell, offline)")
+    parser.add_argument("--upload-concurrency", type=int, default=4)
+    #/ask
+    parser.add_argument("--queries", type=int, default=200, help="Anzahl /ask Anfragen")
+    parser.add_argument("--concurrency", type=int, default=8, help="Parallele /ask Anfragen")
+    parser.add_argument("--max-results", type=int, default=5)
+    parser.add_argument("--context-tokens", type=int, default=0, help="token_budget je Anfrage (0 = feste Anzahl max_results)")
+    #RAG Anfragekette mit Testservern
+    parser.add_argument("--pipeline-requests", type=int, default=20)
+    parser.add_argument("--pipeline-concurrency", type=int, default=1)
+    parser.add_argument("--llm-ttft", type=float, default=0.2, help="Sekunden bis zum ersten Token der Testserver")
+    parser.add_argument("--llm-token-delay", type=float, default=0.01, help="Sekunden je weiterem Token")
+    parser.add_argument("--llm-tokens", type=int, default=100, help="Tokens je Antwort")
+    #Ausgabe
+    parser.add_argument("--output", help="Pfad des JSON Berichts (Standard: benchmark_results/benchmark_<Zeit>.json)")
+    parser.add_argument("--compare", help="Früherer JSON Bericht zum Vergleich")
+    parser.add_argument("--workdir", help="Arbeitsordner für Korpus und Serverdaten (Standard: temporärer Ordner)")
+    return parser.parse_args()
+
+#Perzentil nach dem Nearest-Rank Verfahren, Werte in Millisekunden.
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+def latency_summary(seconds):
+    values = sorted(value * 1000 for value in seconds)
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean_ms": round(sum(values) / len(values), 2),
+        "p50_ms": round(percentile(values, 0.50), 2),
+        "p95_ms": round(percentile(values, 0.95), 2),
+        "p99_ms": round(percentile(values, 0.99), 2),
+        "max_ms": round(values[-1], 2),
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_FOLDER, capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+#Startet Testserver und Vektorserver und importiert die GUI Funktionen. Die Konfiguration erfolgt wie im Betrieb über
+#Umgebungsvariablen und muss deshalb vor dem Import der beiden Module gesetzt sein.
+def start_environment(args, workdir):
+    stub = start_stub_server(time_to_first_token=args.llm_ttft, token_delay=args.llm_token_delay, tokens=args.llm_tokens)
+    os.environ.update({
+        "EMBEDDING_MODEL": args.embedding,
+        "WARMUP_ON_START": "false",
+        "ANONYMIZED_TELEMETRY": "False", #Chroma ohne Telemetrie - keine Verbindung nach außen
+        "HF_HUB_OFFLINE": os.environ.get("HF_HUB_OFFLINE", "1"),
+        "LOCAL_IP": "127.0.0.1",
+        "PORT": str(stub.server_port),
+        "LLM_MODELS": "stub-lokal",
+        "OPENAI_KEY": "benchmark",
+        "OPENAI_MODELS": "stub-openai",
+        "OPENAI_API_URL": f"http://127.0.0.1:{stub.server_port}/v1/chat/completions",
+    })
+    #Der Vektorserver legt seine Daten relativ zum Arbeitsordner ab.
+    os.makedirs(os.path.join(workdir, "server"), exist_ok=True)
+    os.chdir(os.path.join(workdir, "server"))
+    sys.path.insert(0, PROJECT_FOLDER)
+
+    import Vektordatenbank_Server as vector_server
+    from waitress import create_server
+    start = time.time()
+    vector_server.warm_up()
+    warmup_seconds = time.time() - start
+    httpd = create_server(vector_server.server, host="127.0.0.1", port=0, threads=vector_server.SERVER_THREADS)
+    threading.Thread(target=httpd.run, name="Vektorserver", daemon=True).start()
+    os.environ["VECTORDB_URL"] = f"http://127.0.0.1:{httpd.effective_port}"
+
+    import LLM_Interface_v1 as gui
+    return vector_server, gui, warmup_seconds
+
+def run_ingestion(args, gui, documents):
+    paths = [document["path"] for document in documents]
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=args.upload_concurrency) as pool:
+        results = list(pool.map(gui.upload_file_to_rag_server, paths))
+    upload_seconds = time.time() - start
+    job_ids = {result["job_id"] for result in results if result.get("job_id")}
+    while True:
+        jobs = {job_id: job for job_id, job in gui.fetch_ingest_jobs().items() if job_id in job_ids}
+        if len(jobs) == len(job_ids) and all(job["state"] in ("done", "failed") for job in jobs.values()):
+            break
+        time.sleep(0.1)
+    wall_seconds = time.time() - start
+
+    finished = [job for job in jobs.values() if job["state"] == "done"]
+    chunks_new = sum(job["chunks_new"] for job in finished)
+    stage_seconds = {}
+    for job in finished:
+        for stage, duration in (job.get("timings") or {}).items():
+            stage_seconds[stage] = round(stage_seconds.get(stage, 0.0) + duration, 3)
+    total_bytes = sum(os.path.getsize(path) for path in paths)
+    return {
+        "files": len(paths),
+        "bytes": total_bytes,
+        "failed_uploads": sum(1 for result in results if "error" in result),
+        "failed_jobs": sum(1 for job in jobs.values() if job["state"] == "failed"),
+        "chunks": sum(job["chunks"] for job in finished),
+        "chunks_new": chunks_new,
+        "upload_seconds": round(upload_seconds, 3),
+        "wall_seconds": round(wall_seconds, 3),
+        "chunks_per_second": round(chunks_new / max(wall_seconds, 1e-6), 1),
+        "mb_per_second": round(total_bytes / 1e6 / max(wall_seconds, 1e-6), 2),
+        "document_seconds": latency_summary([job["finished"] - job["started"] for job in finished]),
+        "stage_seconds": stage_seconds,
+    }
+
+def run_ask_load(args, gui, questions):
+    def timed_request(question):
+        start = time.perf_counter()
+        result = gui.request_vector_context(question, max_results=args.max_results, token_budget=args.context_tokens or None)
+        return time.perf_counter() - start, "error" in result
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(timed_request, questions))
+    wall_seconds = time.time() - start
+    return dict(latency_summary([seconds for seconds, _ in results]),
+                errors=sum(1 for _, error in results if error),
+                concurrency=args.concurrency,
+                requests_per_second=round(len(results) / max(wall_seconds, 1e-6), 1))
+
+#Entspricht LLMApp.process_request_concurrent: Vektorsuche, dann beide Modelle parallel mit dem gefundenen Kontext.
+def run_pipeline(args, gui, questions):
+    history = [{"role": "system", "content": gui.System_Role}]
+    model_executor = ThreadPoolExecutor(max_workers=2 * args.pipeline_concurrency)
+
+    def pipeline_request(question):
+        start = time.perf_counter()
+        vectordb_result = gui.request_vector_context(question, max_results=args.max_results, token_budget=args.context_tokens or None)
+        vector_seconds = time.perf_counter() - start
+        context = gui.prepare_context(vectordb_result.get("documents") or [])
+        local_future = model_executor.submit(gui.ask_llm_server, history, question, "stub-lokal", context)
+        openai_future = model_executor.submit(gui.ask_openai_server, history, vectordb_result, question, "stub-openai")
+        local_result, openai_result = local_future.result(), openai_future.result()
+        return {"vector_seconds": vector_seconds, "end_to_end_seconds": time.perf_counter() - start,
+                "lokal": local_result, "openai": openai_result}
+
+    with ThreadPoolExecutor(max_workers=args.pipeline_concurrency) as pool:
+        results = list(pool.map(pipeline_request, questions))
+    model_executor.shutdown()
+
+    report = {
+        "requests": len(results),
+        "vector_lookup": latency_summary([result["vector_seconds"] for result in results]),
+        "end_to_end": latency_summary([result["end_to_end_seconds"] for result in results]),
+    }
+    for provider in ("lokal", "openai"):
+        metrics = [result[provider].get("metrics") for result in results if result[provider].get("metrics")]
+        report[provider] = {
+            "errors": sum(1 for result in results if "error" in result[provider]),
+            "time_to_first_token": latency_summary([m["time_to_first_token"] for m in metrics if m["time_to_first_token"] is not None]),
+            "total": latency_summary([m["total_seconds"] for m in metrics]),
+        }
+    return report
+
+#Zeigt die wichtigsten Kennzahlen beider Läufe mit relativer Änderung.
+COMPARED_VALUES = [
+    ("ingestion", "chunks_per_second"),
+    ("ingestion", "wall_seconds"),
+    ("ask", "p50_ms"), ("ask", "p95_ms"), ("ask", "p99_ms"), ("ask", "requests_per_second"),
+    ("ask_cached", "p50_ms"), ("ask_cached", "p99_ms"),
+    ("pipeline", "end_to_end", "p50_ms"), ("pipeline", "end_to_end", "p95_ms"), ("pipeline", "end_to_end", "p99_ms"),
+]
+
+def lookup(report, path):
+    for key in path:
+        if not isinstance(report, dict) or key not in report:
+            return None
+        report = report[key]
+    return report
+
+def print_comparison(previous, current):
+    print("\nVergleich mit", previous["meta"].get("timestamp"), previous["meta"].get("git_commit") or "")
+    for path in COMPARED_VALUES:
+        old, new = lookup(previous, path), lookup(current, path)
+        if old is None or new is None:
+            continue
+        change = f"{(new - old) / old * 100:+.1f}%" if old else "-"
+        print(f"  {'.'.join(path):35} {old:>12} -> {new:>12}  {change}")
+
+def main():
+    args = parse_arguments()
+    output_path = os.path.abspath(args.output or os.path.join("benchmark_results", f"benchmark_{datetime.datetime.now():%Y%m%d_%H%M%S}.json"))
+    compare_path = os.path.abspath(args.compare) if args.compare else None
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="rag_benchmark_"))
+
+    print(f"Korpus: {args.files} Dateien ({args.formats}) in {workdir}")
+    documents = generate_corpus(os.path.join(workdir, "corpus"), args.files, args.formats.split(","),
+                                args.pages, args.words_per_page, args.seed)
+    questions = generate_questions(documents, args.queries, args.seed)
+
+    vector_server, gui, warmup_seconds = start_environment(args, workdir)
+    print(f"Vektorserver bereit ({warmup_seconds:.1f} s), Ingestion läuft ...")
+    report = {
+        "meta": {
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "arguments": vars(args),
+            "warmup_seconds": round(warmup_seconds, 3),
+        },
+    }
+    report["ingestion"] = run_ingestion(args, gui, documents)
+    print(f"Ingestion: {report['ingestion']['chunks_new']} Chunks in {report['ingestion']['wall_seconds']} s "
+          f"({report['ingestion']['chunks_per_second']} Chunks/s)")
+
+    #Erster Durchlauf mit leerem Ergebniscache, zweiter Durchlauf mit denselben Fragen aus dem Cache.
+    report["ask"] = run_ask_load(args, gui, questions)
+    report["ask_cached"] = run_ask_load(args, gui, questions)
+    print(f"/ask: p50 {report['ask']['p50_ms']} ms, p95 {report['ask']['p95_ms']} ms, p99 {report['ask']['p99_ms']} ms "
+          f"({report['ask']['requests_per_second']} Anfragen/s, Cache p50 {report['ask_cached']['p50_ms']} ms)")
+
+    #Neue Fragen für die Anfragekette, damit die Vektorsuche nicht aus dem Cache beantwortet wird.
+    pipeline_questions = generate_questions(documents, args.pipeline_requests, args.seed + 1000)
+    report["pipeline"] = run_pipeline(args, gui, pipeline_questions)
+    print(f"RAG Anfragekette: p50 {report['pipeline']['end_to_end']['p50_ms']} ms, p95 {report['pipeline']['end_to_end']['p95_ms']} ms")
+
+    report["server_stats"] = vector_server.server.test_client().get("/stats").get_json()
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"Bericht gespeichert: {output_path}")
+
+    if compare_path:
+        with open(compare_path, "r", encoding="utf-8") as f:
+            print_comparison(json.load(f), report)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#Synthetische Dokumente (TXT, PDF, DOCX) für den Benchmark.
+#PDF und DOCX werden ohne zusätzliche Bibliotheken direkt geschrieben. Gleicher seed = gleicher Korpus.
+
+import os
+import random
+import zipfile
+
+#Nur ASCII, damit die PDF Dateien ohne eingebettete Schriftarten auskommen.
+VOCABULARY = ("analyse anlage antrag bericht betrieb daten dokument energie entwicklung ergebnis forschung freigabe "
+              "gebaeude geraet haushalt hochschule information kosten labor leistung messung modell netz nutzung "
+              "planung projekt pruefung qualitaet rechnung regel sicherheit software speicher standort system "
+              "technik termin umwelt vertrag verwaltung wartung zeitraum ziel zugang zulassung ablauf aufgabe "
+              "auswertung bedarf beschaffung datenbank einsatz erfassung fahrzeug konzept lehre material methode "
+              "personal plattform prozess server steuerung struktur studie version werkzeug").split()
+
+#Erzeugt einen Text aus zufälligen Sätzen. Jedes Dokument bekommt eigene Themenwörter, damit Anfragen unterschiedliche Treffer haben.
+def generate_words(rng, word_count, topic_words):
+    words = []
+    while len(words) < word_count:
+        sentence = [rng.choice(VOCABULARY) for _ in range(rng.randint(6, 14))]
+        sentence.insert(rng.randrange(len(sentence)), rng.choice(topic_words))
+        sentence[0] = sentence[0].capitalize()
+        sentence[-1] += "."
+        words.extend(sentence)
+    return words[:word_count]
+
+def generate_pages(rng, pages, words_per_page, topic_words):
+    return [" ".join(generate_words(rng, words_per_page, topic_words)) for _ in range(pages)]
+
+def write_txt(path, pages):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n\n".join(pages))
+
+def pdf_escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+#Minimales PDF: eine Seite je Eintrag in pages, Text zeilenweise mit der Standardschrift Helvetica.
+def write_pdf(path, pages, words_per_line=12):
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for page_text in pages:
+        words = page_text.split()
+        lines = [" ".join(words[i:i + words_per_line]) for i in range(0, len(words), words_per_line)]
+        stream = "BT /F1 10 Tf 12 TL 50 800 Td " + " ".join(f"({pdf_escape(line)}) Tj T*" for line in lines) + " ET"
+        stream = stream.encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objects))
+        page_ids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % page_id for page_id in page_ids) + b"] /Count %d >>" % len(page_ids)
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, content in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n" % number + content + b"\nendobj\n"
+    xref_offset = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        output += b"%010d 00000 n \n" % offset
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset)
+    with open(path, "wb") as f:
+        f.write(output)
+
+DOCX_CONTENT_TYPES = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                      '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                      '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+                      '<Default Extension="xml" ContentType="application/xml"/>'
+                      '<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+                      '</Types>')
+DOCX_RELATIONSHIPS = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                      '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                      '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>'
+                      '</Relationships>')
+
+#Minimales DOCX: ein Absatz je Seite.
+def write_docx(path, pages):
+    paragraphs = "".join(f"<w:p><w:r><w:t>{page_text}</w:t></w:r></w:p>" for page_text in pages)
+    document = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+                f"<w:body>{paragraphs}</w:body></w:document>")
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml", DOCX_CONTENT_TYPES)
+        archive.writestr("_rels/.rels", DOCX_RELATIONSHIPS)
+        archive.writestr("word/document.xml", document)
+
+WRITERS = {"txt": write_txt, "pdf": write_pdf, "docx": write_docx}
+
+#Erzeugt files Dokumente abwechselnd in den angegebenen Formaten. Rückgabe: Liste der Dateipfade und Themenwörter je Dokument.
+def generate_corpus(folder, files, formats=("txt", "pdf", "docx"), pages=5, words_per_page=400, seed=42):
+    rng = random.Random(seed)
+    os.makedirs(folder, exist_ok=True)
+    documents = []
+    for i in range(files):
+        file_format = formats[i % len(formats)]
+        topic_words = [f"thema{i}x{j}" for j in range(3)]
+        path = os.path.join(folder, f"dokument_{i:05d}.{file_format}")
+        WRITERS[file_format](path, generate_pages(rng, pages, words_per_page, topic_words))
+        documents.append({"path": path, "topic_words": topic_words})
+    return documents
+
+#Anfragen aus Themenwörtern eines zufälligen Dokuments und allgemeinen Wörtern.
+def generate_questions(documents, count, seed=42):
+    rng = random.Random(seed + 1)
+    questions = []
+    for _ in range(count):
+        document = rng.choice(documents)
+        words = [rng.choice(document["topic_words"])] + [rng.choice(VOCABULARY) for _ in range(rng.randint(4, 8))]
+        rng.shuffle(words)
+        questions.append("Was steht zu " + " ".join(words) + "?")
+    return questions
@@ -0,0 +1,103 @@
+#Lokale Testserver, die das Streaming Protokoll von Ollama (/api/chat, NDJSON) und OpenAI (chat/completions, Server-Sent-Events)
+#nachbilden. Antwortzeit bis zum ersten Token, Zeit je Token und Anzahl Tokens sind einstellbar.
+#Einzeln startbar, z.B. als Ersatz für den LLM Server beim Testen der GUI: python -m benchmark.stubs --port 11434
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class StubLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" #Für chunked Transfer-Encoding wie bei den echten Servern
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", "0"))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if self.path.startswith("/api/chat"):
+            self.answer_ollama(body)
+        elif self.path.endswith("/chat/completions"):
+            self.answer_openai(body)
+        else:
+            self.send_error(404)
+
+    def log_message(self, format, *args):
+        pass #Keine Ausgabe je Anfrage
+
+    def generate_tokens(self):
+        settings = self.server.settings
+        time.sleep(settings["time_to_first_token"])
+        for i in range(settings["tokens"]):
+            if i:
+                time.sleep(settings["token_delay"])
+            yield f"wort{i} "
+
+    def start_stream(self, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def write_chunk(self, data):
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def end_stream(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def answer_ollama(self, body):
+        prompt_tokens = sum(len(str(message.get("content", "")).split()) for message in body.get("messages", []))
+        start = time.time()
+        self.start_stream("application/x-ndjson")
+        first_token = None
+        count = 0
+        for token in self.generate_tokens():
+            first_token = first_token or time.time()
+            count += 1
+            self.write_chunk(json.dumps({"model": body.get("model"), "message": {"role": "assistant", "content": token}, "done": False}).encode("utf-8") + b"\n")
+        #Abschließender Teil mit Tokenanzahl und Dauer in Nanosekunden wie bei Ollama.
+        self.write_chunk(json.dumps({
+            "model": body.get("model"), "message": {"role": "assistant", "content": ""}, "done": True,
+            "prompt_eval_count": prompt_tokens, "eval_count": count,
+            "eval_duration": int((time.time() - (first_token or start)) * 1e9), "total_duration": int((time.time() - start) * 1e9),
+        }).encode("utf-8") + b"\n")
+        self.end_stream()
+
+    def answer_openai(self, body):
+        prompt_tokens = sum(len(str(message.get("content", "")).split()) for message in body.get("messages", []))
+        self.start_stream("text/event-stream")
+        count = 0
+        for token in self.generate_tokens():
+            count += 1
+            event = {"object": "chat.completion.chunk", "model": body.get("model"), "choices": [{"index": 0, "delta": {"content": token}}]}
+            self.write_chunk(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+        if (body.get("stream_options") or {}).get("include_usage"):
+            usage = {"prompt_tokens": prompt_tokens, "completion_tokens": count, "total_tokens": prompt_tokens + count}
+            self.write_chunk(f"data: {json.dumps({'object': 'chat.completion.chunk', 'choices': [], 'usage': usage})}\n\n".encode("utf-8"))
+        self.write_chunk(b"data: [DONE]\n\n")
+        self.end_stream()
+
+#Startet einen Testserver im Hintergrund. port=0 wählt einen freien Port, siehe server.server_port.
+def start_stub_server(host="127.0.0.1", port=0, time_to_first_token=0.2, token_delay=0.01, tokens=100):
+    server = ThreadingHTTPServer((host, port), StubLLMHandler)
+    server.daemon_threads = True
+    server.settings = {"time_to_first_token": time_to_first_token, "token_delay": token_delay, "tokens": tokens}
+    threading.Thread(target=server.serve_forever, name="Stub-LLM", daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ollama/OpenAI kompatibler Testserver")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--ttft", type=float, default=0.2, help="Sekunden bis zum ersten Token")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="Sekunden je weiterem Token")
+    parser.add_argument("--tokens", type=int, default=100, help="Tokens je Antwort")
+    args = parser.parse_args()
+    stub = start_stub_server(args.host, args.port, args.ttft, args.token_delay, args.tokens)
+    print(f"Testserver läuft unter http://{args.host}:{stub.server_port} (Ollama: /api/chat, OpenAI: /v1/chat/completions)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stub.shutdown()